@@ -0,0 +1,113 @@
+"""
+Cache of the dashboards' computed context (not the rendered HTML), keyed by
+the normalized filter set and the data version of the stores involved.
+Writes to orders, order items and the stock ledger bump those versions
+(core.data_versions), so a cached context is reused until the data it was
+computed from changes.
+
+Entries live in the "dashboards" cache alias: local memory per process by
+default, or files shared by every worker on the host with
+DASHBOARD_CACHE_DIR. The versions are database rows, so a write served by
+any worker invalidates entries in either backend. Each process keeps an
+LRU index of the keys it used and deletes the least recently used ones
+past DASHBOARD_CACHE_MAX_ENTRIES.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.data_versions import data_versions
+
+CACHE_ALIAS = 'dashboards'
+TIMEOUT = 24 * 3600
+
+
+def normalize_filters(filters):
+    """Stable, JSON-able form of a filter dict: dates as ISO, lists sorted, blanks as None."""
+    normalized = {}
+    for name, value in sorted(filters.items()):
+        if isinstance(value, (list, tuple)):
+            value = sorted(str(v) for v in value) or None
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif value in ('', None):
+            value = None
+        else:
+            value = str(value)
+        normalized[name] = value
+    return normalized
+
+
+class DashboardContextCache:
+    def __init__(self, alias=CACHE_ALIAS, max_entries=None):
+        self.alias = alias
+        self.max_entries = max_entries or getattr(settings, 'DASHBOARD_CACHE_MAX_ENTRIES', 256)
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()  # key -> None, least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def make_key(self, view, filters, stores):
+        current = data_versions(set(stores))  # one query for every store involved
+        versions = [(str(store or ''), current[store]) for store in sorted(set(stores), key=str)]
+        raw = json.dumps([view, normalize_filters(filters), versions])
+        return f"dashboard:{view}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+    def get_or_compute(self, view, filters, stores, compute):
+        """
+        Return a copy of the cached context for this view/filter set, or call
+        `compute()` and cache it. `stores` lists the store ids whose data the
+        context depends on (None means all stores).
+        """
+        key = self.make_key(view, filters, stores)  # versions are read before computing
+        context = self.backend.get(key)
+        if context is not None:
+            self._touch(key, hit=True)
+            return dict(context)
+
+        context = compute()
+        self.backend.set(key, context, TIMEOUT)
+        self._touch(key, hit=False)
+        return dict(context)
+
+    def _touch(self, key, hit):
+        """Mark `key` most recently used and evict past max_entries."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._lru[key] = None
+            self._lru.move_to_end(key)
+            evicted = []
+            while len(self._lru) > self.max_entries:
+                evicted.append(self._lru.popitem(last=False)[0])
+        if evicted:
+            self.backend.delete_many(evicted)
+
+    def clear(self):
+        with self._lock:
+            keys, self._lru = list(self._lru), OrderedDict()
+        self.backend.delete_many(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._lru),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+dashboard_cache = DashboardContextCache()
@@ -0,0 +1,229 @@
+"""
+Optional in-memory sales cube: every order line as NumPy columns, so the
+dashboard aggregates are vectorized masks and bincounts instead of queries.
+
+Enabled with ANALYTICS_ENGINE = "cube" and needs numpy installed; without
+it the dashboard keeps reading the SQL rollup. The cube refreshes from a
+high-water mark on Order.id and drops cancelled orders using the
+OrderChange log, so a dashboard view costs a couple of small indexed queries.
+"""
+import threading
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import IntegerField, Max
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from inventory.models import SmoothieMenu
+from sales.models import OrderChange, OrderItem, PaymentMethod
+from .time_divisions import TIME_DIVISIONS
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional
+    np = None
+
+# Asia/Jakarta has been UTC+7 without DST since 1964
+JAKARTA_OFFSET_SECONDS = 7 * 3600
+EPOCH = date(1970, 1, 1)
+
+# Change-log rows younger than this are re-read on the next refresh, so an
+# order that took a lower id but committed late is still picked up.
+SETTLE_SECONDS = 5
+
+COLUMNS = {
+    'order': 'int64',
+    'day': 'int32',       # Jakarta days since 1970-01-01
+    'hour': 'int8',       # Jakarta hour
+    'store': 'int64',     # -1 when the order has no store
+    'smoothie': 'int64',
+    'payment': 'int64',   # -1 when the payment method is gone
+    'quantity': 'float64',  # float so bincount can use it as weights without a copy
+    'revenue': 'float64',
+}
+
+
+AGGREGATED = ('day', 'hour', 'smoothie', 'payment', 'quantity', 'revenue')
+
+
+def cube_enabled():
+    return np is not None and getattr(settings, 'ANALYTICS_ENGINE', 'rollup') == 'cube'
+
+
+def _group_sum(keys, quantity, *values):
+    """
+    (keys present, quantity sums, sums of each of `values`) per key. Every
+    line has a positive quantity, so its sum also tells which keys occur.
+    Dense integer keys (days, ids) use one offset bincount per column;
+    sparse ones go through np.unique first.
+    """
+    if not len(keys):
+        return keys, *[np.zeros(0, 'int64') for _ in range(1 + len(values))]
+    low, high = int(keys.min()), int(keys.max())
+    if high - low <= 4 * len(keys) + 1024:
+        index, size = keys - low, high - low + 1
+    else:
+        unique_keys, index = np.unique(keys, return_inverse=True)
+        low, size = None, len(unique_keys)
+    quantity_sums = np.bincount(index, weights=quantity, minlength=size)
+    present = np.flatnonzero(quantity_sums)
+    unique = present + low if low is not None else unique_keys[present]
+    sums = [quantity_sums] + [np.bincount(index, weights=v, minlength=size) for v in values]
+    return unique, *[column[present].astype('int64') for column in sums]
+
+
+class SalesCube:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.columns = {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        self.order_hwm = 0         # highest Order.id loaded
+        self.change_cursor = None  # OrderChange id up to which changes are settled
+
+    def __len__(self):
+        return len(self.columns['order'])
+
+    def refresh(self):
+        """
+        Load orders above the high-water mark, drop cancelled ones and pick up
+        orders that committed late under a lower id (seen in the change log).
+        """
+        with self._lock:
+            settled_before = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+            if self.change_cursor is None:
+                self.change_cursor = (
+                    OrderChange.objects.filter(created_at__lte=settled_before).aggregate(m=Max('id'))['m'] or 0
+                )
+                self._append(self._fetch(order_id__gt=0))
+                return
+
+            changes = list(
+                OrderChange.objects.filter(id__gt=self.change_cursor)
+                .order_by('id').values_list('id', 'order_id', 'kind', 'created_at')
+            )
+            deleted = [order_id for _, order_id, kind, _ in changes if kind == 'deleted']
+            if deleted:
+                keep = ~np.isin(self.columns['order'], deleted)
+                self.columns = {name: column[keep] for name, column in self.columns.items()}
+
+            saved = {order_id for _, order_id, kind, _ in changes if kind == 'saved' and order_id <= self.order_hwm}
+            late = [int(i) for i in np.setdiff1d(np.fromiter(saved, 'int64', len(saved)), self.columns['order'])]
+            rows = self._fetch(order_id__gt=self.order_hwm)
+            if late:
+                rows += self._fetch(order_id__in=late)
+            self._append(rows)
+
+            for change_id, _, _, created_at in changes:
+                if created_at > settled_before:
+                    break
+                self.change_cursor = change_id
+
+    @staticmethod
+    def _fetch(**lookup):
+        return list(
+            OrderItem.objects
+            .filter(**lookup)
+            .order_by('order_id')
+            .values_list(
+                'order_id', 'order__created_at', 'order__store_id', 'smoothie_id',
+                'order__payment_method_id', 'quantity',
+                Coalesce('unit_price', Cast('smoothie__price', IntegerField())),
+            )
+        )
+
+    def _append(self, rows):
+        if not rows:
+            return
+        order_ids, created, stores, smoothies, payments, quantities, prices = zip(*rows)
+        local_seconds = np.array([dt.timestamp() for dt in created], dtype='int64') + JAKARTA_OFFSET_SECONDS
+        quantity = np.array(quantities, dtype='float64')
+        new = {
+            'order': np.array(order_ids, dtype='int64'),
+            'day': (local_seconds // 86400).astype('int32'),
+            'hour': ((local_seconds % 86400) // 3600).astype('int8'),
+            'store': np.array([-1 if s is None else s for s in stores], dtype='int64'),
+            'smoothie': np.array(smoothies, dtype='int64'),
+            'payment': np.array([-1 if p is None else p for p in payments], dtype='int64'),
+            'quantity': quantity,
+            'revenue': quantity * np.array(prices, dtype='float64'),
+        }
+        self.columns = {name: np.concatenate([self.columns[name], new[name]]) for name in COLUMNS}
+        self.order_hwm = max(self.order_hwm, int(new['order'].max()))
+
+    @staticmethod
+    def mask(columns, store_id=None, start_date=None, end_date=None, menu_ids=None, time_division=None):
+        c = columns
+        keep = np.ones(len(c['order']), dtype=bool)
+        if store_id:
+            keep &= c['store'] == int(store_id)
+        if start_date:
+            keep &= c['day'] >= (start_date - EPOCH).days
+        if end_date:
+            keep &= c['day'] <= (end_date - EPOCH).days
+        if menu_ids:
+            wanted = np.zeros(max(int(c['smoothie'].max(initial=0)), *map(int, menu_ids)) + 1, dtype=bool)
+            wanted[[int(m) for m in menu_ids]] = True
+            keep &= wanted[c['smoothie']]
+        if time_division in TIME_DIVISIONS:
+            _, first, end = TIME_DIVISIONS[time_division]
+            keep &= (c['hour'] >= first) & (c['hour'] < end)
+        return keep
+
+    def dashboard(self, **filters):
+        """
+        Aggregates for analytics_dashboard: {'daily': [(date, revenue, cups)],
+        'menu': [(smoothie_id, cups)], 'payment': [(payment_id or None, revenue)],
+        'division_cups': [cups per TIME_DIVISIONS entry]}.
+        """
+        columns = self.columns  # refresh swaps the dict, so this is a stable snapshot
+        quantity, revenue = columns['quantity'], columns['revenue']
+        if any(filters.values()):
+            keep = self.mask(columns, **filters)
+            if np.count_nonzero(keep) < len(keep) // 4:
+                # narrow slice: copying the few matching rows is cheapest
+                columns = {name: columns[name][keep] for name in AGGREGATED}
+                quantity, revenue = columns['quantity'], columns['revenue']
+            else:
+                # wide slice: zero the weights of filtered-out rows instead
+                quantity, revenue = quantity * keep, revenue * keep
+
+        days, day_cups, day_revenue = _group_sum(columns['day'], quantity, revenue)
+        menus, menu_cups = _group_sum(columns['smoothie'], quantity)
+        payments, _, payment_revenue = _group_sum(columns['payment'], quantity, revenue)
+        hour_cups = np.bincount(columns['hour'], weights=quantity, minlength=24)
+
+        return {
+            'daily': [
+                (EPOCH + timedelta(days=int(d)), int(r), int(q))
+                for d, r, q in zip(days, day_revenue, day_cups)
+            ],
+            'menu': sorted(
+                ((int(m), int(q)) for m, q in zip(menus, menu_cups)), key=lambda row: -row[1]
+            ),
+            'payment': [(None if p < 0 else int(p), int(r)) for p, r in zip(payments, payment_revenue)],
+            'division_cups': [int(hour_cups[first:end].sum()) for _, first, end in TIME_DIVISIONS.values()],
+        }
+
+
+sales_cube = SalesCube() if np is not None else None
+
+
+def cube_dashboard(parts=None, **filters):
+    """dashboard_aggregates() computed on the refreshed cube, with names filled in."""
+    sales_cube.refresh()
+    aggregates = sales_cube.dashboard(**filters)
+    if parts:
+        aggregates = {part: aggregates[part] for part in parts}
+    if 'menu' in aggregates:
+        menu_names = dict(SmoothieMenu.objects.values_list('id', 'name'))
+        aggregates['menu'] = sorted(
+            ((menu_names.get(smoothie_id), cups) for smoothie_id, cups in aggregates['menu']),
+            key=lambda row: (-row[1], row[0] or ''),
+        )
+    if 'payment' in aggregates:
+        payment_names = dict(PaymentMethod.objects.values_list('id', 'name'))
+        aggregates['payment'] = sorted(
+            ((payment_names.get(payment_id), revenue) for payment_id, revenue in aggregates['payment']),
+            key=lambda row: (row[0] is None, row[0] or ''),
+        )
+    return aggregates
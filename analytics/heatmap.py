@@ -0,0 +1,176 @@
+"""
+Weekday × hour demand heatmap: one DemandHeatmap row of 7×24 cells per
+store and Jakarta week, so a range of weeks is answered by summing that
+many small matrices instead of scanning orders.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, IntegerField, Q, Sum
+from django.db.models.functions import Cast, Coalesce, ExtractHour, TruncDate
+
+from core.utils import JAKARTA
+from sales.models import OrderItem
+from .models import DemandHeatmap, empty_week
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+MATRICES = ('cups', 'revenue')
+
+
+def week_of(day):
+    """Monday of the week holding `day`."""
+    return day - timedelta(days=day.weekday())
+
+
+def _cell(day, hour):
+    return day.weekday() * 24 + hour
+
+
+def bucket_lines(lines):
+    """Group OrderLines into {(store_id, week_start): {'cups': {cell: n}, 'revenue': {cell: n}}}."""
+    weeks = defaultdict(lambda: {name: defaultdict(int) for name in MATRICES})
+    for line in lines:
+        local = line.created_at.astimezone(JAKARTA)
+        cells = weeks[(line.store_id, week_of(local.date()))]
+        cells['cups'][_cell(local.date(), local.hour)] += line.quantity
+        cells['revenue'][_cell(local.date(), local.hour)] += line.revenue
+    return weeks
+
+
+def _rows_for(keys, lock=False):
+    """Existing heatmap rows for (store_id, week_start) keys; a NULL store needs its own lookup."""
+    stores = {store_id for store_id, _ in keys}
+    store_filter = Q(store_id__in=[s for s in stores if s is not None])
+    if None in stores:
+        store_filter |= Q(store__isnull=True)
+    rows = DemandHeatmap.objects.filter(store_filter, week_start__in={week for _, week in keys})
+    if lock:
+        rows = rows.select_for_update()
+    return {(row.store_id, row.week_start): row for row in rows if (row.store_id, row.week_start) in keys}
+
+
+def apply_lines(lines, sign):
+    """
+    Add (sign=1) or remove (sign=-1) order lines: the touched week rows are
+    locked and read in one query, changed cells written back in one bulk
+    UPDATE, and weeks seen for the first time inserted.
+    """
+    weeks = bucket_lines(lines)
+    if not weeks:
+        return
+
+    with transaction.atomic():
+        existing = _rows_for(weeks, lock=True)
+        for key, row in existing.items():
+            for name in MATRICES:
+                matrix = getattr(row, name)
+                for cell, value in weeks[key][name].items():
+                    matrix[cell] += sign * value
+        if existing:
+            DemandHeatmap.objects.bulk_update(existing.values(), list(MATRICES))
+
+        missing = [key for key in weeks if key not in existing]
+        if missing and sign > 0:
+            try:
+                with transaction.atomic():
+                    DemandHeatmap.objects.bulk_create([
+                        DemandHeatmap(store_id=store_id, week_start=week, **_matrices(weeks[(store_id, week)]))
+                        for store_id, week in missing
+                    ])
+            except IntegrityError:
+                # another order created one of these weeks first; add to it instead
+                missing = set(missing)
+                apply_lines([line for line in lines if _key_of(line) in missing], sign)
+
+
+def _key_of(line):
+    return (line.store_id, week_of(line.created_at.astimezone(JAKARTA).date()))
+
+
+def _matrices(cells):
+    matrices = {name: empty_week() for name in MATRICES}
+    for name in MATRICES:
+        for cell, value in cells[name].items():
+            matrices[name][cell] += value
+    return matrices
+
+
+def aggregate_from_orders():
+    """{(store_id, week_start): {'cups': {cell: n}, 'revenue': {cell: n}}} computed from the orders."""
+    rows = (
+        OrderItem.objects
+        .annotate(
+            local_date=TruncDate('order__created_at', tzinfo=JAKARTA),
+            local_hour=ExtractHour('order__created_at', tzinfo=JAKARTA),
+        )
+        .values_list('order__store_id', 'local_date', 'local_hour')
+        .annotate(
+            cups=Sum('quantity'),
+            revenue=Sum(F('quantity') * Coalesce('unit_price', Cast('smoothie__price', IntegerField()))),
+        )
+        .order_by()
+    )
+    weeks = defaultdict(lambda: {name: defaultdict(int) for name in MATRICES})
+    for store_id, day, hour, cups, revenue in rows.iterator():
+        cells = weeks[(store_id, week_of(day))]
+        cells['cups'][_cell(day, hour)] += cups
+        cells['revenue'][_cell(day, hour)] += revenue
+    return weeks
+
+
+def find_drift():
+    """Return [(store_id, week_start)] whose stored matrices differ from the orders."""
+    expected = {key: _matrices(cells) for key, cells in aggregate_from_orders().items()}
+    stored = defaultdict(lambda: {name: empty_week() for name in MATRICES})
+    for store_id, week, *matrices in DemandHeatmap.objects.values_list('store_id', 'week_start', *MATRICES).iterator():
+        for name, matrix in zip(MATRICES, matrices):
+            total = stored[(store_id, week)][name]
+            stored[(store_id, week)][name] = [a + b for a, b in zip(total, matrix)]
+    empty = {name: empty_week() for name in MATRICES}
+    return sorted(
+        (key for key in set(expected) | set(stored) if stored.get(key, empty) != expected.get(key, empty)),
+        key=lambda key: (str(key[0]), key[1]),
+    )
+
+
+def rebuild(batch_size=500):
+    """Replace every heatmap row with a fresh aggregate; returns the row count."""
+    weeks = aggregate_from_orders()
+    with transaction.atomic():
+        DemandHeatmap.objects.all().delete()
+        DemandHeatmap.objects.bulk_create(
+            [DemandHeatmap(store_id=store_id, week_start=week, **_matrices(cells))
+             for (store_id, week), cells in weeks.items()],
+            batch_size=batch_size,
+        )
+    return len(weeks)
+
+
+def demand_heatmap(store_id=None, start_date=None, end_date=None):
+    """
+    Cups and revenue summed over the weeks touching [start_date, end_date]
+    (whole weeks; open ends allowed) for one store or all:
+    {'weeks', 'weekdays', 'hours', 'cups': 7×24 rows, 'revenue': 7×24 rows}.
+    """
+    rows = DemandHeatmap.objects.all()
+    if store_id:
+        rows = rows.filter(store_id=store_id)
+    if start_date:
+        rows = rows.filter(week_start__gte=week_of(start_date))
+    if end_date:
+        rows = rows.filter(week_start__lte=week_of(end_date))
+
+    totals = {name: empty_week() for name in MATRICES}
+    weeks = set()
+    for week, *matrices in rows.values_list('week_start', *MATRICES).iterator():
+        weeks.add(week)
+        for name, matrix in zip(MATRICES, matrices):
+            totals[name] = [a + b for a, b in zip(totals[name], matrix)]
+
+    return {
+        'weeks': len(weeks),
+        'weekdays': WEEKDAYS,
+        'hours': list(range(24)),
+        **{name: [totals[name][day * 24:(day + 1) * 24] for day in range(7)] for name in MATRICES},
+    }
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.heatmap import find_drift, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the weekday × hour demand heatmap from orders, or check it for drift with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only compare the heatmap with the orders; exit non-zero if they differ.",
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = find_drift()
+            for store, week in drift[:50]:
+                self.stdout.write(f"store={store} week={week}: heatmap differs from the orders")
+            if drift:
+                raise CommandError(f"{len(drift)} heatmap weeks drifted; run rebuild_demand_heatmap to fix.")
+            self.stdout.write(self.style.SUCCESS("Demand heatmap matches the orders."))
+            return
+
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt demand heatmap: {count} store weeks."))
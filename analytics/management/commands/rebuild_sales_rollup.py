@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.rollup import find_drift, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the analytics sales rollup from orders, or check it for drift with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only compare the rollup with the orders; exit non-zero if they differ.",
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = find_drift()
+            for key, have, want in sorted(drift, key=lambda row: str(row[0]))[:50]:
+                store, day, hour, smoothie, payment = key
+                self.stdout.write(
+                    f"store={store} date={day} hour={hour} smoothie={smoothie} payment={payment}: "
+                    f"rollup (orders, cups, revenue)={have} expected={want}"
+                )
+            if drift:
+                raise CommandError(f"{len(drift)} rollup rows drifted; run rebuild_sales_rollup to fix.")
+            self.stdout.write(self.style.SUCCESS("Sales rollup matches the orders."))
+            return
+
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sales rollup: {count} rows."))
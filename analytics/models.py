@@ -1,3 +1,61 @@
 from django.db import models
 
-# Create your models here.
+from core.models import Store
+from inventory.models import SmoothieMenu
+from sales.models import PaymentMethod
+
+
+class SalesRollup(models.Model):
+    """
+    Sales per (store, Jakarta date, Jakarta hour, smoothie, payment method).
+    Kept up to date by the order write paths (analytics.rollup) and rebuilt
+    with `manage.py rebuild_sales_rollup`.
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, null=True, blank=True, related_name='sales_rollups')
+    local_date = models.DateField()
+    local_hour = models.PositiveSmallIntegerField()
+    smoothie = models.ForeignKey(SmoothieMenu, on_delete=models.CASCADE, related_name='sales_rollups')
+    payment_method = models.ForeignKey(PaymentMethod, on_delete=models.SET_NULL, null=True, blank=True)
+
+    order_count = models.IntegerField(default=0)  # orders containing this smoothie
+    cups = models.IntegerField(default=0)
+    revenue = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['store', 'local_date', 'local_hour', 'smoothie', 'payment_method'],
+                name='unique_sales_rollup_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['local_date', 'store']),
+        ]
+
+    def __str__(self):
+        return f"{self.local_date} {self.local_hour:02d}h {self.smoothie_id}: {self.cups} cups"
+
+
+def empty_week():
+    return [0] * (7 * 24)
+
+
+class DemandHeatmap(models.Model):
+    """
+    Cups and revenue of one store for one Jakarta week (Monday start), as
+    7×24 cells indexed weekday * 24 + hour (Monday = 0). Kept up to date by
+    the order write paths (analytics.heatmap) and rebuilt with
+    `manage.py rebuild_demand_heatmap`.
+    """
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, null=True, blank=True, related_name='demand_heatmaps')
+    week_start = models.DateField()
+    cups = models.JSONField(default=empty_week)
+    revenue = models.JSONField(default=empty_week)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'week_start'], name='unique_demand_heatmap_week'),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} week of {self.week_start}"
@@ -0,0 +1,130 @@
+"""
+Dashboard panels: each chart, table or card set is computed and cached on
+its own, so pages can render an empty shell and fetch panels in parallel.
+
+A panel is a function of its own filters returning a JSON-ready dict. The
+sales panels read the rollup (or the cube) through dashboard_aggregates,
+querying only the aggregates they show.
+"""
+from datetime import datetime, time
+
+from inventory.snapshot import stock_snapshot
+from core.utils import JAKARTA
+from .context_cache import dashboard_cache
+from .cube import cube_dashboard, cube_enabled
+from .heatmap import demand_heatmap
+from .rollup import dashboard_aggregates
+from .time_divisions import TIME_DIVISIONS
+
+SALES_FILTERS = ('store_id', 'start_date', 'end_date', 'menu_ids', 'time_division')
+STOCK_FILTERS = ('stock_store_id', 'stock_date')
+HEATMAP_FILTERS = ('store_id', 'start_date', 'end_date')
+
+# Panels of the analytics page shell; the operations page loads stock-cards and demand-heatmap
+ANALYTICS_PAGE_PANELS = ('daily-sales', 'kpis', 'menu-share', 'payment-share', 'time-divisions', 'rankings')
+
+# panel name -> (compute, filter names it takes, filter holding the store its data belongs to)
+PANELS = {}
+
+
+def panel(name, filters=SALES_FILTERS, store='store_id'):
+    def register(compute):
+        PANELS[name] = (compute, filters, store)
+        return compute
+    return register
+
+
+def aggregates(filters, *parts):
+    if cube_enabled():
+        return cube_dashboard(parts=parts, **filters)
+    return dashboard_aggregates(parts=parts, **filters)
+
+
+@panel('daily-sales')
+def daily_sales(**filters):
+    daily = aggregates(filters, 'daily')['daily']
+    return {
+        'labels': [day.strftime('%Y-%m-%d') for day, _, _ in daily],
+        'revenue': [revenue for _, revenue, _ in daily],
+        'cups': [cups for _, _, cups in daily],
+    }
+
+
+@panel('kpis')
+def kpis(**filters):
+    daily = aggregates(filters, 'daily')['daily']
+    num_days = len(daily) or 1  # avoid division by zero
+    total_sales = sum(revenue for _, revenue, _ in daily)
+    total_cups = sum(cups for _, _, cups in daily)
+    return {
+        'total_sales': total_sales,
+        'average_daily_sales': total_sales / num_days,
+        'total_cups': total_cups,
+        'average_daily_cups': total_cups / num_days,
+    }
+
+
+@panel('menu-share')
+def menu_share(**filters):
+    menu = aggregates(filters, 'menu')['menu']
+    return {'labels': [name for name, _ in menu], 'cups': [cups for _, cups in menu]}
+
+
+@panel('payment-share')
+def payment_share(**filters):
+    payment = aggregates(filters, 'payment')['payment']
+    return {'labels': [name for name, _ in payment], 'totals': [total for _, total in payment]}
+
+
+@panel('time-divisions')
+def time_divisions(**filters):
+    return {
+        'labels': [label for label, _, _ in TIME_DIVISIONS.values()],
+        'cups': aggregates(filters, 'division_cups')['division_cups'],
+    }
+
+
+def _ranking(rows, value_name):
+    """Busiest-first rows with their percentage of the total."""
+    total = sum(value for _, value in rows) or 1  # avoid zero division
+    return [
+        {'rank': i, 'name': name, value_name: value, 'percentage': round(value / total * 100, 1)}
+        for i, (name, value) in enumerate(rows, start=1)
+    ]
+
+
+@panel('rankings')
+def rankings(**filters):
+    data = aggregates(filters, 'menu', 'payment')
+    return {
+        'menu': _ranking(data['menu'], 'quantity'),
+        'payment': _ranking(data['payment'], 'total'),
+    }
+
+
+@panel('stock-cards', filters=STOCK_FILTERS, store='stock_store_id')
+def stock_cards(stock_store_id, stock_date):
+    """Every ingredient of the store as it stood at 23:00 Jakarta on stock_date."""
+    snapshot_dt = JAKARTA.localize(datetime.combine(stock_date, time(23, 0)))
+    return {
+        'stock_date': stock_date.isoformat(),
+        'cards': [
+            {'id': row['id'], 'name': row['name'], 'unit': row['unit'], 'stock_at_snapshot': round(row['quantity'], 3)}
+            for row in stock_snapshot(stock_store_id, snapshot_dt)
+        ],
+    }
+
+
+@panel('demand-heatmap', filters=HEATMAP_FILTERS)
+def heatmap(store_id, start_date, end_date):
+    """Weekday × hour cups and revenue over the whole weeks of the date range."""
+    return demand_heatmap(store_id, start_date, end_date)
+
+
+def compute_panel(name, filters):
+    """The panel's data for the request's filters, from the dashboard cache when current."""
+    compute, names, store = PANELS[name]
+    own = {key: filters.get(key) for key in names}
+    return dashboard_cache.get_or_compute(
+        f"panel:{name}", own, stores=[own[store]], compute=lambda: compute(**own),
+    )
@@ -0,0 +1,175 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, ExtractHour, TruncDate
+
+from core.utils import JAKARTA
+from sales.models import OrderItem
+from .models import SalesRollup
+from .time_divisions import TIME_DIVISIONS, division_case, division_totals
+
+KEY_FIELDS = ('store_id', 'local_date', 'local_hour', 'smoothie_id', 'payment_method_id')
+VALUE_FIELDS = ('order_count', 'cups', 'revenue')
+
+
+def bucket_lines(lines):
+    """Group OrderLines into {rollup key: [order_count, cups, revenue]}."""
+    orders = defaultdict(set)
+    totals = defaultdict(lambda: [0, 0, 0])
+    for line in lines:
+        local = line.created_at.astimezone(JAKARTA)
+        key = (line.store_id, local.date(), local.hour, line.smoothie_id, line.payment_method_id)
+        orders[key].add(line.order_id)
+        totals[key][1] += line.quantity
+        totals[key][2] += line.revenue
+    for key, order_ids in orders.items():
+        totals[key][0] = len(order_ids)
+    return totals
+
+
+def apply_lines(lines, sign):
+    """
+    Add (sign=1) or remove (sign=-1) order lines from the rollup: one query
+    to find the touched rows, one UPDATE for all of them and one insert for
+    new keys.
+    """
+    totals = bucket_lines(lines)
+    if not totals:
+        return
+
+    existing = {}
+    candidates = SalesRollup.objects.filter(
+        local_date__in={key[1] for key in totals},
+        smoothie_id__in={key[3] for key in totals},
+    ).values_list('id', *KEY_FIELDS)
+    for pk, *key in candidates:
+        if tuple(key) in totals:
+            existing[tuple(key)] = pk
+
+    if existing:
+        SalesRollup.objects.filter(pk__in=existing.values()).update(**{
+            field: F(field) + Case(
+                *[When(pk=pk, then=Value(sign * totals[key][i])) for key, pk in existing.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            for i, field in enumerate(VALUE_FIELDS)
+        })
+
+    missing = [key for key in totals if key not in existing]
+    if missing and sign > 0:
+        try:
+            with transaction.atomic():
+                SalesRollup.objects.bulk_create([
+                    SalesRollup(**dict(zip(KEY_FIELDS, key)), **dict(zip(VALUE_FIELDS, totals[key])))
+                    for key in missing
+                ])
+        except IntegrityError:
+            # another order created one of these keys first; add to it instead
+            missing = set(missing)
+            apply_lines([line for line in lines if _key_of(line) in missing], sign)
+
+
+def _key_of(line):
+    local = line.created_at.astimezone(JAKARTA)
+    return (line.store_id, local.date(), local.hour, line.smoothie_id, line.payment_method_id)
+
+
+def aggregate_from_orders():
+    """Rollup rows computed from scratch in the database, one row per key."""
+    return (
+        OrderItem.objects
+        .annotate(
+            local_date=TruncDate('order__created_at', tzinfo=JAKARTA),
+            local_hour=ExtractHour('order__created_at', tzinfo=JAKARTA),
+        )
+        .values('order__store_id', 'local_date', 'local_hour', 'smoothie_id', 'order__payment_method_id')
+        .annotate(
+            order_count=Count('order_id', distinct=True),
+            cups=Sum('quantity'),
+            revenue=Sum(F('quantity') * Coalesce('unit_price', Cast('smoothie__price', IntegerField()))),
+        )
+        .order_by()
+    )
+
+
+def _rows_by_key(rows):
+    for row in rows:
+        key = (row['order__store_id'], row['local_date'], row['local_hour'],
+               row['smoothie_id'], row['order__payment_method_id'])
+        yield key, (row['order_count'], row['cups'], row['revenue'])
+
+
+def find_drift():
+    """Return [(key, stored values, expected values)] where they differ."""
+    expected = dict(_rows_by_key(aggregate_from_orders().iterator()))
+    stored = defaultdict(lambda: (0, 0, 0))
+    for *key, order_count, cups, revenue in SalesRollup.objects.values_list(*KEY_FIELDS, *VALUE_FIELDS).iterator():
+        old = stored[tuple(key)]
+        stored[tuple(key)] = (old[0] + order_count, old[1] + cups, old[2] + revenue)
+
+    drift = []
+    for key in set(expected) | set(stored):
+        have, want = stored.get(key, (0, 0, 0)), expected.get(key, (0, 0, 0))
+        if have != want:
+            drift.append((key, have, want))
+    return drift
+
+
+def rebuild(batch_size=2000):
+    """Replace the rollup with a fresh aggregate; returns the row count."""
+    with transaction.atomic():
+        SalesRollup.objects.all().delete()
+        batch, count = [], 0
+        for key, values in _rows_by_key(aggregate_from_orders().iterator()):
+            batch.append(SalesRollup(**dict(zip(KEY_FIELDS, key)), **dict(zip(VALUE_FIELDS, values))))
+            if len(batch) >= batch_size:
+                SalesRollup.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        SalesRollup.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def filtered_rollup(store_id=None, start_date=None, end_date=None, menu_ids=None):
+    """Rollup rows matching the dashboard filters."""
+    rows = SalesRollup.objects.all()
+    if store_id:
+        rows = rows.filter(store_id=store_id)
+    if start_date:
+        rows = rows.filter(local_date__gte=start_date)
+    if end_date:
+        rows = rows.filter(local_date__lte=end_date)
+    if menu_ids:
+        rows = rows.filter(smoothie_id__in=menu_ids)
+    return rows
+
+
+# Dashboard aggregate name -> query over the filtered rollup rows
+AGGREGATES = {
+    'daily': lambda rows: list(
+        rows.values_list('local_date').annotate(revenue=Sum('revenue'), cups=Sum('cups')).order_by('local_date')
+    ),
+    'menu': lambda rows: list(
+        rows.values_list('smoothie__name').annotate(total=Sum('cups')).order_by('-total', 'smoothie__name')
+    ),
+    'payment': lambda rows: list(
+        rows.values_list('payment_method__name').annotate(total=Sum('revenue')).order_by('payment_method__name')
+    ),
+    'division_cups': lambda rows: division_totals(rows.values_list('division').annotate(cups=Sum('cups')).order_by()),
+}
+
+
+def dashboard_aggregates(store_id=None, start_date=None, end_date=None, menu_ids=None, time_division=None, parts=None):
+    """
+    Analytics dashboard numbers from the rollup: {'daily': [(date, revenue, cups)],
+    'menu': [(name, cups)] busiest first, 'payment': [(name, revenue)],
+    'division_cups': [cups per TIME_DIVISIONS entry]}. `parts` limits which
+    are computed (one query each); default all.
+    """
+    rows = filtered_rollup(store_id, start_date, end_date, menu_ids).annotate(division=division_case('local_hour'))
+    if time_division in TIME_DIVISIONS:
+        rows = rows.filter(division=time_division)
+    return {part: AGGREGATES[part](rows) for part in (parts or AGGREGATES)}
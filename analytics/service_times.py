@@ -0,0 +1,131 @@
+"""
+Service-time percentiles for the operations dashboard.
+
+The created→ready, ready→served and created→served intervals are computed
+by the database and streamed through log-bucketed quantile sketches, so
+p50/p90/p99 cost constant memory however many orders the range holds.
+Each interval is summarized overall and per store, Jakarta hour and weekday.
+"""
+import math
+from collections import defaultdict
+
+from django.db.models import DurationField, ExpressionWrapper, F
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+
+from core.metrics import Histogram
+from core.utils import JAKARTA
+
+# key -> (label, start field, end field)
+INTERVALS = {
+    'ready': ("Ready from Created", 'created_at', 'ready_at'),
+    'served_from_ready': ("Served from Ready", 'ready_at', 'served_at'),
+    'served': ("Served from Created", 'created_at', 'served_at'),
+}
+PERCENTILES = (50, 90, 99)
+HISTOGRAM_MINUTES = (1, 2, 3, 5, 8, 10, 15, 20, 30, 60)
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+CHUNK_SIZE = 2000
+
+
+class QuantileSketch:
+    """
+    Streaming quantiles with bounded relative error: values are counted in
+    logarithmic buckets, so any quantile is within `relative_accuracy` of
+    the exact one. Seconds between 1 s and a week need under 500 buckets.
+    """
+    MAX_SECONDS = 7 * 86400
+
+    def __init__(self, relative_accuracy=0.02):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds):
+        seconds = min(max(seconds, 0.0), self.MAX_SECONDS)
+        self.buckets[math.ceil(math.log(max(seconds, 1.0)) / self.log_gamma)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Approximate q-quantile (0..1), or None when empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def summary(self):
+        """{'count', 'avg', 'p50', 'p90', 'p99'} in seconds (None when empty)."""
+        return {
+            'count': self.count,
+            'avg': self.mean,
+            **{f"p{pct}": self.quantile(pct / 100) for pct in PERCENTILES},
+        }
+
+
+class ServiceTimes:
+    """Sketches per interval, overall and per store / hour / weekday, plus a fixed-bin histogram."""
+
+    def __init__(self):
+        self.overall = {key: QuantileSketch() for key in INTERVALS}
+        self.histograms = {key: Histogram(HISTOGRAM_MINUTES) for key in INTERVALS}
+        self.by = {
+            dimension: defaultdict(lambda: {key: QuantileSketch() for key in INTERVALS})
+            for dimension in ('store', 'hour', 'weekday')
+        }
+
+    def add(self, store_id, hour, weekday, durations):
+        for key, duration in zip(INTERVALS, durations):
+            if duration is None:
+                continue
+            seconds = duration.total_seconds()
+            self.overall[key].add(seconds)
+            self.histograms[key].add(seconds / 60)
+            for dimension, value in (('store', store_id), ('hour', hour), ('weekday', weekday)):
+                self.by[dimension][value][key].add(seconds)
+
+    def breakdown(self, dimension, key):
+        """[(dimension value, summary)] for one interval, in value order."""
+        rows = self.by[dimension]
+        return [
+            (value, rows[value][key].summary())
+            for value in sorted(rows, key=lambda v: (v is None, v or 0))
+            if rows[value][key].count
+        ]
+
+
+def service_times(orders):
+    """Stream the intervals of an Order queryset into a ServiceTimes."""
+    intervals = {
+        f"{key}_duration": ExpressionWrapper(F(end) - F(start), output_field=DurationField())
+        for key, (_, start, end) in INTERVALS.items()
+    }
+    rows = (
+        orders.annotate(
+            local_hour=ExtractHour('created_at', tzinfo=JAKARTA),
+            local_weekday=ExtractIsoWeekDay('created_at', tzinfo=JAKARTA),
+            **intervals,
+        )
+        # the id keeps rows of a .distinct() queryset apart
+        .values_list('id', 'store_id', 'local_hour', 'local_weekday', *intervals)
+        .order_by()
+    )
+    stats = ServiceTimes()
+    for _, store_id, hour, weekday, *durations in rows.iterator(chunk_size=CHUNK_SIZE):
+        stats.add(store_id, hour, weekday, durations)
+    return stats
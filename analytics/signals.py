@@ -0,0 +1,16 @@
+from django.dispatch import receiver
+
+from sales.signals import order_lines_changed
+
+from . import heatmap
+from .rollup import apply_lines
+
+
+@receiver(order_lines_changed)
+def update_sales_rollup(sender, lines, sign, **kwargs):
+    apply_lines(lines, sign)
+
+
+@receiver(order_lines_changed)
+def update_demand_heatmap(sender, lines, sign, **kwargs):
+    heatmap.apply_lines(lines, sign)
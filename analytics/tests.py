@@ -1,3 +1,482 @@
-from django.test import TestCase
+import json
+import random
+import time as timer
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from django.db.models import F, Sum
+
+from core.models import DataVersion, Store, User
+from core.utils import JAKARTA
+from sales.models import Order, PaymentMethod
+from sales.services import cancel_orders, place_order, place_orders
+from sales.tests import make_menu
+from .models import DemandHeatmap, SalesRollup
+from . import cube, heatmap
+from .context_cache import DashboardContextCache, dashboard_cache
+from .rollup import dashboard_aggregates, find_drift
+from .service_times import QuantileSketch, service_times
+from .time_divisions import TIME_DIVISIONS, annotate_division, division_totals
+
+
+def get_panel(client, name, **params):
+    response = client.get(reverse('analytics_panel', args=[name]), params)
+    assert response.status_code == 200, response
+    return response.json()
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Main")
+        self.cash = PaymentMethod.objects.create(name="Cash")
+        self.qris = PaymentMethod.objects.create(name="QRIS")
+        self.smoothies = make_menu(self.store, 3, ingredients_per_smoothie=1)
+
+    def new_order(self, payment_method=None, created_at=None):
+        order = Order(name="Guest", store=self.store, payment_method=payment_method or self.cash)
+        if created_at:
+            order.created_at = created_at
+        return order
+
+    def test_place_and_cancel_keep_rollup_in_step(self):
+        # 02:30 UTC is 09:30 in Jakarta
+        at = datetime(2025, 3, 1, 2, 30, tzinfo=dt_timezone.utc)
+        first = place_order(self.new_order(created_at=at), [(self.smoothies[0], 2), (self.smoothies[1], 1)])
+        place_orders([
+            (self.new_order(created_at=at), [(self.smoothies[0], 1)]),
+            (self.new_order(self.qris, created_at=at), [(self.smoothies[0], 3)]),
+        ])
+
+        row = SalesRollup.objects.get(smoothie=self.smoothies[0], payment_method=self.cash)
+        self.assertEqual((row.local_date.isoformat(), row.local_hour), ("2025-03-01", 9))
+        self.assertEqual((row.order_count, row.cups, row.revenue), (2, 3, 45000))
+        self.assertEqual(find_drift(), [])
+
+        cancel_orders([first.id])
+        row.refresh_from_db()
+        self.assertEqual((row.order_count, row.cups, row.revenue), (1, 1, 15000))
+        self.assertEqual(find_drift(), [])
+
+    def test_check_reports_drift_and_rebuild_fixes_it(self):
+        place_order(self.new_order(), [(self.smoothies[0], 2)])
+        SalesRollup.objects.update(cups=99)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_sales_rollup', check=True, stdout=StringIO())
+        call_command('rebuild_sales_rollup', stdout=StringIO())
+        self.assertEqual(find_drift(), [])
+        self.assertEqual(SalesRollup.objects.get().cups, 2)
+
+
+class AnalyticsDashboardTests(TestCase):
+    def setUp(self):
+        dashboard_cache.clear()
+        self.store = Store.objects.create(name="Main")
+        self.cash = PaymentMethod.objects.create(name="Cash")
+        self.smoothies = make_menu(self.store, 2, ingredients_per_smoothie=1)
+        user = User.objects.create_user("manager", password="x", role="manager", store=self.store)
+        self.client.force_login(user)
+
+    def place(self, utc_hour, cart, day=1):
+        order = Order(name="Guest", store=self.store, payment_method=self.cash,
+                      created_at=datetime(2025, 3, day, utc_hour, tzinfo=dt_timezone.utc))
+        return place_order(order, cart)
+
+    def test_charts_come_from_rollup(self):
+        self.place(2, [(self.smoothies[0], 2)])            # 09:00 Jakarta
+        self.place(6, [(self.smoothies[1], 1)])            # 13:00 Jakarta
+        self.place(2, [(self.smoothies[0], 1)], day=2)
+
+        daily = get_panel(self.client, 'daily-sales')
+        self.assertEqual(daily['labels'], ["2025-03-01", "2025-03-02"])
+        self.assertEqual(daily['revenue'], [45000, 15000])
+        self.assertEqual(daily['cups'], [3, 1])
+        self.assertEqual(get_panel(self.client, 'time-divisions')['cups'], [3, 0, 1, 0])
+        self.assertEqual(get_panel(self.client, 'payment-share')['totals'], [60000])
+        self.assertEqual(get_panel(self.client, 'kpis')['total_cups'], 4)
+        self.assertEqual(
+            get_panel(self.client, 'rankings')['menu'],
+            [{'rank': 1, 'name': "Smoothie 0", 'quantity': 3, 'percentage': 75.0},
+             {'rank': 2, 'name': "Smoothie 1", 'quantity': 1, 'percentage': 25.0}],
+        )
+
+        daily = get_panel(self.client, 'daily-sales', time_division='morning', start_date='2025-03-02')
+        self.assertEqual(daily['cups'], [1])
+
+    def test_shell_renders_without_aggregate_queries(self):
+        self.place(2, [(self.smoothies[0], 2)])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('analytics_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries if 'analytics_salesrollup' in q['sql']])
+        self.assertContains(response, 'id="panel-names"')
+        self.assertEqual(self.client.get(reverse('analytics_panel', args=['nope'])).status_code, 404)
+
+    def test_operations_stock_cards_use_signed_ledger(self):
+        self.place(2, [(self.smoothies[0], 2)])  # ledger row stamped now: -20
+        today = timezone.now().astimezone(JAKARTA).date()
+
+        cards = {}
+        for stock_date in (today - timedelta(days=1), today + timedelta(days=1)):
+            data = get_panel(self.client, 'stock-cards', stock_date=stock_date.isoformat())
+            cards[stock_date] = [card['stock_at_snapshot'] for card in data['cards']]
+        self.assertEqual(self.client.get(reverse('operations_dashboard')).status_code, 200)
+        self.assertEqual(cards[today - timedelta(days=1)], [1000, 1000])
+        self.assertEqual(cards[today + timedelta(days=1)], [980, 1000])
+
+
+def python_division(created_at):
+    """The dashboards' former in-Python bucketing, kept as the reference."""
+    local_time = created_at.astimezone(JAKARTA).time()
+    for key, (_, start, end) in TIME_DIVISIONS.items():
+        if time(start, 0) <= local_time < time(end, 0):
+            return key
+    return None
+
+
+class TimeDivisionTests(TestCase):
+    def setUp(self):
+        dashboard_cache.clear()
+        self.store = Store.objects.create(name="Main")
+        self.cash = PaymentMethod.objects.create(name="Cash")
+        self.smoothie = make_menu(self.store, 1, ingredients_per_smoothie=1)[0]
+        day = JAKARTA.localize(datetime(2025, 3, 1))
+        edges = [day + timedelta(hours=h, seconds=s) for h in (9, 11, 13, 15, 18) for s in (-1, 0)]
+        every_quarter = [day + timedelta(minutes=15 * i) for i in range(96)]
+        for i, created_at in enumerate(edges + every_quarter):
+            order = Order(name="Guest", store=self.store, payment_method=self.cash, created_at=created_at)
+            place_order(order, [(self.smoothie, 1 + i % 3)])
+
+    def test_database_buckets_match_python(self):
+        for order in annotate_division(Order.objects.all(), 'created_at'):
+            self.assertEqual(order.division, python_division(order.created_at), order.created_at)
+
+    def test_filter_and_totals_match_python(self):
+        expected = {key: 0 for key in TIME_DIVISIONS}
+        for order in Order.objects.prefetch_related('orderitem_set'):
+            key = python_division(order.created_at)
+            if key:
+                expected[key] += sum(item.quantity for item in order.orderitem_set.all())
+
+        totals = division_totals(
+            annotate_division(Order.objects.all(), 'created_at')
+            .values_list('division').annotate(cups=Sum('orderitem__quantity')).order_by()
+        )
+        self.assertEqual(totals, list(expected.values()))
+
+        user = User.objects.create_user("manager", password="x", role="manager", store=self.store)
+        self.client.force_login(user)
+        self.assertEqual(get_panel(self.client, 'time-divisions')['cups'], list(expected.values()))
+        self.assertEqual(get_panel(self.client, 'daily-sales', time_division='lunch')['cups'], [expected['lunch']])
+        self.assertEqual(
+            get_panel(self.client, 'time-divisions', time_division='lunch')['cups'], [0, expected['lunch'], 0, 0],
+        )
+
+
+@skipUnless(cube.np is not None, "numpy is not installed")
+class SalesCubeTests(TestCase):
+    def setUp(self):
+        dashboard_cache.clear()
+        self.store = Store.objects.create(name="Main")
+        self.other = Store.objects.create(name="Other")
+        self.cash = PaymentMethod.objects.create(name="Cash")
+        self.qris = PaymentMethod.objects.create(name="QRIS")
+        self.smoothies = make_menu(self.store, 3, ingredients_per_smoothie=1)
+        self.orders = []
+        for i in range(40):
+            created_at = JAKARTA.localize(datetime(2025, 3, 1 + i % 4, 8 + i % 11, 7 * i % 60))
+            order = Order(name="Guest", store=self.other if i % 5 == 0 else self.store,
+                          payment_method=self.qris if i % 3 else self.cash, created_at=created_at)
+            cart = [(self.smoothies[i % 3], 1 + i % 2), (self.smoothies[(i + 1) % 3], 1)]
+            self.orders.append(place_order(order, cart))
+
+    def assert_matches_rollup(self, sales_cube, **filters):
+        sales_cube.refresh()
+        with mock.patch.object(cube, 'sales_cube', sales_cube):
+            from_cube = cube.cube_dashboard(**filters)
+        from_rollup = dashboard_aggregates(**filters)
+        self.assertEqual(from_cube['daily'], from_rollup['daily'])
+        self.assertEqual(sorted(from_cube['menu']), sorted(from_rollup['menu']))
+        self.assertEqual(sorted(from_cube['payment']), sorted(from_rollup['payment']))
+        self.assertEqual(from_cube['division_cups'], from_rollup['division_cups'])
+
+    def test_aggregates_match_rollup(self):
+        sales_cube = cube.SalesCube()
+        for filters in [
+            {},
+            {'store_id': str(self.store.id)},
+            {'start_date': datetime(2025, 3, 2).date(), 'end_date': datetime(2025, 3, 3).date()},
+            {'menu_ids': [str(self.smoothies[0].id)], 'time_division': 'lunch'},
+        ]:
+            self.assert_matches_rollup(sales_cube, **filters)
+
+    def test_incremental_refresh_follows_new_and_cancelled_orders(self):
+        sales_cube = cube.SalesCube()
+        sales_cube.refresh()
+        lines = len(sales_cube)
+
+        cancel_orders([self.orders[0].id, self.orders[1].id])
+        place_order(Order(name="Guest", store=self.store, payment_method=self.cash), [(self.smoothies[2], 4)])
+        self.assert_matches_rollup(sales_cube)
+        self.assertEqual(len(sales_cube), lines - 4 + 1)
+
+    def test_late_commit_below_high_water_mark_is_loaded(self):
+        sales_cube = cube.SalesCube()
+        sales_cube.refresh()
+        late = place_order(Order(name="Guest", store=self.store, payment_method=self.cash), [(self.smoothies[0], 1)])
+        sales_cube.order_hwm = late.id + 10  # as if later orders had already been loaded
+        sales_cube.refresh()
+        self.assertIn(late.id, sales_cube.columns['order'])
+
+    def test_dashboard_uses_cube_when_enabled(self):
+        user = User.objects.create_user("manager", password="x", role="manager", store=self.store)
+        self.client.force_login(user)
+        expected = {name: get_panel(self.client, name) for name in ('daily-sales', 'rankings')}
+        dashboard_cache.clear()
+        with override_settings(ANALYTICS_ENGINE='cube'), mock.patch.object(cube, 'sales_cube', cube.SalesCube()):
+            actual = {name: get_panel(self.client, name) for name in ('daily-sales', 'rankings')}
+            self.assertGreater(len(cube.sales_cube), 0)
+        self.assertEqual(actual, expected)
+
+    def test_million_lines_recompute(self):
+        """
+        Benchmark: a full dashboard recompute over 1M order lines. It measures
+        about 20-35 ms; the 100 ms bound leaves room for slow CI machines but
+        still fails on a several-fold regression.
+        """
+        np, n = cube.np, 1_000_000
+        rng = np.random.default_rng(0)
+        sales_cube = cube.SalesCube()
+        sales_cube.columns = {
+            'order': np.arange(n, dtype='int64') // 2,
+            'day': rng.integers(20000, 20180, n).astype('int32'),
+            'hour': rng.integers(8, 21, n).astype('int8'),
+            'store': rng.integers(1, 4, n),
+            'smoothie': rng.integers(1, 31, n),
+            'payment': rng.integers(1, 4, n),
+            'quantity': rng.integers(1, 4, n).astype('float64'),
+            'revenue': rng.integers(1, 4, n) * 20000.0,
+        }
+        for filters in ({}, {'store_id': '2'}, {'store_id': '2', 'time_division': 'lunch'}):
+            timings = []
+            for _ in range(3):  # best of three, so one scheduler hiccup doesn't fail the run
+                started = timer.perf_counter()
+                result = sales_cube.dashboard(**filters)
+                timings.append(timer.perf_counter() - started)
+            self.assertLess(min(timings), 0.1, filters)
+            self.assertEqual(len(result['daily']), 180)
+
+
+class DashboardContextCacheTests(TestCase):
+    def setUp(self):
+        dashboard_cache.clear()
+        self.store = Store.objects.create(name="Main")
+        self.cash = PaymentMethod.objects.create(name="Cash")
+        self.smoothie = make_menu(self.store, 1, ingredients_per_smoothie=1)[0]
+        user = User.objects.create_user("manager", password="x", role="manager", store=self.store)
+        self.client.force_login(user)
+
+    def place(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(Order(name="Guest", store=self.store, payment_method=self.cash), [(self.smoothie, 1)])
+
+    def total_cups(self, **params):
+        return get_panel(self.client, 'kpis', **params)['total_cups']
+
+    def test_reused_until_the_store_changes(self):
+        self.place()
+        self.assertEqual(self.total_cups(store=self.store.id), 1)
+        hits = dashboard_cache.hits
+        self.assertEqual(self.total_cups(store=self.store.id), 1)
+        self.assertEqual(dashboard_cache.hits, hits + 1)
+
+        self.place()
+        self.assertEqual(self.total_cups(store=self.store.id), 2)  # version bumped: recomputed
+        self.assertEqual(self.total_cups(), 2)
+
+        admin = User.objects.create_user("admin", password="x", role="admin", store=self.store)
+        self.client.force_login(admin)
+        self.assertEqual(self.client.get(reverse('dashboard_cache_stats')).json()['hits'], dashboard_cache.hits)
+
+    def test_other_store_writes_keep_the_entry(self):
+        other = Store.objects.create(name="Other")
+        self.total_cups(store=self.store.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(Order(name="Guest", store=other, payment_method=self.cash), [(self.smoothie, 1)])
+        hits = dashboard_cache.hits
+        self.total_cups(store=self.store.id)
+        self.assertEqual(dashboard_cache.hits, hits + 1)
+
+    def test_versions_are_shared_between_processes(self):
+        self.place()
+        self.total_cups(store=self.store.id)
+        # Another worker's write only touches the database counter, not this process's memory
+        DataVersion.objects.filter(key=f"data-version:{self.store.id}").update(version=F('version') + 1)
+        hits = dashboard_cache.hits
+        self.total_cups(store=self.store.id)
+        self.assertEqual(dashboard_cache.hits, hits)
+
+    def test_lru_bound(self):
+        small = DashboardContextCache(max_entries=2)
+        for day in ('2025-03-01', '2025-03-02', '2025-03-03'):
+            small.get_or_compute('analytics', {'start_date': day}, [None], compute=lambda: {'day': day})
+        small.get_or_compute('analytics', {'start_date': '2025-03-03'}, [None], compute=lambda: {})
+        self.assertEqual(small.stats()['entries'], 2)
+        self.assertEqual((small.hits, small.misses), (1, 3))
+        self.assertIsNone(small.backend.get(small.make_key('analytics', {'start_date': '2025-03-01'}, [None])))
+
+    def test_filters_are_normalized(self):
+        a = dashboard_cache.make_key('analytics', {'menu_ids': ['2', '10'], 'store_id': ''}, [None])
+        b = dashboard_cache.make_key('analytics', {'menu_ids': ['10', '2'], 'store_id': None}, [None])
+        self.assertEqual(a, b)
+
+
+class ServiceTimeTests(TestCase):
+    def setUp(self):
+        dashboard_cache.clear()
+        self.store = Store.objects.create(name="Main")
+        self.cash = PaymentMethod.objects.create(name="Cash")
+        self.smoothies = make_menu(self.store, 2, ingredients_per_smoothie=1)
+
+    def test_sketch_quantiles_stay_within_relative_accuracy(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(5, 0.8) for _ in range(20000)]
+        sketch = QuantileSketch(relative_accuracy=0.02)
+        for value in values:
+            sketch.add(value)
+        ordered = sorted(values)
+        for q in (0.5, 0.9, 0.99):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            self.assertAlmostEqual(sketch.quantile(q) / exact, 1, delta=0.021)
+        self.assertLess(len(sketch.buckets), 500)
+
+    def test_intervals_come_from_the_database(self):
+        # Saturday 2025-03-01, 09:xx Jakarta; ready after 1..10 minutes, served 1 minute later
+        for i in range(1, 11):
+            created_at = JAKARTA.localize(datetime(2025, 3, 1, 9, i))
+            order = place_order(Order(name="Guest", store=self.store, payment_method=self.cash,
+                                      created_at=created_at), [(self.smoothies[i % 2], 1)])
+            Order.objects.filter(pk=order.pk).update(
+                ready_at=created_at + timedelta(minutes=i), served_at=created_at + timedelta(minutes=i + 1),
+            )
+        place_order(Order(name="Pending", store=self.store, payment_method=self.cash), [(self.smoothies[0], 1)])
+
+        stats = service_times(Order.objects.all())
+        ready = stats.overall['ready'].summary()
+        self.assertEqual(ready['count'], 10)
+        self.assertAlmostEqual(ready['avg'], 330)
+        self.assertAlmostEqual(ready['p50'], 300, delta=300 * 0.02)
+        self.assertAlmostEqual(stats.overall['served_from_ready'].summary()['p99'], 60, delta=60 * 0.02)
+        self.assertEqual([value for value, _ in stats.breakdown('hour', 'served')], [9])
+        self.assertEqual([value for value, _ in stats.breakdown('weekday', 'served')], [6])
+
+        # a menu filter joins order items; rows of a distinct() queryset must not collapse
+        filtered = Order.objects.filter(list_menu__id__in=[s.id for s in self.smoothies]).distinct()
+        self.assertEqual(service_times(filtered).overall['ready'].count, 10)
+
+        user = User.objects.create_user("manager", password="x", role="manager", store=self.store)
+        self.client.force_login(user)
+        response = self.client.get(reverse('operations_dashboard'))
+        kpis = {kpi['label']: kpi for kpi in response.context['service_time_kpis']}
+        self.assertEqual(kpis["Served from Ready"]['p90'], "1.00 min")
+        self.assertEqual(response.context['avg_ready_display'], "5.50 min")
+        self.assertEqual(sum(json.loads(response.context['duration_histogram'])['served']), 10)
+
+
+class AsyncPanelsTests(TransactionTestCase):
+    """The aggregate endpoint computes panels in worker threads, so its data must be committed."""
+
+    def setUp(self):
+        dashboard_cache.clear()
+        self.store = Store.objects.create(name="Main")
+        cash = PaymentMethod.objects.create(name="Cash")
+        smoothie = make_menu(self.store, 1, ingredients_per_smoothie=1)[0]
+        place_order(Order(name="Guest", store=self.store, payment_method=cash,
+                          created_at=JAKARTA.localize(datetime(2025, 3, 1, 12))), [(smoothie, 2)])
+
+    async def test_streams_every_panel_once(self):
+        user = await User.objects.acreate(username="manager", role="manager", store=self.store)
+        await sync_to_async(self.async_client.force_login)(user)
+        response = await self.async_client.get(reverse('analytics_panels'))
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        lines = [json.loads(line) for line in content.splitlines()]
+        panels = {line['panel']: line['data'] for line in lines}
+        self.assertEqual(len(lines), len(panels))
+        self.assertEqual(set(panels), {'daily-sales', 'kpis', 'menu-share', 'payment-share',
+                                       'time-divisions', 'rankings', 'stock-cards', 'demand-heatmap'})
+        self.assertEqual(panels['kpis']['total_cups'], 2)
+        self.assertEqual(panels['time-divisions']['cups'], [0, 2, 0, 0])
+
+        response = await self.async_client.get(reverse('analytics_panels'), {'panel': ['kpis', 'bogus']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_a_manager(self):
+        cashier = User.objects.create_user("cashier", password="x", role="cashier", store=self.store)
+        self.client.force_login(cashier)
+        self.assertRedirects(
+            self.client.get(reverse('analytics_panels')), reverse('no_permission'), fetch_redirect_response=False,
+        )
+
+
+class DemandHeatmapTests(TestCase):
+    def setUp(self):
+        dashboard_cache.clear()
+        self.store = Store.objects.create(name="Main")
+        self.cash = PaymentMethod.objects.create(name="Cash")
+        self.smoothies = make_menu(self.store, 2, ingredients_per_smoothie=1)
+
+    def place(self, local, cart):
+        order = Order(name="Guest", store=self.store, payment_method=self.cash, created_at=JAKARTA.localize(local))
+        return place_order(order, cart)
+
+    def test_order_writes_keep_the_matrices_in_step(self):
+        monday = self.place(datetime(2025, 3, 3, 9, 15), [(self.smoothies[0], 2), (self.smoothies[1], 1)])
+        self.place(datetime(2025, 3, 8, 12, 5), [(self.smoothies[0], 1)])    # Saturday, same week
+        self.place(datetime(2025, 3, 10, 9, 40), [(self.smoothies[1], 3)])   # Monday, next week
+        self.assertEqual(DemandHeatmap.objects.count(), 2)
+        self.assertEqual(heatmap.find_drift(), [])
+
+        both = heatmap.demand_heatmap(self.store.id)
+        self.assertEqual(both['weeks'], 2)
+        self.assertEqual(both['cups'][0][9], 6)
+        self.assertEqual(both['cups'][5][12], 1)
+        self.assertEqual(both['revenue'][0][9], 90000)
+        self.assertEqual(sum(map(sum, both['cups'])), 7)
+
+        first = heatmap.demand_heatmap(self.store.id, date(2025, 3, 4), date(2025, 3, 9))
+        self.assertEqual((first['weeks'], first['cups'][0][9]), (1, 3))
+
+        cancel_orders([monday.id])
+        self.assertEqual(heatmap.demand_heatmap(self.store.id)['cups'][0][9], 3)
+        self.assertEqual(heatmap.find_drift(), [])
+
+    def test_range_queries_read_one_row_per_week(self):
+        for week in range(12):
+            self.place(datetime(2025, 1, 6, 10) + timedelta(weeks=week), [(self.smoothies[0], 1)])
+        with self.assertNumQueries(1):
+            data = heatmap.demand_heatmap(self.store.id, date(2025, 1, 1), date(2025, 12, 31))
+        self.assertEqual((data['weeks'], data['cups'][0][10]), (12, 12))
+
+    def test_check_and_rebuild_command(self):
+        self.place(datetime(2025, 3, 3, 9, 15), [(self.smoothies[0], 2)])
+        expected = heatmap.demand_heatmap()
+        DemandHeatmap.objects.update(cups=[0] * 168)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_demand_heatmap', check=True, stdout=StringIO())
+        call_command('rebuild_demand_heatmap', stdout=StringIO())
+        self.assertEqual(heatmap.demand_heatmap(), expected)
+
+        user = User.objects.create_user("manager", password="x", role="manager", store=self.store)
+        self.client.force_login(user)
+        data = get_panel(self.client, 'demand-heatmap', store=self.store.id)
+        self.assertEqual((len(data['cups']), len(data['cups'][0])), (7, 24))
+        self.assertEqual(data['cups'][0][9], 2)
@@ -0,0 +1,39 @@
+"""
+Morning/lunch/after-lunch/afternoon buckets computed in the database, from
+the hour in Asia/Jakarta. Works the same on SQLite and PostgreSQL.
+"""
+from django.db.models import Case, CharField, Value, When
+from django.db.models.functions import ExtractHour
+
+from core.utils import JAKARTA
+
+# key -> (label, first hour, end hour exclusive), Jakarta time
+TIME_DIVISIONS = {
+    'morning': ('Morning (09-11)', 9, 11),
+    'lunch': ('Lunch (11-13)', 11, 13),
+    'after_lunch': ('After Lunch (13-15)', 13, 15),
+    'afternoon': ('Afternoon (15-18)', 15, 18),
+}
+
+
+def division_case(hour):
+    """Case expression mapping an hour expression/field to a division key (NULL outside them)."""
+    return Case(
+        *[When(**{f"{hour}__gte": start, f"{hour}__lt": end}, then=Value(key))
+          for key, (_, start, end) in TIME_DIVISIONS.items()],
+        default=None,
+        output_field=CharField(),
+    )
+
+
+def annotate_division(queryset, datetime_field):
+    """Annotate `local_hour` and `division` from a datetime column."""
+    return queryset.annotate(
+        local_hour=ExtractHour(datetime_field, tzinfo=JAKARTA),
+    ).annotate(division=division_case('local_hour'))
+
+
+def division_totals(rows):
+    """[(division key, total)] -> totals in TIME_DIVISIONS order, 0 when missing."""
+    totals = dict(rows)
+    return [totals.get(key) or 0 for key in TIME_DIVISIONS]
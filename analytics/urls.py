@@ -7,5 +7,8 @@ urlpatterns = [
     
     path('', views.analytics_dashboard, name='analytics_dashboard'),
     path('operations/', views.operations_dashboard, name='operations_dashboard'),  # new operations page
+    path('cache-stats/', views.dashboard_cache_stats, name='dashboard_cache_stats'),
+    path('panels/', views.analytics_panels, name='analytics_panels'),  # async, streams every panel
+    path('panels/<slug:name>/', views.analytics_panel, name='analytics_panel'),
 
 ]
@@ -1,14 +1,23 @@
 # analytics/views.py
-from collections import defaultdict
+import asyncio
 import json
-from datetime import datetime, date, time, timedelta
+from datetime import datetime
 import pytz
 
-from django.shortcuts import render
-from django.db.models import Sum
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.urls import reverse
 from core.models import Store
-from sales.models import Order, OrderItem
-from inventory.models import SmoothieMenu, Ingredient, StockEntry
+from core.utils import filter_local_dates
+from sales.models import Order
+from inventory.models import SmoothieMenu
+from .context_cache import dashboard_cache
+from .panels import ANALYTICS_PAGE_PANELS, PANELS, compute_panel
+from .service_times import INTERVALS, PERCENTILES, WEEKDAYS, service_times
+from .time_divisions import TIME_DIVISIONS, annotate_division
 from core.decorators import role_required
 from django.contrib.auth.decorators import login_required
 
@@ -16,167 +25,94 @@ from django.contrib.auth.decorators import login_required
 @login_required
 @role_required(['admin', 'manager'])
 def analytics_dashboard(request):
-    jakarta = pytz.timezone("Asia/Jakarta")
+    """
+    The page shell: filters and empty panels only. Each panel's data is
+    fetched from analytics_panel in parallel, so the first paint doesn't
+    wait for any aggregate.
+    """
+    return render(request, 'analytics/dashboard.html', {
+        'menus': SmoothieMenu.objects.all(),
+        'selected_menus': request.GET.getlist('menu'),
+        'time_division_selected': request.GET.get('time_division') or "",
+        'start_date': request.GET.get('start_date') or "",
+        'end_date': request.GET.get('end_date') or "",
+        'stores': Store.objects.all(),
+        'panels': ANALYTICS_PAGE_PANELS,
+        'role': request.user.role,
+    })
+
+
+def panel_filters(request):
+    """Dashboard filters from the query string, shared by every panel."""
+    return {
+        'store_id': request.GET.get('store'),  # store id or None
+        'start_date': parse_date_param(request.GET.get('start_date')),
+        'end_date': parse_date_param(request.GET.get('end_date')),
+        'menu_ids': request.GET.getlist('menu'),
+        'time_division': request.GET.get('time_division'),  # morning/lunch/after_lunch/afternoon
+        # stock cards: the user's own store, at 23:00 Jakarta of stock_date (default today)
+        'stock_store_id': request.user.store_id,
+        'stock_date': parse_date_param(request.GET.get('stock_date')) or datetime.now(JKT).date(),
+    }
 
-    # --- Filters from request ---
-    start_date = request.GET.get('start_date')  # YYYY-MM-DD or None
-    end_date = request.GET.get('end_date')
-    menu_ids = request.GET.getlist('menu')  # list of ids as strings
-    time_division = request.GET.get('time_division')  # morning/lunch/after_lunch/afternoon
-    store_id = request.GET.get('store')  # store id or None
 
+@login_required
+@role_required(['admin', 'manager'])
+def analytics_panel(request, name):
+    """One dashboard panel as JSON, for the current filters."""
+    if name not in PANELS:
+        raise Http404("Unknown panel")
+    return JsonResponse(compute_panel(name, panel_filters(request)))
 
-    # --- Base queryset filtered by date & menu (DB-level) ---
-    orders_qs = Order.objects.all()
 
-    if store_id:                     # if user selects a store
-        orders_qs = orders_qs.filter(store_id=store_id)
+async def analytics_panels(request):
+    """
+    Several panels computed concurrently (?panel=... repeated, default all),
+    streamed as one JSON line {"panel", "data"} per panel in the order they
+    finish, so a slow panel doesn't hold back the others.
+
+    Only streams under the ASGI app (ASGI_STREAMING). Under WSGI (gunicorn,
+    Vercel) the panels still run concurrently, but the response is
+    buffered and arrives in one piece once the slowest panel is done.
+    The dashboard pages fetch analytics_panel one panel at a time instead.
+    """
+    # login_required and role_required can't wrap async views on Django 4.2
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return redirect(f"{reverse('login')}?next={request.path}")
+    if user.role not in ('admin', 'manager'):
+        return redirect('no_permission')
 
-    if start_date:
-        orders_qs = orders_qs.filter(created_at__date__gte=start_date)
-    if end_date:
-        orders_qs = orders_qs.filter(created_at__date__lte=end_date)
-    if menu_ids:
-        orders_qs = orders_qs.filter(list_menu__id__in=menu_ids).distinct()
+    names = request.GET.getlist('panel') or list(PANELS)
+    unknown = [name for name in names if name not in PANELS]
+    if unknown:
+        return JsonResponse({'error': f"Unknown panels: {', '.join(unknown)}"}, status=400)
+    filters = await sync_to_async(panel_filters)(request)
 
-    # Evaluate queryset into list so we can do timezone-aware time filtering in Python
-    orders_list = list(orders_qs)
+    async def compute(name):
+        # each panel runs in its own worker thread, on that thread's connection
+        return name, await sync_to_async(compute_panel_in_thread, thread_sensitive=False)(name, filters)
 
-    # --- Time division filter (apply in Python using Jakarta local time) ---
-    if time_division:
-        time_ranges = {
-            'morning': (time(9, 0), time(11, 0)),
-            'lunch': (time(11, 0), time(13, 0)),
-            'after_lunch': (time(13, 0), time(15, 0)),
-            'afternoon': (time(15, 0), time(18, 0)),
-        }
-        if time_division in time_ranges:
-            start_t, end_t = time_ranges[time_division]
-            filtered = []
-            for o in orders_list:
-                # created_at may be timezone-aware; astimezone handles naive vs aware safely
-                local_dt = o.created_at.astimezone(jakarta)
-                if start_t <= local_dt.time() < end_t:
-                    filtered.append(o)
-            orders_list = filtered
-
-    order_ids = [o.id for o in orders_list]
-
-    # --- Fetch related order items for these orders ---
-    order_items_qs = OrderItem.objects.filter(order_id__in=order_ids).select_related('order', 'smoothie')
-
-    # --- Daily sales (Rp) and daily cups (grouped by Jakarta local date) ---
-    sales_by_date = defaultdict(int)
-    cups_by_date = defaultdict(int)
-
-    for o in orders_list:
-        local_date = o.created_at.astimezone(jakarta).date()
-        sales_by_date[local_date] += o.total_price
-
-    for item in order_items_qs:
-        local_date = item.order.created_at.astimezone(jakarta).date()
-        cups_by_date[local_date] += item.quantity
-
-    # union of dates, sorted
-    all_dates = sorted(set(list(sales_by_date.keys()) + list(cups_by_date.keys())))
-    sales_labels = [d.strftime('%Y-%m-%d') for d in all_dates]
-    sales_data_rp = [sales_by_date.get(d, 0) for d in all_dates]
-    cups_data = [cups_by_date.get(d, 0) for d in all_dates]
-
-    # --- Menu sales percentage (pie) ---
-    menu_agg = (
-        order_items_qs
-        .values('smoothie__name')
-        .annotate(total=Sum('quantity'))
-        .order_by('-total')
-    )
-    menu_labels = [m['smoothie__name'] for m in menu_agg]
-    menu_cups = [m['total'] for m in menu_agg]
-
-    # --- Payment method breakdown (sum of total_price per method) ---
-    payment_agg = (
-        Order.objects
-        .filter(id__in=order_ids)
-        .values('payment_method__name')
-        .annotate(total=Sum('total_price'))
-    )
-    payment_labels = [p['payment_method__name'] for p in payment_agg]
-    payment_totals = [p['total'] for p in payment_agg]
-
-    # --- Cups sold by time division (use Jakarta local times) ---
-    divisions = {
-        'Morning (09-11)': (time(9, 0), time(11, 0)),
-        'Lunch (11-13)': (time(11, 0), time(13, 0)),
-        'After Lunch (13-15)': (time(13, 0), time(15, 0)),
-        'Afternoon (15-18)': (time(15, 0), time(18, 0)),
-    }
-    division_labels = list(divisions.keys())
-    division_cups = []
-    for start_t, end_t in divisions.values():
-        count = 0
-        for item in order_items_qs:
-            local_time = item.order.created_at.astimezone(jakarta).time()
-            if start_t <= local_time < end_t:
-                count += item.quantity
-        division_cups.append(count)
-
-    # --- Average daily sales and cups ---
-    num_days = len(all_dates) if all_dates else 1  # avoid division by zero
-    average_daily_sales = sum(sales_data_rp) / num_days
-    total_sales =  sum(sales_data_rp)
-    average_daily_cups = sum(cups_data) / num_days
-    total_cups = sum(cups_data)
-    
-    # --- Menu ranking with percentage contribution ---
-    menu_total_cups = sum([m['total'] for m in menu_agg]) or 1  # avoid zero division
-    menu_ranking = []
-    for i, m in enumerate(menu_agg, start=1):
-        pct = (m['total'] / menu_total_cups) * 100
-        menu_ranking.append({
-            'rank': i,
-            'name': m['smoothie__name'],
-            'quantity': m['total'],
-            'percentage': round(pct, 1)  # one decimal place
-        })
-
-    # --- Payment ranking with percentage contribution ---
-    payment_total_tx = sum([p['total'] for p in payment_agg]) or 1
-    payment_ranking = []
-    for i, p in enumerate(payment_agg, start=1):
-        pct = (p['total'] / payment_total_tx) * 100
-        payment_ranking.append({
-            'rank': i,
-            'name': p['payment_method__name'],
-            'total': p['total'],
-            'percentage': round(pct, 1)
-        })
-
-
-    # --- JSON-encode lists for Chart.js usage in template ---
-    ctx = {
-        'menus': SmoothieMenu.objects.all(),
-        'selected_menus': menu_ids,
-        'sales_labels': json.dumps(sales_labels),
-        'sales_data_rp': json.dumps(sales_data_rp),
-        'cups_data': json.dumps(cups_data),
-        'menu_labels': json.dumps(menu_labels),
-        'menu_cups': json.dumps(menu_cups),
-        'payment_labels': json.dumps(payment_labels),
-        'payment_totals': json.dumps(payment_totals),
-        'division_labels': json.dumps(division_labels),
-        'division_cups': json.dumps(division_cups),
-        'time_division_selected': time_division or "",
-        'start_date': start_date or "",
-        'end_date': end_date or "",
-        'stores': Store.objects.all(),
-        'average_daily_sales': average_daily_sales,
-        'average_daily_cups': average_daily_cups,
-        'total_sales' : total_sales,
-        'total_cups' : total_cups,
-        'menu_ranking': menu_ranking,
-        'payment_ranking': payment_ranking
-    }
-    return render(request, 'analytics/dashboard.html', ctx)
+    async def stream():
+        for finished in asyncio.as_completed([compute(name) for name in names]):
+            name, data = await finished
+            yield json.dumps({'panel': name, 'data': data}, cls=DjangoJSONEncoder) + "\n"
+
+    return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+
+def compute_panel_in_thread(name, filters):
+    try:
+        return compute_panel(name, filters)
+    finally:
+        close_old_connections()
+
+
+@login_required
+@role_required('admin')
+def dashboard_cache_stats(request):
+    """Entries and hit ratio of this process's dashboard context cache."""
+    return JsonResponse(dashboard_cache.stats())
 
 
 
@@ -204,7 +140,7 @@ def operations_dashboard(request):
     """
     Operations dashboard:
     - Filters for orders: start_date, end_date, menu (list), time_division
-    - Independent stock snapshot date: stock_date (used only for stock cards, snapshot at 23:00 Jakarta)
+    - Independent stock snapshot date: stock_date (stock cards, fetched from the stock-cards panel)
     """
 
     # --- Parse filter inputs ---
@@ -219,158 +155,110 @@ def operations_dashboard(request):
     if stock_date is None:
         stock_date = datetime.now(JKT).date()
 
+    filters = {
+        'store_id': store_id,
+        'start_date': start_date,
+        'end_date': end_date,
+        'menu_ids': menu_ids,
+        'time_division': time_division,
+    }
+    context = dashboard_cache.get_or_compute(
+        'operations', filters, stores=[store_id], compute=lambda: operations_context(**filters),
+    )
+    context.update({
+        'stores': Store.objects.all(),
+        'menus': SmoothieMenu.objects.all(),
+        'selected_menus': menu_ids,
+        'start_date': start_date.isoformat() if start_date else "",
+        'end_date': end_date.isoformat() if end_date else "",
+        'time_division_selected': time_division or "",
+        'stock_date': stock_date.isoformat(),
+    })
+    return render(request, 'analytics/operations_dashboard.html', context)
+
+
+def operations_context(store_id, start_date, end_date, menu_ids, time_division):
+    """The operations dashboard's computed (cacheable) context for one filter set."""
     # --- Build base orders queryset based on DB filters (date & menu) ---
-     # --- Base queryset filtered by date & menu (DB-level) ---
     orders_qs = Order.objects.all()
 
     if store_id:                     # if user selects a store
         orders_qs = orders_qs.filter(store_id=store_id)
-    if start_date:
-        orders_qs = orders_qs.filter(created_at__date__gte=start_date)
-    if end_date:
-        orders_qs = orders_qs.filter(created_at__date__lte=end_date)
+    orders_qs = filter_local_dates(orders_qs, 'created_at', start_date, end_date)
     if menu_ids:
         orders_qs = orders_qs.filter(list_menu__id__in=menu_ids).distinct()
 
-    # evaluate to list for accurate Jakarta-local time filtering
-    orders_list = list(orders_qs.select_related('customer'))
+    # --- Time division filter, bucketed by the database on the Jakarta hour ---
+    if time_division in TIME_DIVISIONS:
+        orders_qs = annotate_division(orders_qs, 'created_at').filter(division=time_division)
 
-    # --- Apply time division filter in Python using Jakarta local time ---
-    if time_division:
-        time_ranges = {
-            'morning': (time(9, 0), time(11, 0)),
-            'lunch': (time(11, 0), time(13, 0)),
-            'after_lunch': (time(13, 0), time(15, 0)),
-            'afternoon': (time(15, 0), time(18, 0)),
-        }
-        if time_division in time_ranges:
-            start_t, end_t = time_ranges[time_division]
-            filtered = []
-            for o in orders_list:
-                try:
-                    local_dt = o.created_at.astimezone(JKT)
-                except Exception:
-                    # fallback: assume naive created_at is already Jakarta local
-                    local_dt = JKT.localize(o.created_at) if o.created_at.tzinfo is None else o.created_at
-                if start_t <= local_dt.time() < end_t:
-                    filtered.append(o)
-            orders_list = filtered
-
-    order_ids = [o.id for o in orders_list]
-
-    # --- KPI calculations (Jakarta local times) ---
-    ready_durations = []           # seconds: ready_at - created_at
-    served_from_ready = []         # seconds: served_at - ready_at
-    served_from_created = []       # seconds: served_at - created_at
-
-    for o in orders_list:
-        try:
-            created_local = o.created_at.astimezone(JKT)
-        except Exception:
-            created_local = JKT.localize(o.created_at) if o.created_at.tzinfo is None else o.created_at
-
-        if o.ready_at:
-            try:
-                ready_local = o.ready_at.astimezone(JKT)
-            except Exception:
-                ready_local = JKT.localize(o.ready_at) if o.ready_at.tzinfo is None else o.ready_at
-            ready_durations.append((ready_local - created_local).total_seconds())
-
-        if o.ready_at and o.served_at:
-            try:
-                ready_local = o.ready_at.astimezone(JKT)
-                served_local = o.served_at.astimezone(JKT)
-            except Exception:
-                ready_local = JKT.localize(o.ready_at) if o.ready_at.tzinfo is None else o.ready_at
-                served_local = JKT.localize(o.served_at) if o.served_at.tzinfo is None else o.served_at
-            served_from_ready.append((served_local - ready_local).total_seconds())
-
-        if o.served_at:
-            try:
-                served_local = o.served_at.astimezone(JKT)
-            except Exception:
-                served_local = JKT.localize(o.served_at) if o.served_at.tzinfo is None else o.served_at
-            served_from_created.append((served_local - created_local).total_seconds())
-
-    def avg_seconds(lst):
-        return (sum(lst) / len(lst)) if lst else 0
-
-    avg_ready_sec = avg_seconds(ready_durations)
-    avg_served_from_ready_sec = avg_seconds(served_from_ready)
-    avg_served_from_created_sec = avg_seconds(served_from_created)
+    # --- Service times: intervals computed by the database, streamed into sketches ---
+    stats = service_times(orders_qs)
+    summaries = {key: stats.overall[key].summary() for key in INTERVALS}
 
     def sec_to_minutes_display(sec):
         if not sec:
             return "—"
         return f"{(sec / 60.0):.2f} min"
 
-    avg_ready_display = sec_to_minutes_display(avg_ready_sec)
-    avg_served_from_ready_display = sec_to_minutes_display(avg_served_from_ready_sec)
-    avg_served_from_created_display = sec_to_minutes_display(avg_served_from_created_sec)
+    def minutes(sec):
+        return round(sec / 60.0, 2) if sec else 0
 
-    # numeric values in minutes for chart
-    duration_chart_labels = ["Ready from Created", "Served from Ready", "Served from Created"]
-    duration_chart_values = [
-        round(avg_ready_sec / 60.0, 2),
-        round(avg_served_from_ready_sec / 60.0, 2),
-        round(avg_served_from_created_sec / 60.0, 2),
+    service_time_kpis = [
+        {
+            'label': label,
+            'count': summaries[key]['count'],
+            **{stat: sec_to_minutes_display(summaries[key][stat]) for stat in ('avg', 'p50', 'p90', 'p99')},
+        }
+        for key, (label, _, _) in INTERVALS.items()
     ]
 
-    # --- Stock snapshot at stock_date 23:00 Jakarta (independent of order filters) ---
-    # compute snapshot datetime in Jakarta tz
-    snapshot_dt_naive = datetime.combine(stock_date, time(23, 0))
-    # make timezone-aware in JKT
-    try:
-        snapshot_dt = JKT.localize(snapshot_dt_naive)
-    except Exception:
-        snapshot_dt = snapshot_dt_naive.replace(tzinfo=JKT)
-
-    # We'll compute stock at snapshot by taking current ingredient.quantity_in_stock
-    # and subtract net of entries that occurred AFTER snapshot (i.e., future changes).
-    # This assumes StockEntry.quantity is always positive and reason determines sign.
-    add_reasons = {'manual_add', 'sale_cancellation'}
-    deduct_reasons = {'manual_deduct', 'sale_deduct'}
-
-    ingredient_cards = []
-    for ing in Ingredient.objects.filter(store=request.user.store).order_by('name'):
-        future_entries = StockEntry.objects.filter(ingredient=ing, timestamp__gt=snapshot_dt, store=request.user.store)
-        future_net = 0.0
-        for e in future_entries:
-            q = e.quantity or 0.0
-            if e.reason in add_reasons:
-                future_net += q
-            elif e.reason in deduct_reasons:
-                future_net -= q
-            else:
-                future_net += q  # default: treat as addition if unknown
-
-        # current stock minus future net changes gives stock at snapshot
-        stock_at_snapshot = ing.quantity_in_stock - future_net
-        ingredient_cards.append({
-            'id': ing.id,
-            'name': ing.name,
-            'unit': ing.unit,
-            'stock_at_snapshot': round(stock_at_snapshot, 3),
-        })
-
-    # --- Context for template ---
-    context = {
-        'stores': Store.objects.all(),
-        'menus': SmoothieMenu.objects.all(),
-        'selected_menus': menu_ids,
-        'start_date': start_date.isoformat() if start_date else "",
-        'end_date': end_date.isoformat() if end_date else "",
-        'time_division_selected': time_division or "",
-        'stock_date': stock_date.isoformat(),
+    # Where the end-to-end tail comes from: created → served per store, hour and weekday
+    store_names = dict(Store.objects.values_list('id', 'name'))
+    breakdown_labels = {
+        'store': lambda v: store_names.get(v, "No store"),
+        'hour': lambda v: f"{v:02d}:00",
+        'weekday': lambda v: WEEKDAYS[v - 1],
+    }
+    service_time_breakdowns = [
+        {
+            'title': title,
+            'rows': [
+                {
+                    'label': breakdown_labels[dimension](value),
+                    'count': summary['count'],
+                    **{f"p{pct}": sec_to_minutes_display(summary[f"p{pct}"]) for pct in PERCENTILES},
+                }
+                for value, summary in stats.breakdown(dimension, 'served')
+            ],
+        }
+        for dimension, title in (('store', "By store"), ('hour', "By hour (Jakarta)"), ('weekday', "By weekday"))
+    ]
+
+    # numeric values in minutes for charts
+    duration_chart_labels = [label for label, _, _ in INTERVALS.values()]
+    duration_chart_values = [minutes(summaries[key]['avg']) for key in INTERVALS]
+    duration_chart_percentiles = {
+        f"p{pct}": [minutes(summaries[key][f"p{pct}"]) for key in INTERVALS] for pct in PERCENTILES
+    }
+    histogram_bounds = stats.histograms['served'].bounds
+    duration_histogram_labels = (
+        [f"0-{histogram_bounds[0]}"]
+        + [f"{low}-{high}" for low, high in zip(histogram_bounds, histogram_bounds[1:])]
+        + [f"{histogram_bounds[-1]}+"]
+    )
+
+    return {
         # KPI displays
-        'avg_ready_display': avg_ready_display,
-        'avg_served_from_ready_display': avg_served_from_ready_display,
-        'avg_served_from_created_display': avg_served_from_created_display,
+        'avg_ready_display': service_time_kpis[0]['avg'],
+        'avg_served_from_ready_display': service_time_kpis[1]['avg'],
+        'avg_served_from_created_display': service_time_kpis[2]['avg'],
+        'service_time_kpis': service_time_kpis,
+        'service_time_breakdowns': service_time_breakdowns,
         # chart data (JSON-encoded)
         'duration_chart_labels': json.dumps(duration_chart_labels),
         'duration_chart_values': json.dumps(duration_chart_values),
-        # stock cards
-        'ingredient_cards': ingredient_cards,
+        'duration_chart_percentiles': json.dumps(duration_chart_percentiles),
+        'duration_histogram_labels': json.dumps(duration_histogram_labels),
+        'duration_histogram': json.dumps({key: stats.histograms[key].counts for key in INTERVALS}),
     }
-
-    return render(request, 'analytics/operations_dashboard.html', context)
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+Drive every named URL of the project through the test client and measure
+latency, query count and peak Python memory per view.
+"""
+import time
+import tracemalloc
+
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from customers.models import Customer
+from employee.models import Attendance, Payroll
+from inventory.models import Ingredient, SmoothieIngredient, SmoothieMenu, StockEntry
+from sales.models import Order
+
+# URL names that can't be fetched as a plain page
+SKIP = {
+    'logout': "ends the benchmark session",
+    'order_events': "event stream never finishes",
+    'analytics_panels': "streamed async response; each panel is measured through analytics_panel",
+}
+
+# Fixed URL arguments that aren't model ids
+URL_ARG_VALUES = {
+    'analytics_panel': {'name': 'daily-sales'},
+}
+
+# Model providing the sample object for each URL argument
+URL_ARG_MODELS = {
+    'customer_detail': Customer, 'edit_customer': Customer, 'delete_customer': Customer,
+    'attendance_detail': Attendance, 'check_out': Attendance,
+    'payroll_detail': Payroll, 'pay_salary': Payroll,
+    'stockentry_edit': StockEntry, 'stockentry_delete': StockEntry,
+    'ingredient_update': Ingredient, 'ingredient_delete': Ingredient,
+    'smoothie_detail': SmoothieMenu, 'smoothie_menu_delete': SmoothieMenu,
+    'add_smoothie_ingredient': SmoothieMenu,
+    'edit_smoothie_ingredient': SmoothieIngredient, 'delete_smoothie_ingredient': SmoothieIngredient,
+}
+DEFAULT_ARG_MODEL = Order
+
+
+def named_patterns(patterns=None, namespace=None):
+    """Yield (url name, pattern) for every named route outside the admin."""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace == 'admin':
+                continue
+            yield from named_patterns(pattern.url_patterns, pattern.namespace or namespace)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield (f"{namespace}:{pattern.name}" if namespace else pattern.name), pattern
+
+
+def sample_url(name, pattern):
+    """Reverse `name`, filling any arguments with the id of an existing row."""
+    arg_names = list(pattern.pattern.converters)
+    if not arg_names:
+        return reverse(name)
+    if name in URL_ARG_VALUES:
+        return reverse(name, kwargs=URL_ARG_VALUES[name])
+    model = URL_ARG_MODELS.get(name, DEFAULT_ARG_MODEL)
+    pk = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    if pk is None:
+        return None
+    return reverse(name, kwargs={arg: pk for arg in arg_names})
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+class QueryCounter:
+    """Execute wrapper counting queries (connection.queries is reset per request)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(client, url, repeat):
+    """Warm up once, time `repeat` GETs, then one traced run for peak memory."""
+    response = client.get(url)
+    timings = []
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    try:
+        client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': response.status_code,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'queries': counter.count // repeat,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(user, repeat=10, only=None):
+    """Benchmark every view (or the names in `only`) logged in as `user`."""
+    client = Client()
+    client.force_login(user)
+    results = []
+    for name, pattern in named_patterns():
+        if only and name not in only:
+            continue
+        row = {'name': name}
+        url = None if name in SKIP else sample_url(name, pattern)
+        if name in SKIP:
+            row['skipped'] = SKIP[name]
+        elif url is None:
+            row['skipped'] = "no sample row for the URL argument"
+        else:
+            row['path'] = url
+            try:
+                # a savepoint per view, so one failing page can't poison the rest
+                with transaction.atomic():
+                    row.update(measure(client, url, repeat))
+            except Exception as exc:
+                row['error'] = f"{type(exc).__name__}: {exc}"
+        results.append(row)
+    return results
@@ -0,0 +1,60 @@
+"""
+Per-store data version counters. Writers bump the version of every store
+they touched; readers put the version in their cache keys, so anything
+cached from older data simply stops matching.
+
+The counters are DataVersion rows, so every worker process (and every
+serverless instance) sees the same versions: a write handled by one of
+them invalidates what the others cached. A bump is one UPDATE with F().
+
+Every bump also moves the ALL_STORES version, which cross-store readers use.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .models import DataVersion
+
+ALL_STORES = 'all'
+KEY = 'data-version:{}'
+
+
+def _key(store_id):
+    return KEY.format(store_id or ALL_STORES)
+
+
+def read_versions(keys):
+    """{key: version} for these counter keys in one query; counters never bumped read 0."""
+    keys = set(keys)
+    versions = dict(DataVersion.objects.filter(key__in=keys).values_list('key', 'version'))
+    return {key: versions.get(key, 0) for key in keys}
+
+
+def bump_versions(keys):
+    """Increment these counters now (inside the caller's transaction, if any)."""
+    keys = set(keys)
+    if DataVersion.objects.filter(key__in=keys).update(version=F('version') + 1) < len(keys):
+        # First bump of some key: create the missing rows, then bump them too
+        DataVersion.objects.bulk_create([DataVersion(key=key) for key in keys], ignore_conflicts=True)
+        DataVersion.objects.filter(key__in=keys).update(version=F('version') + 1)
+
+
+def data_version(store_id):
+    """Current version for a store id (None or '' for all stores)."""
+    return data_versions([store_id])[store_id]
+
+
+def data_versions(store_ids):
+    """{store_id: version} for several stores in one query."""
+    keys = {store_id: _key(store_id) for store_id in store_ids}
+    versions = read_versions(keys.values())
+    return {store_id: versions[key] for store_id, key in keys.items()}
+
+
+def _bump_now(store_ids):
+    bump_versions({_key(store_id) for store_id in store_ids} | {_key(ALL_STORES)})
+
+
+def bump_data_version(*store_ids):
+    """Bump these stores (and ALL_STORES) once the current transaction commits."""
+    store_ids = set(store_ids)
+    transaction.on_commit(lambda: _bump_now(store_ids))
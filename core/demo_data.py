@@ -0,0 +1,246 @@
+"""
+Seeded synthetic data for load testing: stores, per-store menus with
+recipes, customers, months of orders with a lunch peak, the matching
+stock ledger, staff and attendance.
+
+Rows are bulk-inserted directly, so afterwards the derived tables are
+rebuilt (sales rollup, demand heatmap) and ingredient balances are set
+from the ledger.
+"""
+import random
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from analytics.heatmap import rebuild as rebuild_heatmap
+from analytics.rollup import rebuild as rebuild_rollup
+from customers.models import Customer
+from employee.models import Attendance, Employee
+from inventory.availability import rebuild as rebuild_availability
+from inventory.models import Ingredient, SmoothieIngredient, SmoothieMenu, StockEntry
+from inventory.recipes import recipe_cache
+from sales.models import Order, OrderItem, PaymentMethod
+from .models import Store
+from .utils import JAKARTA
+
+INGREDIENTS = [
+    ('Mango', 'gram'), ('Banana', 'gram'), ('Strawberry', 'gram'), ('Avocado', 'gram'),
+    ('Dragon Fruit', 'gram'), ('Pineapple', 'gram'), ('Spinach', 'gram'), ('Blueberry', 'gram'),
+    ('Milk', 'ml'), ('Yogurt', 'ml'), ('Honey', 'ml'), ('Ice', 'gram'), ('Cup', 'pcs'),
+]
+SMOOTHIES = [
+    ('Mango Blast', 18000), ('Berry Mix', 22000), ('Green Detox', 20000), ('Avocado Cream', 25000),
+    ('Tropical Sunrise', 20000), ('Banana Shake', 15000), ('Dragon Glow', 23000), ('Blue Breeze', 24000),
+    ('Pineapple Punch', 17000), ('Strawberry Yogurt', 21000),
+]
+PAYMENT_METHODS = ['Cash', 'QRIS', 'Debit']
+
+# Relative order volume per Jakarta opening hour: lunch peak, smaller afternoon bump
+HOUR_WEIGHTS = {
+    8: 2, 9: 4, 10: 6, 11: 12, 12: 14, 13: 9, 14: 6, 15: 7, 16: 8, 17: 6, 18: 4, 19: 3, 20: 2,
+}
+# Monday .. Sunday
+WEEKDAY_FACTOR = [0.85, 0.9, 0.9, 0.95, 1.1, 1.3, 1.2]
+
+BATCH_SIZE = 5000
+
+
+@contextmanager
+def explicit_timestamps(model, field_name):
+    """Let bulk_create keep the given value of an auto_now_add field."""
+    field = model._meta.get_field(field_name)
+    saved = field.auto_now_add
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = saved
+
+
+def local_datetime(day, hour, minute, second=0):
+    return JAKARTA.localize(datetime.combine(day, time(hour, minute, second)))
+
+
+def generate(stores=2, months=3, orders_per_day=150, customers=300, staff_per_store=4, seed=42, end_date=None):
+    """
+    Create the dataset and return the number of rows written per model.
+    `end_date` (default: yesterday in Jakarta) is the last day with orders.
+    """
+    rng = random.Random(seed)
+    end_date = end_date or timezone.now().astimezone(JAKARTA).date() - timedelta(days=1)
+    start_date = end_date - timedelta(days=30 * months - 1)
+    counts = defaultdict(int)
+
+    with transaction.atomic():
+        payment_ids = [PaymentMethod.objects.get_or_create(name=name)[0].id for name in PAYMENT_METHODS]
+        customer_ids = _customers(rng, customers, seed)
+        counts['customer'] = len(customer_ids)
+
+        store_objs = Store.objects.bulk_create([
+            Store(name=f"Demo Store {seed}-{i + 1}", type='kiosk') for i in range(stores)
+        ])
+        counts['store'] = len(store_objs)
+
+        balances = {}
+        for store in store_objs:
+            menu = _menu(rng, store, counts)
+            ledger = []
+            _orders(rng, store, menu, payment_ids, customer_ids, start_date, end_date,
+                    orders_per_day, ledger, counts)
+            balances.update(_write_ledger(ledger, counts))
+            _attendance(rng, store, staff_per_store, start_date, end_date, counts)
+
+        for ingredient_id, quantity in balances.items():
+            Ingredient.objects.filter(pk=ingredient_id).update(quantity_in_stock=round(quantity, 3))
+
+        counts['sales_rollup'] = rebuild_rollup()
+        counts['demand_heatmap'] = rebuild_heatmap()
+
+    recipe_cache.invalidate()
+    counts['menu_availability'] = rebuild_availability()
+    return dict(counts)
+
+
+def _customers(rng, count, seed):
+    phones = [f"08{seed % 100:02d}{n:08d}" for n in rng.sample(range(10 ** 8), count)]
+    Customer.objects.bulk_create(
+        [Customer(name=f"Customer {i + 1}", phone=phone) for i, phone in enumerate(phones)],
+        ignore_conflicts=True,
+    )
+    return list(Customer.objects.filter(phone__in=phones).values_list('id', flat=True))
+
+
+def _menu(rng, store, counts):
+    """Ingredients and smoothies of one store: [(smoothie, [(ingredient_id, amount)])]."""
+    ingredients = Ingredient.objects.bulk_create([
+        Ingredient(
+            store=store, name=name, unit=unit, low_stock_threshold=500 if unit != 'pcs' else 50,
+            ledger_opened_at=timezone.now(),
+        )
+        for name, unit in INGREDIENTS
+    ])
+    by_name = {ing.name: ing for ing in ingredients}
+    fruits = [ing for ing in ingredients if ing.unit == 'gram' and ing.name != 'Ice']
+
+    smoothies = SmoothieMenu.objects.bulk_create([SmoothieMenu(name=name, price=price) for name, price in SMOOTHIES])
+    SmoothieMenu.stores.through.objects.bulk_create([
+        SmoothieMenu.stores.through(smoothiemenu_id=smoothie.id, store_id=store.id) for smoothie in smoothies
+    ])
+
+    menu, lines = [], []
+    for smoothie in smoothies:
+        recipe = [(fruit.id, float(rng.choice([80, 100, 120, 150]))) for fruit in rng.sample(fruits, rng.randint(1, 3))]
+        recipe.append((rng.choice([by_name['Milk'], by_name['Yogurt']]).id, float(rng.choice([100, 150, 200]))))
+        recipe += [(by_name['Ice'].id, 100.0), (by_name['Cup'].id, 1.0)]
+        lines += [SmoothieIngredient(smoothie=smoothie, ingredient_id=ing_id, amount=amount) for ing_id, amount in recipe]
+        menu.append((smoothie, recipe))
+    SmoothieIngredient.objects.bulk_create(lines)
+
+    counts['ingredient'] += len(ingredients)
+    counts['smoothie'] += len(smoothies)
+    counts['recipe_line'] += len(lines)
+    return menu
+
+
+def _orders(rng, store, menu, payment_ids, customer_ids, start_date, end_date, orders_per_day, ledger, counts):
+    """Insert the store's orders day by day; appends (timestamp, ingredient_id, delta) to `ledger`."""
+    hours = list(HOUR_WEIGHTS)
+    hour_weights = list(HOUR_WEIGHTS.values())
+    popularity = [rng.uniform(0.5, 2.0) for _ in menu]
+    pending = []
+
+    day = start_date
+    while day <= end_date:
+        expected = orders_per_day * WEEKDAY_FACTOR[day.weekday()] * rng.uniform(0.8, 1.2)
+        for hour in rng.choices(hours, hour_weights, k=int(expected)):
+            created_at = local_datetime(day, hour, rng.randrange(60), rng.randrange(60))
+            ready_at = created_at + timedelta(seconds=rng.gammavariate(3, 80))
+            served_at = ready_at + timedelta(seconds=rng.gammavariate(2, 45))
+            cart = {}
+            for index in rng.choices(range(len(menu)), popularity, k=rng.choice([1, 1, 1, 2, 2, 3])):
+                cart[index] = cart.get(index, 0) + rng.choice([1, 1, 1, 2])
+            order = Order(
+                store=store,
+                name="Guest",
+                customer_id=rng.choice(customer_ids) if customer_ids and rng.random() < 0.3 else None,
+                payment_method_id=rng.choice(payment_ids),
+                total_price=sum(int(menu[i][0].price) * qty for i, qty in cart.items()),
+                is_ready=True, is_served=True,
+                created_at=created_at, ready_at=ready_at, served_at=served_at,
+            )
+            pending.append((order, cart))
+            for index, qty in cart.items():
+                for ingredient_id, amount in menu[index][1]:
+                    ledger.append((created_at, ingredient_id, -qty * amount))
+
+        if len(pending) >= BATCH_SIZE:
+            _flush_orders(pending, menu, counts)
+        day += timedelta(days=1)
+    _flush_orders(pending, menu, counts)
+
+
+def _flush_orders(pending, menu, counts):
+    if not pending:
+        return
+    orders = Order.objects.bulk_create([order for order, _ in pending], batch_size=1000)
+    items = [
+        OrderItem(order=order, smoothie=menu[index][0], quantity=qty, unit_price=int(menu[index][0].price))
+        for order, (_, cart) in zip(orders, pending)
+        for index, qty in cart.items()
+    ]
+    OrderItem.objects.bulk_create(items, batch_size=2000)
+    counts['order'] += len(orders)
+    counts['order_item'] += len(items)
+    pending.clear()
+
+
+def _write_ledger(ledger, counts):
+    """
+    Write sale deductions plus a morning restock whenever an ingredient would
+    run low, so balances stay positive. Returns the final balance per ingredient.
+    """
+    ledger.sort(key=lambda row: row[0])
+    balance = defaultdict(float)
+    entries = []
+    with explicit_timestamps(StockEntry, 'timestamp'):
+        for timestamp, ingredient_id, delta in ledger:
+            if balance[ingredient_id] + delta < 0:
+                restock = round(-delta * 400, -2)
+                restock_at = JAKARTA.normalize(timestamp.replace(hour=7, minute=0, second=0))
+                balance[ingredient_id] += restock
+                entries.append(StockEntry(ingredient_id=ingredient_id, quantity=restock,
+                                          reason='manual_add', timestamp=restock_at))
+            balance[ingredient_id] += delta
+            entries.append(StockEntry(ingredient_id=ingredient_id, quantity=delta,
+                                      reason='sale_deduct', timestamp=timestamp))
+            if len(entries) >= BATCH_SIZE:
+                StockEntry.objects.bulk_create(entries)
+                counts['stock_entry'] += len(entries)
+                entries = []
+        StockEntry.objects.bulk_create(entries)
+        counts['stock_entry'] += len(entries)
+    return balance
+
+
+def _attendance(rng, store, staff_per_store, start_date, end_date, counts):
+    staff = Employee.objects.bulk_create([
+        Employee(name=f"{store.name} Staff {i + 1}", daily_salary=rng.choice([90000, 100000, 120000]))
+        for i in range(staff_per_store)
+    ])
+    rows = []
+    day = start_date
+    while day <= end_date:
+        for employee in staff:
+            if rng.random() < 0.8:
+                check_in = local_datetime(day, rng.choice([7, 8]), rng.randrange(60))
+                rows.append(Attendance(
+                    employee=employee, store=store, check_in=check_in,
+                    check_out=check_in + timedelta(hours=rng.uniform(4.5, 10)),
+                ))
+        day += timedelta(days=1)
+    Attendance.objects.bulk_create(rows, batch_size=2000)
+    counts['employee'] += len(staff)
+    counts['attendance'] += len(rows)
@@ -0,0 +1,138 @@
+"""
+Per-store pub/sub for live screens (order board, kitchen, stock alerts).
+
+Writers call ``publish_event`` from ordinary sync code; the message goes out
+once the surrounding transaction commits. Async views consume it with
+``get_broker().subscribe(store_id)``.
+
+``LocalBroker`` only reaches subscribers in the same process, which is all a
+single ASGI worker (or the test suite) needs. For several workers, point
+``settings.EVENT_BROKER`` at ``core.events.PostgresBroker`` so every process
+hears every event through LISTEN/NOTIFY.
+"""
+import asyncio
+import json
+import select
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+ALL_STORES = None
+
+
+class LocalBroker:
+    """In-process fan-out to asyncio queues, safe to publish from any thread."""
+
+    queue_size = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)  # store_id -> {(loop, queue)}
+
+    def publish(self, store_id, event, data):
+        self._fan_out({'store': store_id, 'event': event, 'data': data})
+
+    def _fan_out(self, message):
+        with self._lock:
+            targets = list(self._subscribers[message['store']] | self._subscribers[ALL_STORES])
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                # the subscriber's loop is gone; its finally block never ran
+                self._unsubscribe(message['store'], (loop, queue))
+
+    @staticmethod
+    def _offer(queue, message):
+        if queue.full():
+            queue.get_nowait()  # a slow screen loses its oldest event, not the newest
+        queue.put_nowait(message)
+
+    def _unsubscribe(self, store_id, subscriber):
+        with self._lock:
+            self._subscribers[store_id].discard(subscriber)
+
+    async def subscribe(self, store_id, heartbeat=None):
+        """
+        Yield messages for `store_id` (or every store when it is None). With a
+        heartbeat, yields None after that many idle seconds so the caller can
+        keep the connection open.
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._subscribers[store_id].add(subscriber)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber[1].get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._unsubscribe(store_id, subscriber)
+
+
+class PostgresBroker(LocalBroker):
+    """
+    Cross-process broker on PostgreSQL LISTEN/NOTIFY. Publishing sends a
+    NOTIFY; a listener thread in each process hands what it hears to the
+    local subscribers, including the process that published it.
+    """
+
+    channel = 'shooties_events'
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, store_id, event, data):
+        payload = json.dumps({'store': store_id, 'event': event, 'data': data})
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, payload])
+
+    async def subscribe(self, store_id, heartbeat=None):
+        self._ensure_listener()
+        async for message in super().subscribe(store_id, heartbeat):
+            yield message
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        import psycopg2
+
+        db = settings.DATABASES['default']
+        conn = psycopg2.connect(
+            dbname=db['NAME'], user=db['USER'], password=db['PASSWORD'],
+            host=db['HOST'], port=db['PORT'], **db.get('OPTIONS', {})
+        )
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        while True:
+            if select.select([conn], [], [], 60) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self._fan_out(json.loads(notify.payload))
+
+
+@lru_cache(maxsize=None)
+def _load_broker(path):
+    return import_string(path)()
+
+
+def get_broker():
+    return _load_broker(getattr(settings, 'EVENT_BROKER', 'core.events.LocalBroker'))
+
+
+def publish_event(store_id, event, **data):
+    """Publish after the current transaction commits (immediately outside one)."""
+    transaction.on_commit(lambda: get_broker().publish(store_id, event, data))
@@ -0,0 +1,77 @@
+import json
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.benchmark import run
+from core.demo_data import generate
+from core.models import Store, User
+from inventory.models import StockEntry
+from sales.models import Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Report p50/p95 latency, query count and peak memory for every view. "
+        "Runs inside a transaction that is rolled back, so the database is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months', type=int, nargs='+',
+            help="Benchmark freshly generated datasets of these sizes instead of the current data.",
+        )
+        parser.add_argument('--stores', type=int, default=2)
+        parser.add_argument('--orders-per-day', type=int, default=150)
+        parser.add_argument('--repeat', type=int, default=10, help="Timed requests per view.")
+        parser.add_argument('--view', action='append', dest='views', help="Only this URL name (repeatable).")
+        parser.add_argument('--json', dest='json_path', help="Write the results to this file ('-' for stdout).")
+
+    def handle(self, *args, **options):
+        sizes = options['months'] or [None]
+        report = {'generated_at': timezone.now().isoformat(), 'repeat': options['repeat'], 'runs': []}
+
+        for months in sizes:
+            with override_settings(ALLOWED_HOSTS=['*']), transaction.atomic():
+                if months:
+                    generate(stores=options['stores'], months=months, orders_per_day=options['orders_per_day'])
+                user = User.objects.create_user(
+                    f"benchmark-{uuid.uuid4().hex[:8]}", role='admin', store=Store.objects.first(),
+                )
+                run_report = {
+                    'months': months,
+                    'rows': {
+                        'order': Order.objects.count(),
+                        'order_item': OrderItem.objects.count(),
+                        'stock_entry': StockEntry.objects.count(),
+                    },
+                    'views': run(user, repeat=options['repeat'], only=options['views']),
+                }
+                transaction.set_rollback(True)
+            report['runs'].append(run_report)
+            if options['json_path'] != '-':
+                self.print_run(run_report)
+
+        if options['json_path'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+        elif options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['json_path']}"))
+
+    def print_run(self, run_report):
+        label = f"{run_report['months']} months generated" if run_report['months'] else "current data"
+        rows = ", ".join(f"{name}={count}" for name, count in run_report['rows'].items())
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{label} ({rows})"))
+        self.stdout.write(f"{'view':<28} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KB':>9}")
+        for row in run_report['views']:
+            if 'skipped' in row or 'error' in row:
+                self.stdout.write(f"{row['name']:<28} {row.get('skipped') or row['error']}")
+                continue
+            self.stdout.write(
+                f"{row['name']:<28} {row['status']:>6} {row['p50_ms']:>9} {row['p95_ms']:>9} "
+                f"{row['queries']:>8} {row['peak_kb']:>9}"
+            )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core.demo_data import generate
+
+
+class Command(BaseCommand):
+    help = "Generate a seeded synthetic dataset (stores, menus, orders, stock ledger, attendance)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=2)
+        parser.add_argument('--months', type=int, default=3, help="Months of order history, ending yesterday.")
+        parser.add_argument('--orders-per-day', type=int, default=150, help="Average orders per store per day.")
+        parser.add_argument('--customers', type=int, default=300)
+        parser.add_argument('--staff-per-store', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        counts = generate(
+            stores=options['stores'],
+            months=options['months'],
+            orders_per_day=options['orders_per_day'],
+            customers=options['customers'],
+            staff_per_store=options['staff_per_store'],
+            seed=options['seed'],
+        )
+        for model, count in counts.items():
+            self.stdout.write(f"{model:>14}: {count}")
+        self.stdout.write(self.style.SUCCESS("Demo data generated."))
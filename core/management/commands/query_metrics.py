@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.metrics import collected_metrics, reset_metrics
+
+
+class Command(BaseCommand):
+    help = "Show the per-view query/timing metrics reported by QueryMetricsMiddleware."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help="Print the raw summaries as JSON.")
+        parser.add_argument('--sort', default='sql_ms', choices=['queries', 'sql_ms', 'template_ms', 'total_ms'],
+                            help="Order views by this metric's p95 (default: sql_ms).")
+        parser.add_argument('--reset', action='store_true', help="Clear the collected metrics afterwards.")
+
+    def handle(self, *args, **options):
+        metrics = collected_metrics()
+        if options['json']:
+            self.stdout.write(json.dumps(metrics, indent=2))
+        elif not metrics:
+            self.stdout.write("No metrics yet. Is QUERY_METRICS enabled (and createcachetable run)?")
+        else:
+            self.stdout.write(
+                f"{'view':<32} {'reqs':>6} {'q p95':>6} {'sql p95':>8} {'tpl p95':>8} {'total p95':>10}  dup"
+            )
+            ranked = sorted(metrics.items(), key=lambda kv: -kv[1][options['sort']]['p95'])
+            for name, row in ranked:
+                self.stdout.write(
+                    f"{name:<32} {row['requests']:>6} {row['queries']['p95']:>6} {row['sql_ms']['p95']:>8} "
+                    f"{row['template_ms']['p95']:>8} {row['total_ms']['p95']:>10}  {len(row['duplicate_queries'])}"
+                )
+                for dup in row['duplicate_queries'][:3]:
+                    self.stdout.write(f"    repeated in {dup['requests']} requests: {dup['sql'][:120]}")
+        if options['reset']:
+            reset_metrics()
@@ -0,0 +1,282 @@
+"""
+Sampled per-view request metrics: SQL query count and time, template render
+time, total wall time and repeated-query signatures (N+1 suspects).
+
+Enable by adding ``core.metrics.QueryMetricsMiddleware`` to MIDDLEWARE (the
+QUERY_METRICS env switch in settings does this). ``QUERY_METRICS_SAMPLE_RATE``
+is the fraction of requests measured; unsampled requests cost one random()
+call. Everything is kept in fixed-bucket histograms, so memory stays bounded
+however long the process runs.
+
+Each process periodically copies its numbers into the ``metrics`` cache
+alias, which is database-backed so every worker, serverless instance and
+``manage.py`` process shares it (``manage.py createcachetable`` creates its
+table). The admin endpoint and ``manage.py query_metrics`` merge those
+copies.
+"""
+import os
+import random
+import re
+import socket
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.template.base import Template
+
+TIME_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000)
+MAX_SIGNATURES = 20  # repeated-query signatures kept per view
+FLUSH_SECONDS = 30
+CACHE_ALIAS = 'metrics'
+CACHE_PREFIX = 'querymetrics:'
+CACHE_INDEX_KEY = 'querymetrics:processes'
+CACHE_TIMEOUT = 6 * 3600
+
+_render_timer = ContextVar('render_timer', default=None)
+
+
+class Histogram:
+    """Counts per fixed upper bound (plus overflow), with count, sum and max."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile."""
+        if not self.count:
+            return 0
+        target = self.count * pct / 100
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def merge(self, data):
+        self.counts = [a + b for a, b in zip(self.counts, data['counts'])]
+        self.count += data['count']
+        self.total += data['total']
+        self.max = max(self.max, data['max'])
+
+    def to_dict(self):
+        return {'counts': self.counts, 'count': self.count, 'total': self.total, 'max': self.max}
+
+    def summary(self):
+        return {
+            'avg': round(self.total / self.count, 2) if self.count else 0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'max': round(self.max, 2),
+        }
+
+
+class ViewMetrics:
+    fields = {
+        'queries': QUERY_BUCKETS,
+        'sql_ms': TIME_BUCKETS_MS,
+        'template_ms': TIME_BUCKETS_MS,
+        'total_ms': TIME_BUCKETS_MS,
+    }
+
+    def __init__(self):
+        self.histograms = {name: Histogram(bounds) for name, bounds in self.fields.items()}
+        self.duplicates = Counter()  # signature -> requests that repeated it
+
+    def add_duplicates(self, signatures):
+        for signature in signatures:
+            if signature not in self.duplicates and len(self.duplicates) >= MAX_SIGNATURES:
+                # make room by dropping the rarest signature
+                del self.duplicates[min(self.duplicates, key=self.duplicates.get)]
+            self.duplicates[signature] += 1
+
+    def merge(self, data):
+        for name, hist in data['histograms'].items():
+            self.histograms[name].merge(hist)
+        for signature, n in data['duplicates'].items():
+            self.duplicates[signature] += n
+
+    def to_dict(self):
+        return {
+            'histograms': {name: hist.to_dict() for name, hist in self.histograms.items()},
+            'duplicates': dict(self.duplicates),
+        }
+
+    def summary(self):
+        return {
+            'requests': self.histograms['total_ms'].count,
+            **{name: hist.summary() for name, hist in self.histograms.items()},
+            'duplicate_queries': [
+                {'sql': sql, 'requests': n} for sql, n in self.duplicates.most_common(MAX_SIGNATURES)
+            ],
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.views = {}
+        self.last_flush = time.monotonic()
+
+    def record(self, view_name, queries, sql_ms, template_ms, total_ms, duplicates):
+        with self._lock:
+            metrics = self.views.get(view_name)
+            if metrics is None:
+                metrics = self.views[view_name] = ViewMetrics()
+            metrics.histograms['queries'].add(queries)
+            metrics.histograms['sql_ms'].add(sql_ms)
+            metrics.histograms['template_ms'].add(template_ms)
+            metrics.histograms['total_ms'].add(total_ms)
+            metrics.add_duplicates(duplicates)
+
+    def to_dict(self):
+        with self._lock:
+            return {name: metrics.to_dict() for name, metrics in self.views.items()}
+
+    def reset(self):
+        with self._lock:
+            self.views.clear()
+
+    def flush(self):
+        """Copy this process's numbers into the shared cache."""
+        self.last_flush = time.monotonic()
+        cache = caches[CACHE_ALIAS]
+        # pids repeat across hosts and containers
+        key = f"{CACHE_PREFIX}{socket.gethostname()}:{os.getpid()}"
+        cache.set(key, self.to_dict(), CACHE_TIMEOUT)
+        # Checked on every flush, so a key lost to a concurrent index write comes back next time
+        processes = cache.get(CACHE_INDEX_KEY) or []
+        if key not in processes:
+            cache.set(CACHE_INDEX_KEY, processes + [key], CACHE_TIMEOUT)
+
+    def flush_due(self):
+        return time.monotonic() - self.last_flush > FLUSH_SECONDS
+
+
+registry = MetricsRegistry()
+
+
+def collected_metrics():
+    """Per-view summaries merged over every process that reported to the cache."""
+    registry.flush()
+    cache = caches[CACHE_ALIAS]
+    keys = cache.get(CACHE_INDEX_KEY) or []
+    merged = {}
+    for snapshot in cache.get_many(keys).values():
+        for view_name, data in snapshot.items():
+            merged.setdefault(view_name, ViewMetrics()).merge(data)
+    return {name: metrics.summary() for name, metrics in sorted(merged.items())}
+
+
+def reset_metrics():
+    registry.reset()
+    cache = caches[CACHE_ALIAS]
+    keys = cache.get(CACHE_INDEX_KEY) or []
+    cache.delete_many(keys + [CACHE_INDEX_KEY])
+
+
+_literal_lists = re.compile(r"\((?:%s|\?)(?:,\s*(?:%s|\?))*\)")
+
+
+def query_signature(sql):
+    """SQL with IN-lists collapsed, so the same query with other ids matches."""
+    return _literal_lists.sub('(...)', sql)
+
+
+class _QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.signatures[query_signature(sql)] += 1
+
+
+class _RenderTimer:
+    def __init__(self):
+        self.seconds = 0.0
+        self.active = False
+
+
+def _instrument_templates():
+    """Time top-level Template.render calls while a request is being sampled."""
+    if getattr(Template.render, 'metrics_timed', False):
+        return
+    original = Template.render
+
+    def render(self, context):
+        timer = _render_timer.get()
+        if timer is None or timer.active:  # not sampled, or an {% include %} inside a timed render
+            return original(self, context)
+        timer.active = True
+        started = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            timer.seconds += time.perf_counter() - started
+            timer.active = False
+
+    render.metrics_timed = True
+    Template.render = render
+
+
+class QueryMetricsMiddleware:
+    """
+    Measure a sample of requests per resolved URL name. SQL issued while a
+    template renders (lazy querysets) counts towards both SQL and render time.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'QUERY_METRICS_SAMPLE_RATE', 0.05)
+        _instrument_templates()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = _QueryRecorder()
+        timer = _RenderTimer()
+        token = _render_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        finally:
+            _render_timer.reset(token)
+
+        match = getattr(request, 'resolver_match', None)
+        registry.record(
+            match.view_name if match else '<unresolved>',
+            queries=recorder.count,
+            sql_ms=recorder.seconds * 1000,
+            template_ms=timer.seconds * 1000,
+            total_ms=(time.perf_counter() - started) * 1000,
+            duplicates=[sql for sql, n in recorder.signatures.items() if n > 1],
+        )
+        if registry.flush_due():
+            registry.flush()
+        return response
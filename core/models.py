@@ -27,4 +27,12 @@ class User(AbstractUser):
 
     def __str__(self):
         return f"{self.username} ({self.role})"
-    
\ No newline at end of file
+    
+
+class DataVersion(models.Model):
+    """A named counter bumped on every write to the data it stands for (see core.data_versions)."""
+    key = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
@@ -0,0 +1,55 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(moment, pk):
+    return f"{moment.isoformat()}_{pk}"
+
+
+def decode_cursor(cursor):
+    """Return (datetime, pk) or None for a malformed cursor."""
+    try:
+        moment, pk = cursor.rsplit('_', 1)
+        moment = parse_datetime(moment.replace(' ', '+'))  # '+' arrives as a space in query strings
+        return (moment, int(pk)) if moment else None
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, time_field, cursor=None, per_page=50):
+    """
+    Newest-first page of `queryset` ordered by (time_field, id), starting
+    after `cursor`. Unlike OFFSET, the cost of a page does not grow with how
+    deep into history it is, as long as (…, time_field) is indexed.
+    """
+    queryset = queryset.order_by(f'-{time_field}', '-id')
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        moment, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{time_field}__lt': moment}) | Q(**{time_field: moment, 'id__lt': pk})
+        )
+
+    items = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, time_field), last.pk)
+    return KeysetPage(items, next_cursor)
@@ -0,0 +1,61 @@
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+class Echo:
+    """File-like object whose write() hands the line back to csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(keys, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(keys, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+def gzip_chunks(lines, chunk_size=64 * 1024):
+    """
+    Gzip a stream of text lines on the fly, yielding compressed chunks of
+    about `chunk_size` input bytes; memory stays flat however long it runs.
+    """
+    compressor = zlib.compressobj(wbits=31)  # 31: gzip header and trailer
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            chunk = compressor.compress(b''.join(buffer))
+            buffer, size = [], 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b''.join(buffer)) + compressor.flush()
+
+
+def export_response(fmt, filename, header, rows, compress=False):
+    """
+    Stream `rows` (any iterable, ideally a queryset .iterator()) as CSV or
+    NDJSON without building the file in memory; `compress` gzips it as a
+    .gz download.
+    """
+    if fmt == 'ndjson':
+        lines, content_type, filename = ndjson_lines(header, rows), 'application/x-ndjson', f"{filename}.ndjson"
+    else:
+        lines, content_type, filename = csv_lines(header, rows), 'text/csv', f"{filename}.csv"
+    if compress:
+        lines, content_type, filename = gzip_chunks(lines), 'application/gzip', f"{filename}.gz"
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -1,3 +1,250 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+from datetime import date, datetime, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from analytics.rollup import find_drift
+from employee.models import Attendance, Employee
+from inventory.models import Ingredient
+from inventory.snapshot import stock_snapshot
+from sales.board import build_board, pending_summary
+from sales.models import Order, OrderItem, PaymentMethod
+from sales.services import place_order
+from sales.tests import make_menu
+from .demo_data import generate
+from .events import LocalBroker, get_broker, publish_event
+from .metrics import CACHE_ALIAS, Histogram, MetricsRegistry, collected_metrics, query_signature, reset_metrics
+from .models import Store, User
+from .utils import JAKARTA, filter_local_dates
+
+
+class RecordingBroker(LocalBroker):
+    published = []
+
+    def publish(self, store_id, event, data):
+        self.published.append((store_id, event, data))
+
+
+class LocalBrokerTests(SimpleTestCase):
+    def receive_one(self, subscribe_to, publish):
+        broker = LocalBroker()
+
+        async def scenario():
+            messages = broker.subscribe(subscribe_to)
+            first = asyncio.ensure_future(messages.__anext__())
+            await asyncio.sleep(0)  # let the subscription register
+            thread = threading.Thread(target=publish, args=(broker,))
+            thread.start()
+            thread.join()
+            try:
+                return await asyncio.wait_for(first, 1)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                await messages.aclose()
+
+        return asyncio.run(scenario())
+
+    def test_publish_from_another_thread(self):
+        message = self.receive_one(7, lambda b: b.publish(7, 'order-ready', {'order': 1}))
+        self.assertEqual(message, {'store': 7, 'event': 'order-ready', 'data': {'order': 1}})
+
+    def test_other_stores_are_filtered_out(self):
+        self.assertIsNone(self.receive_one(7, lambda b: b.publish(8, 'order-ready', {'order': 1})))
+
+    def test_all_stores_subscription(self):
+        message = self.receive_one(None, lambda b: b.publish(8, 'order-ready', {'order': 1}))
+        self.assertEqual(message['store'], 8)
+
+
+@override_settings(EVENT_BROKER='core.tests.RecordingBroker')
+class PublishEventTests(TestCase):
+    def setUp(self):
+        RecordingBroker.published.clear()
+
+    def test_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            publish_event(1, 'order-created', order=5)
+            self.assertEqual(get_broker().published, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_broker().published, [(1, 'order-created', {'order': 5})])
+
+
+class DemoDataTests(TestCase):
+    def test_seeded_dataset_is_consistent(self):
+        counts = generate(stores=1, months=1, orders_per_day=20, customers=10, seed=7, end_date=date(2025, 3, 30))
+
+        self.assertEqual(counts['order'], Order.objects.count())
+        self.assertGreater(counts['order'], 300)
+        self.assertEqual(find_drift(), [])
+        for ingredient in Ingredient.objects.annotate(ledger=Sum('stockentry__quantity')):
+            self.assertAlmostEqual(ingredient.quantity_in_stock, ingredient.ledger or 0, places=2)
+            self.assertGreaterEqual(ingredient.quantity_in_stock, 0)
+
+    def test_same_seed_same_orders(self):
+        first = generate(stores=1, months=1, orders_per_day=5, customers=5, seed=3, end_date=date(2025, 3, 30))
+        totals = list(Order.objects.order_by('created_at').values_list('created_at', 'total_price'))
+        Order.objects.all().delete()
+        second = generate(stores=1, months=1, orders_per_day=5, customers=5, seed=3, end_date=date(2025, 3, 30))
+        self.assertEqual(first['order'], second['order'])
+        self.assertEqual(totals, list(Order.objects.order_by('created_at').values_list('created_at', 'total_price')))
+
+
+class BenchmarkViewsTests(TestCase):
+    def test_json_report_and_rollback(self):
+        out = StringIO()
+        call_command('benchmark_views', months=[1], orders_per_day=3, repeat=2,
+                     views=['order_list', 'analytics_dashboard', 'logout'], json_path='-', stdout=out)
+
+        report = json.loads(out.getvalue())
+        views = {row['name']: row for row in report['runs'][0]['views']}
+        self.assertEqual(views['order_list']['status'], 200)
+        self.assertIn('p95_ms', views['analytics_dashboard'])
+        self.assertIn('skipped', views['logout'])
+        self.assertGreater(report['runs'][0]['rows']['order'], 0)
+        self.assertFalse(Order.objects.exists())
+
+
+class HistogramTests(SimpleTestCase):
+    def test_percentiles_use_bucket_bounds(self):
+        hist = Histogram((1, 5, 10))
+        for value in [0.5] * 90 + [7] * 9 + [50]:
+            hist.add(value)
+        self.assertEqual(hist.percentile(50), 1)
+        self.assertEqual(hist.percentile(95), 10)
+        self.assertEqual(hist.percentile(100), 50)
+
+    def test_signature_collapses_in_lists(self):
+        self.assertEqual(
+            query_signature('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            query_signature('SELECT * FROM t WHERE id IN (%s)'),
+        )
+
+
+@override_settings(QUERY_METRICS_SAMPLE_RATE=1.0)
+class QueryMetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        reset_metrics()
+        self.store = Store.objects.create(name="Main")
+        self.admin = User.objects.create_user("admin", password="x", role="admin", store=self.store)
+
+    def test_records_per_view_and_serves_admins(self):
+        self.client.force_login(self.admin)
+        with self.modify_settings(MIDDLEWARE={'prepend': 'core.metrics.QueryMetricsMiddleware'}):
+            for _ in range(3):
+                self.client.get(reverse('order_list'))
+            response = self.client.get(reverse('query_metrics'))
+
+        row = response.json()['views']['order_list']
+        self.assertEqual(row['requests'], 3)
+        self.assertGreater(row['queries']['p50'], 0)
+        self.assertGreater(row['template_ms']['max'], 0)
+        self.assertGreaterEqual(row['total_ms']['max'], row['sql_ms']['max'])
+        self.assertIn('order_list', collected_metrics())
+
+    def test_metrics_of_other_workers_are_merged(self):
+        # Another worker process: its own registry and its own client of the metrics cache
+        worker = MetricsRegistry()
+        worker.record('order_list', queries=4, sql_ms=3, template_ms=2, total_ms=9, duplicates=[])
+        other_client = caches.create_connection(CACHE_ALIAS)
+        with mock.patch('core.metrics.caches', {CACHE_ALIAS: other_client}), \
+                mock.patch('core.metrics.socket.gethostname', return_value='other-host'):
+            worker.flush()
+
+        self.assertEqual(collected_metrics()['order_list']['requests'], 1)
+        out = StringIO()
+        call_command('query_metrics', stdout=out)
+        self.assertIn('order_list', out.getvalue())
+
+    def test_endpoint_is_admin_only(self):
+        cashier = User.objects.create_user("cashier", password="x", role="cashier", store=self.store)
+        self.client.force_login(cashier)
+        self.assertRedirects(self.client.get(reverse('query_metrics')), reverse('no_permission'),
+                             fetch_redirect_response=False)
+
+
+# Tables that grow with every order; a query over them must never scan them whole
+HOT_TABLES = ('sales_order', 'sales_orderitem', 'inventory_stockentry', 'employee_attendance')
+
+
+def query_plans(run):
+    """[(sql, EXPLAIN QUERY PLAN text)] for every SELECT issued by run()."""
+    with CaptureQueriesContext(connection) as ctx:
+        run()
+    plans = []
+    with connection.cursor() as cursor:
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plans.append((sql, "\n".join(row[-1] for row in cursor.fetchall())))
+    return plans
+
+
+@skipUnless(connection.vendor == 'sqlite', "query plans are checked with SQLite's EXPLAIN QUERY PLAN")
+class QueryPlanTests(TestCase):
+    """EXPLAIN the hot per-store, per-day queries and fail if one stops using its index."""
+
+    def setUp(self):
+        self.store = Store.objects.create(name="Main")
+        other = Store.objects.create(name="Other")
+        cash = PaymentMethod.objects.create(name="Cash")
+        smoothies = make_menu(self.store, 2, ingredients_per_smoothie=2)
+        self.day = date(2025, 3, 1)
+        for store in (self.store, other):
+            for hour in range(8, 20):
+                created_at = JAKARTA.localize(datetime(2025, 3, 1, hour))
+                place_order(Order(name="Guest", store=store, payment_method=cash, created_at=created_at),
+                            [(smoothies[hour % 2], 1)])
+        Order.objects.update(served_at=F('created_at') + timedelta(minutes=5))
+        employee = Employee.objects.create(name="Staff", daily_salary=100000)
+        self.attendance = Attendance.objects.create(
+            employee=employee, store=self.store,
+            check_in=JAKARTA.localize(datetime(2025, 3, 1, 8)), check_out=JAKARTA.localize(datetime(2025, 3, 1, 17)),
+        )
+
+    def assertIndexed(self, run, *indexes):
+        plans = query_plans(run)
+        self.assertTrue(plans)
+        for index in indexes:
+            self.assertTrue(any(index in plan for _, plan in plans), f"{index} unused:\n{plans}")
+        for sql, plan in plans:
+            for table in HOT_TABLES:
+                self.assertNotRegex(plan, rf"\bSCAN {table}\b", f"full scan of {table} in\n{sql}\n{plan}")
+
+    def test_order_list_day_filter(self):
+        orders = filter_local_dates(Order.objects.filter(store=self.store), 'created_at', self.day, self.day)
+        self.assertIndexed(lambda: list(orders), 'order_store_created_idx')
+
+    def test_live_board(self):
+        scope = {'store': self.store}
+        with mock.patch('sales.board.timezone.now', return_value=JAKARTA.localize(datetime(2025, 3, 1, 12))):
+            self.assertIndexed(lambda: (build_board(scope), pending_summary(scope)), 'order_store_created_idx')
+
+    def test_salary_bonus_served_filter(self):
+        self.assertIndexed(self.attendance.salary_earned, 'order_store_served_idx')
+
+    def test_attendance_day_filter(self):
+        records = filter_local_dates(Attendance.objects.filter(store=self.store), 'check_in', self.day, self.day)
+        self.assertIndexed(lambda: list(records), 'attendance_store_checkin_idx')
+
+    def test_stock_snapshot_ledger_sums(self):
+        at = JAKARTA.localize(datetime(2025, 3, 2))
+        self.assertIndexed(lambda: stock_snapshot(self.store.id, at), 'stockentry_ingredient_ts_idx')
+
+    def test_order_lines_lookup(self):
+        order_ids = list(Order.objects.filter(store=self.store).values_list('id', flat=True)[:3])
+        lines = OrderItem.objects.filter(order_id__in=order_ids).values_list('order_id', 'smoothie_id', 'quantity')
+        self.assertIndexed(lambda: list(lines), 'orderitem_order_smoothie_idx')
@@ -0,0 +1,31 @@
+from datetime import datetime, time, timedelta
+
+import pytz
+
+JAKARTA = pytz.timezone("Asia/Jakarta")
+
+
+def local_day_start(day):
+    """Midnight of `day` in Jakarta as an aware datetime."""
+    return JAKARTA.localize(datetime.combine(day, time.min))
+
+
+def local_date_bounds(start_date=None, end_date=None):
+    """
+    Half-open [start, end) datetime bounds for an inclusive range of Jakarta
+    dates. Filtering on these instead of created_at__date lets the database
+    use an index on the column. Either side may be None.
+    """
+    start = local_day_start(start_date) if start_date else None
+    end = local_day_start(end_date + timedelta(days=1)) if end_date else None
+    return start, end
+
+
+def filter_local_dates(queryset, field, start_date=None, end_date=None):
+    """Apply local_date_bounds to `field` on a queryset."""
+    start, end = local_date_bounds(start_date, end_date)
+    if start:
+        queryset = queryset.filter(**{f"{field}__gte": start})
+    if end:
+        queryset = queryset.filter(**{f"{field}__lt": end})
+    return queryset
@@ -1,5 +1,9 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+
+from .decorators import role_required
+from .metrics import collected_metrics, reset_metrics
 
 @login_required
 def home(request):
@@ -7,4 +11,13 @@ def home(request):
     return render(request, 'core/home.html', {'role': user_role})
 
 def no_permission(request):
-    return render(request, 'core/no_permission.html', status=403)
\ No newline at end of file
+    return render(request, 'core/no_permission.html', status=403)
+
+
+@login_required
+@role_required('admin')
+def query_metrics(request):
+    """Per-view query/timing histograms from QueryMetricsMiddleware. POST resets them."""
+    if request.method == 'POST':
+        reset_metrics()
+    return JsonResponse({'views': collected_metrics()})
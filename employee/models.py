@@ -2,6 +2,7 @@ from django.db import models
 from django.utils import timezone
 from datetime import timedelta
 from core.models import Store
+from core.utils import JAKARTA, filter_local_dates
 from sales.models import Order, OrderItem
 from django.db.models import Sum
 
@@ -28,6 +29,11 @@ class Attendance(models.Model):
     check_out_photo = models.ImageField(upload_to='checkout_photos/', null=True, blank=True)
     payroll = models.ForeignKey('Payroll', on_delete=models.SET_NULL, null=True, blank=True, related_name='attendances')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['store', 'check_in'], name='attendance_store_checkin_idx'),
+        ]
+
 
 
 
@@ -52,15 +58,14 @@ class Attendance(models.Model):
             base_salary = 0
 
         # --- SALES CALCULATION ---
-        # Get the date of the attendance
-        attendance_date = self.check_in.date()
+        # Get the date of the attendance (Jakarta day)
+        attendance_date = timezone.localtime(self.check_in, JAKARTA).date()
         print(f"Attendance date: {attendance_date}")
         print(f"Employee's store: {self.store}")
         
         # Get all orders for this store on this date
-        orders = Order.objects.filter(
-            store=self.store,
-            served_at__date=attendance_date
+        orders = filter_local_dates(
+            Order.objects.filter(store=self.store), 'served_at', attendance_date, attendance_date,
         )
 
         # Sum quantities via OrderItem
@@ -8,8 +8,11 @@ from datetime import date, timedelta
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.db.models import Min, Max
+from django.utils.dateparse import parse_date
 import pytz
 
+from core.utils import filter_local_dates
+
 from .forms import AttendanceCheckInForm, AttendanceCheckOutForm
 
 
@@ -22,7 +25,10 @@ def attendance_list(request):
     today_jakarta = now().astimezone(jakarta_tz).date()
 
     if user.role == 'cashier':
-        records = Attendance.objects.select_related('employee').filter(check_in__date=today_jakarta, store=request.user.store).order_by('-check_in')
+        records = filter_local_dates(
+            Attendance.objects.select_related('employee').filter(store=request.user.store),
+            'check_in', today_jakarta, today_jakarta,
+        ).order_by('-check_in')
     else:
         records = Attendance.objects.select_related('employee').order_by('-check_in')
 
@@ -39,13 +45,12 @@ def attendance_list(request):
     if employee_id:
         records = records.filter(employee_id=employee_id)
 
-    # Filter by date range
-    if start_date and end_date:
-        records = records.filter(check_in__date__range=[start_date, end_date])
-    elif start_date:  # only start date
-        records = records.filter(check_in__date__gte=start_date)
-    elif end_date:  # only end date
-        records = records.filter(check_in__date__lte=end_date)
+    # Filter by date range (Jakarta days as half-open check_in ranges)
+    records = filter_local_dates(
+        records, 'check_in',
+        parse_date(start_date) if start_date else None,
+        parse_date(end_date) if end_date else None,
+    )
 
     # Calculate hours worked
     for record in records:
@@ -1,10 +1,12 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Ingredient, StockEntry, SmoothieMenu, SmoothieIngredient
+from .models import Ingredient, MenuAvailability, StockAlert, StockEntry, SmoothieMenu, SmoothieIngredient
 
 admin.site.register(Ingredient)
 admin.site.register(StockEntry)
+admin.site.register(StockAlert)
+admin.site.register(MenuAvailability)
 admin.site.register(SmoothieMenu)
 admin.site.register(SmoothieIngredient)
 
@@ -0,0 +1,59 @@
+"""
+Low-stock alerts, evaluated in the stock write path for just the
+ingredients a write touched.
+
+An alert opens when a balance falls below its ingredient's threshold and
+stays open, however often sales dip it further, until the balance is back
+to RESOLVE_RATIO times the threshold. The gap keeps a balance hovering
+around the threshold from opening a new alert on every sale. Open alerts
+are read per store through a partial index, so nothing scans ingredients.
+"""
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from core.events import publish_event
+
+from .models import Ingredient, StockAlert
+
+RESOLVE_RATIO = 1.2
+
+
+def check_stock_alerts(ingredient_ids):
+    """
+    Open and resolve alerts for these ingredients against their current
+    balances. Call it inside the transaction that moved the balances: the
+    balance UPDATE holds the rows, so concurrent writers check in turn.
+    Returns the newly opened alerts.
+    """
+    if not ingredient_ids:
+        return []
+    open_alerts = StockAlert.objects.filter(ingredient=OuterRef('pk'), resolved_at__isnull=True)
+    rows = (
+        Ingredient.objects.filter(pk__in=ingredient_ids)
+        .annotate(alerted=Exists(open_alerts))
+        .values_list('id', 'store_id', 'name', 'quantity_in_stock', 'low_stock_threshold', 'alerted')
+    )
+
+    opened, recovered = [], []
+    for ing_id, store_id, name, quantity, threshold, alerted in rows:
+        if not alerted and quantity < threshold:
+            opened.append(StockAlert(ingredient_id=ing_id, store_id=store_id, threshold=threshold, quantity=quantity))
+            publish_event(store_id, 'low-stock', ingredient=ing_id, name=name, quantity=quantity)
+        elif alerted and quantity >= threshold * RESOLVE_RATIO:
+            recovered.append(ing_id)
+
+    if opened:
+        StockAlert.objects.bulk_create(opened, ignore_conflicts=True)
+    if recovered:
+        StockAlert.objects.filter(ingredient_id__in=recovered, resolved_at__isnull=True).update(
+            resolved_at=timezone.now(),
+        )
+    return opened
+
+
+def open_stock_alerts(store_id):
+    """Unresolved alerts of one store, oldest first, with their ingredient."""
+    return (
+        StockAlert.objects.filter(store_id=store_id, resolved_at__isnull=True)
+        .select_related('ingredient').order_by('opened_at')
+    )
@@ -0,0 +1,104 @@
+"""
+Servable cups: for every smoothie and store selling it, how many cups the
+current stock can still make — the minimum over its recipe lines of
+stock ÷ amount, rounded down.
+
+MenuAvailability rows are refreshed in the stock write path for just the
+smoothies using the ingredients a write moved, found through the recipe
+cache's ingredient → smoothie index. Selling then needs no recipe math: a
+store's whole menu is one indexed query.
+"""
+import math
+
+from django.db import transaction
+
+from .models import Ingredient, MenuAvailability, SmoothieMenu
+from .recipes import recipe_cache
+
+# Float balances like 299.99999999 still make the 300th cup
+EPSILON = 1e-9
+
+
+def servable_cups(recipe, stock):
+    """Cups `stock` ({ingredient_id: balance}) can make of `recipe`; None when it has no lines."""
+    if not recipe:
+        return None
+    return max(0, min(math.floor(stock.get(ingredient_id, 0.0) / amount + EPSILON)
+                      for ingredient_id, amount in recipe))
+
+
+def _rows(smoothie_ids):
+    """Fresh MenuAvailability rows (unsaved) for these smoothies in every store selling them."""
+    # Menu-store links come from the database, so menus deleted since the cache loaded drop out
+    menu_stores = list(
+        SmoothieMenu.stores.through.objects.filter(smoothiemenu_id__in=smoothie_ids)
+        .values_list('smoothiemenu_id', 'store_id')
+    )
+    recipes = recipe_cache.get_many({smoothie_id for smoothie_id, _ in menu_stores})
+    ingredient_ids = {ingredient_id for recipe in recipes.values() for ingredient_id, _ in recipe}
+    stock = dict(
+        Ingredient.objects.filter(pk__in=ingredient_ids).values_list('id', 'quantity_in_stock')
+    ) if ingredient_ids else {}
+    return [
+        MenuAvailability(store_id=store_id, smoothie_id=smoothie_id, cups=servable_cups(recipes[smoothie_id], stock))
+        for smoothie_id, store_id in menu_stores
+    ]
+
+
+def refresh_menu_availability(smoothie_ids, prune=False):
+    """
+    Recompute these smoothies' rows with one balance read and one upsert.
+    `prune` also drops rows of stores that no longer sell them (menu changes).
+    """
+    smoothie_ids = set(smoothie_ids)
+    if not smoothie_ids:
+        return
+    rows = _rows(smoothie_ids)
+    if prune:
+        keep = {(row.store_id, row.smoothie_id) for row in rows}
+        existing = MenuAvailability.objects.filter(smoothie_id__in=smoothie_ids).values_list('id', 'store_id', 'smoothie_id')
+        stale = [pk for pk, store_id, smoothie_id in existing if (store_id, smoothie_id) not in keep]
+        if stale:
+            MenuAvailability.objects.filter(pk__in=stale).delete()
+    if rows:
+        MenuAvailability.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['store', 'smoothie'], update_fields=['cups', 'updated_at'],
+        )
+
+
+def refresh_for_ingredients(ingredient_ids):
+    """Follow a balance change of these ingredients into the smoothies that use them."""
+    refresh_menu_availability(recipe_cache.smoothies_using(ingredient_ids))
+
+
+def store_availability(store_id):
+    """{smoothie_id: cups or None} for a store's whole menu, in one query."""
+    return dict(MenuAvailability.objects.filter(store_id=store_id).values_list('smoothie_id', 'cups'))
+
+
+def rebuild(batch_size=500):
+    """Replace every availability row from the current stock; returns the row count."""
+    rows = _rows(set(SmoothieMenu.objects.values_list('id', flat=True)))
+    with transaction.atomic():
+        MenuAvailability.objects.all().delete()
+        MenuAvailability.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def find_drift():
+    """[(store_id, smoothie_id, stored cups, expected cups)] where the index is stale or missing."""
+    expected = {
+        (row.store_id, row.smoothie_id): row.cups
+        for row in _rows(set(SmoothieMenu.objects.values_list('id', flat=True)))
+    }
+    stored = {
+        (store_id, smoothie_id): cups
+        for store_id, smoothie_id, cups in MenuAvailability.objects.values_list('store_id', 'smoothie_id', 'cups')
+    }
+    missing = 'missing'
+    drift = [
+        (*key, stored.get(key, missing), expected.get(key, missing))
+        for key in set(expected) | set(stored)
+        if stored.get(key, missing) != expected.get(key, missing)
+    ]
+    return sorted(drift, key=lambda row: row[:2])
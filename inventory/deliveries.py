@@ -0,0 +1,110 @@
+"""
+Supplier deliveries: many stock additions uploaded at once as CSV or JSON
+and booked as one ledger write.
+
+A delivery is a list of lines {"ingredient": id or name, "quantity": n}.
+It is checked against the store's ingredients in one query and either
+booked whole (through apply_stock_deltas: one ledger insert, one balance
+UPDATE) or rejected whole with an error per bad line.
+"""
+import csv
+import io
+from collections import defaultdict
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.data_versions import bump_data_version
+from core.utils import JAKARTA
+
+from .models import Ingredient
+from .stock import apply_stock_deltas
+
+MAX_DELIVERY_LINES = 1000
+
+
+class DeliveryError(ValueError):
+    """The delivery was rejected; `errors` lists what is wrong with it."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def parse_delivery_csv(text):
+    """Lines of a CSV delivery with `ingredient` and `quantity` columns (others are ignored)."""
+    text = text.lstrip('\ufeff')  # Excel's UTF-8 byte order mark
+    reader = csv.DictReader(io.StringIO(text))
+    columns = {name.strip().lower() for name in reader.fieldnames or []}
+    if not {'ingredient', 'quantity'} <= columns:
+        raise DeliveryError(["CSV needs a header row with ingredient and quantity columns."])
+    return [
+        {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+        for row in reader
+    ]
+
+
+def parse_delivered_at(value):
+    """An ISO datetime (naive means Jakarta time), not in the future."""
+    moment = parse_datetime(value) if isinstance(value, str) else None
+    if moment is None:
+        raise DeliveryError(["delivered_at must be an ISO 8601 datetime."])
+    if timezone.is_naive(moment):
+        moment = JAKARTA.localize(moment)
+    if moment > timezone.now():
+        raise DeliveryError(["delivered_at can't be in the future."])
+    return moment
+
+
+def intake_delivery(store, lines, delivered_at=None):
+    """
+    Book a delivery for `store`, all or nothing. `delivered_at` back-dates
+    it (default: now). Returns [(ingredient, quantity added)] by name;
+    raises DeliveryError listing every bad line.
+    """
+    if not isinstance(lines, list) or not lines:
+        raise DeliveryError(["A delivery needs at least one line."])
+    if len(lines) > MAX_DELIVERY_LINES:
+        raise DeliveryError([f"A delivery can have at most {MAX_DELIVERY_LINES} lines."])
+
+    ingredients = list(Ingredient.objects.filter(store=store))
+    by_id = {ingredient.id: ingredient for ingredient in ingredients}
+    by_name = {ingredient.name.strip().lower(): ingredient for ingredient in ingredients}
+
+    deltas, errors = defaultdict(float), []
+    for number, line in enumerate(lines, start=1):
+        ingredient, quantity = _validate_line(line, by_id, by_name, errors, number)
+        if ingredient is not None:
+            deltas[ingredient.id] += quantity
+    if errors:
+        raise DeliveryError(errors)
+
+    apply_stock_deltas(deltas, 'manual_add', timestamp=delivered_at)
+    bump_data_version(store.id if store else None)
+    return sorted(((by_id[pk], qty) for pk, qty in deltas.items()), key=lambda row: row[0].name)
+
+
+def _validate_line(line, by_id, by_name, errors, number):
+    """(Ingredient, quantity) for a good line; appends to `errors` and returns (None, None) otherwise."""
+    if not isinstance(line, dict):
+        errors.append(f"Line {number}: expected an object with ingredient and quantity.")
+        return None, None
+
+    key = line.get('ingredient')
+    ingredient = None
+    if isinstance(key, int) and not isinstance(key, bool):
+        ingredient = by_id.get(key)
+    elif isinstance(key, str):
+        key = key.strip()
+        ingredient = by_id.get(int(key)) if key.isdigit() else by_name.get(key.lower())
+    if ingredient is None:
+        errors.append(f"Line {number}: unknown ingredient {key!r} for this store.")
+
+    try:
+        quantity = float(line.get('quantity'))
+    except (TypeError, ValueError):
+        quantity = None
+    if quantity is None or not quantity > 0 or quantity == float('inf'):
+        errors.append(f"Line {number}: quantity must be a positive number.")
+        return None, None
+    return ingredient, quantity
@@ -27,6 +27,12 @@ class IngredientForm(forms.ModelForm):
             'low_stock_threshold': forms.NumberInput(attrs={'class': 'form-control'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Post back the quantity the page showed, so changed_data means "the user typed a
+        # new count" rather than "sales moved the balance since the page was loaded"
+        self.fields['quantity_in_stock'].show_hidden_initial = True
+
 class SmoothieMenuForm(forms.ModelForm):
     class Meta:
         model = SmoothieMenu
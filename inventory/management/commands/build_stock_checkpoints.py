@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.utils import JAKARTA
+from inventory.snapshot import build_checkpoints, catch_up_checkpoints
+
+
+class Command(BaseCommand):
+    help = (
+        "Write end-of-day stock checkpoints for every day since the last one, up to yesterday. "
+        "Run nightly so stock snapshots replay at most one day of ledger."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', help="Last day to close (YYYY-MM-DD, default: yesterday in Jakarta).")
+        parser.add_argument(
+            '--days', type=int, default=1,
+            help="When no checkpoints exist yet, how many days up to --through to backfill.",
+        )
+        parser.add_argument('--date', help="Rebuild just this day (YYYY-MM-DD), e.g. after a ledger repair.")
+
+    def handle(self, *args, **options):
+        if options['date']:
+            day = self.parse_day(options['date'])
+            count = build_checkpoints(day)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} checkpoints for {day}."))
+            return
+
+        yesterday = timezone.now().astimezone(JAKARTA).date() - timedelta(days=1)
+        through = self.parse_day(options['through']) if options['through'] else yesterday
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1.")
+        built = catch_up_checkpoints(through, first_day=through - timedelta(days=options['days'] - 1))
+        if built:
+            self.stdout.write(self.style.SUCCESS(f"Built checkpoints for {built[0]} .. {built[-1]}."))
+        else:
+            self.stdout.write("Checkpoints are already up to date.")
+
+    @staticmethod
+    def parse_day(value):
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError(f"Invalid date {value!r}; use YYYY-MM-DD.")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.stock import open_stock_ledger, unopened_ingredients
+
+
+class Command(BaseCommand):
+    help = (
+        "Give every ingredient created before the stock ledger was kept an opening-balance entry, "
+        "so its ledger matches its current balance, or only report them with --check. Run once "
+        "before reconcile_stock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', type=int, help="Only this store id (default: all stores).")
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report ingredients without an opening balance; exit non-zero if there are any.",
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            missing = unopened_ingredients(options['store']).count()
+            if missing:
+                raise CommandError(f"{missing} ingredients have no opening balance; run open_stock_ledger.")
+            self.stdout.write(self.style.SUCCESS("Every ingredient has an opening balance."))
+            return
+        opened = open_stock_ledger(options['store'])
+        self.stdout.write(self.style.SUCCESS(f"Opened the ledger of {opened} ingredients."))
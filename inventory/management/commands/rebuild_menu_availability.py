@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.availability import find_drift, rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the servable-cups menu availability index from stock, or check it for drift with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only compare the index with the current stock; exit non-zero if they differ.",
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = find_drift()
+            for store, smoothie, have, want in drift[:50]:
+                self.stdout.write(f"store={store} smoothie={smoothie}: index cups={have} expected={want}")
+            if drift:
+                raise CommandError(f"{len(drift)} availability rows drifted; run rebuild_menu_availability to fix.")
+            self.stdout.write(self.style.SUCCESS("Menu availability matches the stock."))
+            return
+
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt menu availability: {count} rows."))
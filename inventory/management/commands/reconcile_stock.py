@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.stock import find_stock_drift, reconcile_stock, unopened_ingredients
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare every ingredient's balance with its ledger (latest checkpoint plus the entries since) "
+        "and repair the drift, or only report it with --check. Refuses to run while some ingredients "
+        "have no opening balance (see open_stock_ledger)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', type=int, help="Only this store id (default: all stores).")
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drifted balances; exit non-zero if there are any.",
+        )
+
+    def handle(self, *args, **options):
+        missing = unopened_ingredients(options['store']).count()
+        if missing:
+            # Their ledger misses the stock they had before it was kept; "repairing" would wipe it
+            raise CommandError(
+                f"{missing} ingredients have no opening balance; run open_stock_ledger first."
+            )
+        drift = find_stock_drift(options['store']) if options['check'] else reconcile_stock(options['store'])
+        for ingredient_id, store_id, name, stored, expected in drift[:50]:
+            self.stdout.write(
+                f"store={store_id} ingredient={ingredient_id} ({name}): "
+                f"balance={stored:g} ledger={expected:g} diff={expected - stored:+g}"
+            )
+        if options['check']:
+            if drift:
+                raise CommandError(f"{len(drift)} stock balances drifted; run reconcile_stock to fix.")
+            self.stdout.write(self.style.SUCCESS("Stock balances match the ledger."))
+        elif drift:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(drift)} stock balances."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Stock balances already match the ledger."))
@@ -8,6 +8,8 @@ class Ingredient(models.Model):
     unit = models.CharField(max_length=50, default='ml')  # could be ml, gram, pcs, etc.
     quantity_in_stock = models.FloatField(default=0)  # current stock
     low_stock_threshold = models.FloatField(default=10)  # for alerts
+    # Since when every balance change has a ledger entry (see inventory.stock.open_stock_ledger)
+    ledger_opened_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.name} ({self.quantity_in_stock} {self.unit})"
@@ -24,11 +26,63 @@ class StockEntry(models.Model):
         ('manual_deduct', 'Manual Deduction'),
         ('sale_deduct', 'Sale Deduction'),
         ('sale_cancellation', 'Sale Cancellation'),
+        ('stock_count', 'Stock Count Adjustment'),
+        ('opening_balance', 'Opening Balance'),
     ])
 
+    class Meta:
+        indexes = [
+            # point-in-time snapshots sum one ingredient's entries over a time range
+            models.Index(fields=['ingredient', 'timestamp'], name='stockentry_ingredient_ts_idx'),
+            # the ledger browser and exports walk (timestamp, id) newest- or oldest-first
+            models.Index(fields=['timestamp', 'id'], name='stockentry_ts_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.ingredient.name}: {self.quantity} ({self.reason})"
 
+class StockCheckpoint(models.Model):
+    """End-of-day balance of one ingredient, so snapshots only replay the ledger since `as_of`."""
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='checkpoints')
+    day = models.DateField()  # Jakarta date the balance closes
+    as_of = models.DateTimeField()  # start of the next Jakarta day; covers entries stamped before it
+    quantity = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ingredient', 'day'], name='unique_stock_checkpoint'),
+        ]
+
+    def __str__(self):
+        return f"{self.ingredient_id} @ {self.day}: {self.quantity}"
+
+class StockAlert(models.Model):
+    """A low-stock episode: opened when the balance drops below the threshold, resolved once it recovers."""
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='alerts')
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='stock_alerts', blank=True, null=True)
+    threshold = models.FloatField()  # low_stock_threshold when the alert opened
+    quantity = models.FloatField()  # balance that crossed it
+    opened_at = models.DateTimeField(auto_now_add=True)
+    resolved_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            # at most one open alert per ingredient
+            models.UniqueConstraint(
+                fields=['ingredient'], condition=models.Q(resolved_at__isnull=True), name='unique_open_stock_alert',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['store', 'opened_at'], condition=models.Q(resolved_at__isnull=True),
+                name='stockalert_open_store_idx',
+            ),
+        ]
+
+    def __str__(self):
+        state = 'resolved' if self.resolved_at else 'open'
+        return f"{self.ingredient_id} below {self.threshold} ({state})"
+
 class SmoothieMenu(models.Model):
     stores = models.ManyToManyField(Store, related_name='smoothie_menus')
 
@@ -51,3 +105,19 @@ class SmoothieIngredient(models.Model):
     def __str__(self):
         return f"{self.amount} {self.ingredient.unit} of {self.ingredient.name} in {self.smoothie.name}"
 
+
+class MenuAvailability(models.Model):
+    """How many cups of a smoothie a store's current stock can still make (null: no recipe, not limited)."""
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='menu_availability')
+    smoothie = models.ForeignKey(SmoothieMenu, on_delete=models.CASCADE, related_name='availability')
+    cups = models.IntegerField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # leads with store, so one store's whole menu is a single index range
+            models.UniqueConstraint(fields=['store', 'smoothie'], name='unique_menu_availability'),
+        ]
+
+    def __str__(self):
+        return f"{self.smoothie_id} @ {self.store_id}: {self.cups}"
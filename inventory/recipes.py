@@ -0,0 +1,103 @@
+import threading
+
+from asgiref.local import Local
+
+from core.data_versions import bump_versions, read_versions
+
+from .models import SmoothieIngredient
+
+VERSION_KEY = 'inventory:recipes'
+
+
+class RecipeCache:
+    """
+    In-process map of smoothie_id -> ((ingredient_id, amount), ...), with the
+    reverse index ingredient_id -> smoothie ids.
+
+    The whole recipe table is loaded in one query on first use and kept until
+    a SmoothieIngredient/SmoothieMenu write bumps the version. The version is
+    a DataVersion row, so a write in any worker process makes every other one
+    reload. Within a request it is read once (begin_request/end_request are
+    hooked to Django's request signals); outside a request every lookup
+    reads it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None  # (recipes, uses), swapped in whole
+        self._version = None
+        self._request = Local()  # per request (thread or async task)
+        self.hits = 0
+        self.misses = 0
+
+    def begin_request(self, **kwargs):
+        self._request.version = None
+
+    def end_request(self, **kwargs):
+        if hasattr(self._request, 'version'):
+            del self._request.version
+
+    def _current_version(self):
+        if not hasattr(self._request, 'version'):
+            return read_versions([VERSION_KEY])[VERSION_KEY]
+        if self._request.version is None:
+            self._request.version = read_versions([VERSION_KEY])[VERSION_KEY]
+        return self._request.version
+
+    def _load(self):
+        recipes, uses = {}, {}
+        rows = SmoothieIngredient.objects.values_list('smoothie_id', 'ingredient_id', 'amount')
+        for smoothie_id, ingredient_id, amount in rows:
+            recipes.setdefault(smoothie_id, []).append((ingredient_id, amount))
+            uses.setdefault(ingredient_id, set()).add(smoothie_id)
+        return {smoothie_id: tuple(lines) for smoothie_id, lines in recipes.items()}, uses
+
+    def _current(self):
+        """(recipes, uses), reloaded when the version moved."""
+        version = self._current_version()
+        state = self._state
+        if state is None or self._version != version:
+            with self._lock:
+                if self._state is None or self._version != version:
+                    self.misses += 1
+                    self._state = self._load()
+                    self._version = version
+                else:
+                    self.hits += 1
+                state = self._state
+        else:
+            self.hits += 1
+        return state
+
+    def get_many(self, smoothie_ids):
+        """Return {smoothie_id: recipe} for the given ids; unknown ids map to ()."""
+        recipes = self._current()[0]
+        return {smoothie_id: recipes.get(smoothie_id, ()) for smoothie_id in smoothie_ids}
+
+    def smoothies_using(self, ingredient_ids):
+        """Ids of the smoothies whose recipe uses any of these ingredients."""
+        uses = self._current()[1]
+        return set().union(*(uses.get(ingredient_id, ()) for ingredient_id in ingredient_ids))
+
+    def get(self, smoothie_id):
+        return self.get_many([smoothie_id])[smoothie_id]
+
+    def invalidate(self):
+        """Bump the shared version (inside the caller's transaction) and drop this copy."""
+        bump_versions([VERSION_KEY])
+        if hasattr(self._request, 'version'):
+            self._request.version = None
+        with self._lock:
+            self._state = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits / total) if total else 0.0,
+            'version': self._version,
+        }
+
+
+recipe_cache = RecipeCache()
@@ -0,0 +1,46 @@
+from django.core.signals import request_finished, request_started
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.data_versions import bump_data_version
+
+from .availability import refresh_menu_availability
+from .models import SmoothieIngredient, SmoothieMenu, StockEntry
+from .recipes import recipe_cache
+
+
+@receiver([post_save, post_delete], sender=SmoothieIngredient)
+@receiver([post_save, post_delete], sender=SmoothieMenu)
+def invalidate_recipe_cache(sender, **kwargs):
+    # The bump is part of the write's transaction: other workers see the new
+    # version exactly when they can see the new rows, and a rollback undoes it.
+    recipe_cache.invalidate()
+
+
+request_started.connect(recipe_cache.begin_request, dispatch_uid='recipe_cache_begin_request')
+request_finished.connect(recipe_cache.end_request, dispatch_uid='recipe_cache_end_request')
+
+
+@receiver([post_save, post_delete], sender=SmoothieIngredient)
+def refresh_recipe_availability(sender, instance, **kwargs):
+    # After commit: a cascading menu delete must be finished before the rows are rewritten
+    transaction.on_commit(lambda: refresh_menu_availability([instance.smoothie_id], prune=True))
+
+
+@receiver(m2m_changed, sender=SmoothieMenu.stores.through)
+def refresh_menu_stores(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        smoothie_ids = [instance.pk]
+    else:
+        # store.smoothie_menus changed; a clear doesn't say which menus it dropped
+        smoothie_ids = pk_set or list(SmoothieMenu.objects.values_list('id', flat=True))
+    transaction.on_commit(lambda: refresh_menu_availability(smoothie_ids, prune=True))
+
+
+@receiver(post_save, sender=StockEntry)
+def bump_stock_store_version(sender, instance, **kwargs):
+    # Bulk ledger writes (apply_stock_deltas) are covered by their callers
+    bump_data_version(instance.ingredient.store_id)
@@ -0,0 +1,179 @@
+"""
+Point-in-time stock from the ledger.
+
+A balance at `at` is the ingredient's latest end-of-day checkpoint before
+`at` plus the StockEntry rows stamped since it, so with nightly checkpoints
+a lookup replays at most one day of ledger. Ingredients without a usable
+checkpoint replay their whole ledger up to `at` once it is opened (see
+inventory.stock.open_stock_ledger); before that their ledger misses the
+stock they started with, so they fall back to the current balance minus
+everything from `at` on. Every ingredient of a store is resolved in one query.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+
+from core.utils import JAKARTA, local_day_start
+
+from .models import Ingredient, StockCheckpoint, StockEntry
+
+
+def _ledger_sum(**lookup):
+    """Correlated SUM(quantity) of the outer ingredient's entries matching `lookup`."""
+    total = (
+        StockEntry.objects.filter(ingredient=OuterRef('pk'), **lookup)
+        .order_by().values('ingredient')
+        .annotate(total=Sum('quantity')).values('total')
+    )
+    return Coalesce(Subquery(total, output_field=FloatField()), Value(0.0))
+
+
+def annotate_stock_at(ingredients, at):
+    """
+    Annotate an Ingredient queryset with `stock_at`, the balance at datetime
+    `at`: every entry stamped before it counts, entries at or after it don't.
+    Only unopened ingredients read the stored balance, so checkpoints built
+    from this never turn drift into the ledger's baseline.
+    """
+    # Checkpoints closing a day before `at`'s own Jakarta day are all in the past
+    last_day = at.astimezone(JAKARTA).date() - timedelta(days=1)
+    checkpoint = StockCheckpoint.objects.filter(ingredient=OuterRef('pk'), day__lte=last_day).order_by('-day')
+    return ingredients.annotate(
+        checkpoint_quantity=Subquery(checkpoint.values('quantity')[:1]),
+        checkpoint_as_of=Subquery(checkpoint.values('as_of')[:1]),
+    ).annotate(
+        stock_at=Case(
+            When(
+                checkpoint_as_of__isnull=False,
+                then=F('checkpoint_quantity') + _ledger_sum(
+                    timestamp__gte=OuterRef('checkpoint_as_of'), timestamp__lt=at,
+                ),
+            ),
+            When(ledger_opened_at__isnull=False, then=_ledger_sum(timestamp__lt=at)),
+            default=F('quantity_in_stock') - _ledger_sum(timestamp__gte=at),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def annotate_ledger_balance(ingredients):
+    """
+    Annotate an Ingredient queryset with `ledger_balance`, the balance the
+    ledger alone implies: the latest checkpoint plus the entries since it,
+    or the whole ledger for ingredients without checkpoints.
+    """
+    checkpoint = StockCheckpoint.objects.filter(ingredient=OuterRef('pk')).order_by('-day')
+    return ingredients.annotate(
+        checkpoint_quantity=Subquery(checkpoint.values('quantity')[:1]),
+        checkpoint_as_of=Subquery(checkpoint.values('as_of')[:1]),
+    ).annotate(
+        ledger_balance=Case(
+            When(
+                checkpoint_as_of__isnull=False,
+                then=F('checkpoint_quantity') + _ledger_sum(timestamp__gte=OuterRef('checkpoint_as_of')),
+            ),
+            default=_ledger_sum(),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def stock_snapshot(store_id, at):
+    """[{'id', 'name', 'unit', 'quantity'}] for every ingredient of the store at `at`, by name."""
+    ingredients = annotate_stock_at(Ingredient.objects.filter(store_id=store_id), at)
+    return [
+        {'id': pk, 'name': name, 'unit': unit, 'quantity': quantity}
+        for pk, name, unit, quantity in ingredients.order_by('name').values_list('id', 'name', 'unit', 'stock_at')
+    ]
+
+
+def daily_balances(ingredient_id, start_day, end_day):
+    """
+    [(day, closing balance)] for each Jakarta day in the inclusive range: the
+    opening balance from the snapshot plus one grouped pass over the range's ledger.
+    """
+    start, end = local_day_start(start_day), local_day_start(end_day + timedelta(days=1))
+    balance = (
+        annotate_stock_at(Ingredient.objects.filter(pk=ingredient_id), start)
+        .values_list('stock_at', flat=True).first()
+    )
+    if balance is None:
+        return []
+    changes = dict(
+        StockEntry.objects
+        .filter(ingredient_id=ingredient_id, timestamp__gte=start, timestamp__lt=end)
+        .annotate(day=TruncDate('timestamp', tzinfo=JAKARTA))
+        .order_by().values('day')
+        .annotate(total=Sum('quantity')).values_list('day', 'total')
+    )
+    series = []
+    day = start_day
+    while day <= end_day:
+        balance += changes.get(day, 0.0)
+        series.append((day, balance))
+        day += timedelta(days=1)
+    return series
+
+
+def build_checkpoints(day, store_id=None):
+    """
+    (Re)write the closing balance of `day` for every ingredient (of one store,
+    or all). Built from the previous day's checkpoint when it exists, so
+    running this nightly keeps each build to one day of ledger.
+    Returns the number of checkpoints written.
+    """
+    as_of = local_day_start(day + timedelta(days=1))
+    ingredients = Ingredient.objects.all()
+    if store_id:
+        ingredients = ingredients.filter(store_id=store_id)
+    balances = list(annotate_stock_at(ingredients, as_of).values_list('id', 'stock_at'))
+
+    with transaction.atomic():
+        StockCheckpoint.objects.filter(day=day, ingredient_id__in=[pk for pk, _ in balances]).delete()
+        StockCheckpoint.objects.bulk_create([
+            StockCheckpoint(ingredient_id=pk, day=day, as_of=as_of, quantity=quantity)
+            for pk, quantity in balances
+        ])
+    return len(balances)
+
+
+def catch_up_checkpoints(through, first_day=None):
+    """
+    Build checkpoints for every day after the latest one up to `through`
+    (or from `first_day` when there are none yet), oldest first.
+    Returns the list of days built.
+    """
+    latest = StockCheckpoint.objects.aggregate(day=Max('day'))['day']
+    day = latest + timedelta(days=1) if latest else (first_day or through)
+    built = []
+    while day <= through:
+        build_checkpoints(day)
+        built.append(day)
+        day += timedelta(days=1)
+    return built
+
+
+def shift_checkpoints(ingredient_id, since, delta):
+    """
+    Carry a ledger change stamped `since` (an edited, deleted or back-dated
+    entry) into the checkpoints already closed after it, in one UPDATE.
+    """
+    if delta:
+        StockCheckpoint.objects.filter(ingredient_id=ingredient_id, as_of__gt=since).update(
+            quantity=F('quantity') + delta,
+        )
+
+
+def shift_checkpoints_many(deltas, since):
+    """shift_checkpoints for several ingredients ({ingredient_id: delta}) stamped `since`, in one UPDATE."""
+    deltas = {ing_id: qty for ing_id, qty in deltas.items() if qty}
+    if deltas:
+        StockCheckpoint.objects.filter(ingredient_id__in=deltas.keys(), as_of__gt=since).update(
+            quantity=F('quantity') + Case(
+                *[When(ingredient_id=ing_id, then=Value(qty)) for ing_id, qty in deltas.items()],
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        )
@@ -0,0 +1,224 @@
+"""
+Stock balances move only together with the ledger: every write adds or
+changes StockEntry rows and shifts Ingredient.quantity_in_stock by the same
+amount with an F() delta, in one transaction, so concurrent writers never
+overwrite each other's balance. reconcile_stock repairs any drift left over
+from writes that bypass these helpers.
+
+Ingredients created before the ledger was kept have balances that no
+entries explain. open_stock_ledger gives each of them an opening entry once;
+until then the drift check and reconcile_stock leave them alone, because
+their ledger alone would wipe the real stock.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from core.data_versions import bump_data_version
+
+from .alerts import check_stock_alerts
+from .availability import EPSILON, refresh_for_ingredients
+from .models import Ingredient, StockEntry
+from .snapshot import annotate_ledger_balance, shift_checkpoints, shift_checkpoints_many
+
+# Ledger balances are float sums; smaller differences are rounding, not drift
+DRIFT_TOLERANCE = 1e-6
+
+
+class InsufficientStock(ValueError):
+    """A sale needs more than the stock holds; `errors` names each short ingredient."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def reserve_stock(deltas):
+    """
+    Lock the ingredients `deltas` deducts from until the caller's transaction
+    ends, and raise InsufficientStock unless every balance covers its total
+    deduction. Call it in the transaction that then applies the deltas, so
+    concurrent sales queue up behind the lock instead of both passing.
+    """
+    needs = {ing_id: -qty for ing_id, qty in deltas.items() if qty < 0}
+    if not needs:
+        return
+    rows = (
+        Ingredient.objects.select_for_update().filter(pk__in=needs).order_by('pk')
+        .values_list('id', 'name', 'unit', 'quantity_in_stock')
+    )
+    errors = [
+        f"Not enough {name}: the order needs {needs[pk]:g} {unit}, only {stock:g} in stock."
+        for pk, name, unit, stock in rows
+        if needs[pk] > stock + EPSILON
+    ]
+    if errors:
+        raise InsufficientStock(errors)
+
+
+def apply_stock_deltas(deltas, reason, timestamp=None):
+    """
+    Write one ledger row per ingredient and move the balances with a single
+    UPDATE. `deltas` maps ingredient_id -> signed quantity (negative to deduct).
+    A past `timestamp` back-dates the rows and carries them into the
+    checkpoints closed since. Returns the list of created StockEntry rows.
+    """
+    deltas = {ing_id: qty for ing_id, qty in deltas.items() if qty}
+    if not deltas:
+        return []
+
+    with transaction.atomic():
+        entries = StockEntry.objects.bulk_create([
+            StockEntry(ingredient_id=ing_id, quantity=qty, reason=reason)
+            for ing_id, qty in deltas.items()
+        ])
+        if timestamp is not None:
+            # timestamp is auto_now_add, so bulk_create stamped them now
+            StockEntry.objects.filter(pk__in=[entry.pk for entry in entries]).update(timestamp=timestamp)
+            for entry in entries:
+                entry.timestamp = timestamp
+            shift_checkpoints_many(deltas, timestamp)
+
+        _shift_balances(deltas)
+
+    return entries
+
+
+def recipe_deltas(recipes, quantities, sign=-1):
+    """
+    Combine recipe lines and cup counts into per-ingredient deltas.
+    `recipes` maps smoothie_id -> [(ingredient_id, amount), ...] and
+    `quantities` maps smoothie_id -> cups.
+    """
+    deltas = defaultdict(float)
+    for smoothie_id, qty in quantities.items():
+        for ingredient_id, amount in recipes.get(smoothie_id, ()):
+            deltas[ingredient_id] += sign * qty * amount
+    return dict(deltas)
+
+
+def _shift_balances(deltas):
+    """
+    One UPDATE for every ingredient in `deltas` (F() keeps it race-free),
+    then the low-stock check and servable cups for just those ingredients.
+    """
+    Ingredient.objects.filter(pk__in=deltas.keys()).update(
+        quantity_in_stock=F('quantity_in_stock') + Case(
+            *[When(pk=ing_id, then=Value(qty)) for ing_id, qty in deltas.items()],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+    check_stock_alerts(list(deltas))
+    refresh_for_ingredients(list(deltas))
+
+
+def revise_entry(entry, old_ingredient_id, old_quantity):
+    """
+    Follow an edited ledger entry (already saved with its new ingredient and
+    quantity) in the balances and in the checkpoints closed since it.
+    """
+    deltas = defaultdict(float)
+    deltas[old_ingredient_id] -= old_quantity
+    deltas[entry.ingredient_id] += entry.quantity
+    deltas = {ing_id: qty for ing_id, qty in deltas.items() if qty}
+    with transaction.atomic():
+        if deltas:
+            _shift_balances(deltas)
+        for ing_id, qty in deltas.items():
+            shift_checkpoints(ing_id, entry.timestamp, qty)
+
+
+def remove_entry(entry):
+    """Delete a ledger entry and take its quantity back out of the balance and checkpoints."""
+    with transaction.atomic():
+        entry.delete()
+        if entry.quantity:
+            _shift_balances({entry.ingredient_id: -entry.quantity})
+            shift_checkpoints(entry.ingredient_id, entry.timestamp, -entry.quantity)
+
+
+def count_stock(ingredient_id, counted):
+    """
+    Record a physical stock count: the difference from the current balance
+    becomes a 'stock_count' ledger entry. Returns the entry, or None when
+    the count matches.
+    """
+    with transaction.atomic():
+        current = (
+            Ingredient.objects.select_for_update()
+            .values_list('quantity_in_stock', flat=True).get(pk=ingredient_id)
+        )
+        entries = apply_stock_deltas({ingredient_id: counted - current}, 'stock_count')
+    return entries[0] if entries else None
+
+
+def _scoped(store_id):
+    ingredients = Ingredient.objects.all()
+    if store_id:
+        ingredients = ingredients.filter(store_id=store_id)
+    return ingredients
+
+
+def unopened_ingredients(store_id=None):
+    """Ingredients whose ledger has no opening balance yet."""
+    return _scoped(store_id).filter(ledger_opened_at__isnull=True)
+
+
+def open_stock_ledger(store_id=None):
+    """
+    Write an 'opening_balance' entry for every ingredient without one, so
+    its ledger adds up to its current balance, and mark it opened. The
+    balances don't move. The difference is read in the same query as the
+    balance, so sales booked meanwhile (entry and balance together) don't
+    change it. Returns the number of ingredients opened.
+    """
+    with transaction.atomic():
+        rows = list(
+            annotate_ledger_balance(unopened_ingredients(store_id))
+            .values_list('id', 'store_id', 'quantity_in_stock', 'ledger_balance')
+        )
+        if not rows:
+            return 0
+        StockEntry.objects.bulk_create([
+            StockEntry(ingredient_id=ing_id, quantity=stored - expected, reason='opening_balance')
+            for ing_id, _, stored, expected in rows
+            if abs(stored - expected) > DRIFT_TOLERANCE
+        ])
+        Ingredient.objects.filter(pk__in=[row[0] for row in rows]).update(ledger_opened_at=timezone.now())
+        bump_data_version(*{row[1] for row in rows})
+    return len(rows)
+
+
+def find_stock_drift(store_id=None):
+    """
+    [(ingredient_id, store_id, name, stored, expected)] for every opened
+    ingredient whose balance differs from its ledger, in one query that
+    replays each ingredient's ledger from its latest checkpoint only.
+    """
+    ingredients = _scoped(store_id).filter(ledger_opened_at__isnull=False)
+    rows = (
+        annotate_ledger_balance(ingredients)
+        .order_by('store_id', 'name', 'id')
+        .values_list('id', 'store_id', 'name', 'quantity_in_stock', 'ledger_balance')
+    )
+    return [row for row in rows if abs(row[3] - row[4]) > DRIFT_TOLERANCE]
+
+
+def reconcile_stock(store_id=None):
+    """
+    Move every drifted balance onto its ledger with one UPDATE and return
+    the drift that was repaired. The correction is applied as a delta, so
+    sales landing between the check and the repair are kept. Ingredients
+    without an opening balance are never touched (see open_stock_ledger).
+    Low-stock alerts of the whole scope are re-evaluated too, which also
+    opens them for balances that were low before alerts were tracked.
+    """
+    with transaction.atomic():
+        drift = find_stock_drift(store_id)
+        if drift:
+            _shift_balances({ing_id: expected - stored for ing_id, _, _, stored, expected in drift})
+        check_stock_alerts(list(_scoped(store_id).values_list('id', flat=True)))
+    return drift
@@ -1,3 +1,577 @@
-from django.test import TestCase
+import gzip
+import json
+from io import StringIO
+from datetime import date, timedelta
 
-# Create your tests here.
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import DataVersion, Store, User
+from core.tests import RecordingBroker
+from customers.models import Customer
+from sales.models import Order, PaymentMethod
+from core.utils import JAKARTA, local_day_start
+from .alerts import open_stock_alerts
+from .availability import store_availability
+from .models import (
+    Ingredient, MenuAvailability, SmoothieIngredient, SmoothieMenu, StockAlert, StockCheckpoint, StockEntry,
+)
+from .recipes import VERSION_KEY, recipe_cache
+from .snapshot import annotate_stock_at, build_checkpoints, daily_balances, shift_checkpoints, stock_snapshot
+from .stock import apply_stock_deltas, find_stock_drift, open_stock_ledger, reconcile_stock
+
+
+class RecipeCacheTests(TestCase):
+    def setUp(self):
+        self.smoothie = SmoothieMenu.objects.create(name="Mango", price=15000)
+        self.mango = Ingredient.objects.create(name="Mango", quantity_in_stock=100)
+        self.line = SmoothieIngredient.objects.create(smoothie=self.smoothie, ingredient=self.mango, amount=50)
+
+    def test_second_lookup_is_a_hit_without_queries(self):
+        recipe_cache.get(self.smoothie.id)
+        misses = recipe_cache.misses
+        recipe_cache.begin_request()
+        try:
+            # the shared version is read once per request, then lookups are free
+            with self.assertNumQueries(1):
+                recipe_cache.get(self.smoothie.id)
+                self.assertEqual(recipe_cache.get(self.smoothie.id), ((self.mango.id, 50),))
+        finally:
+            recipe_cache.end_request()
+        self.assertEqual(recipe_cache.misses, misses)
+
+    def test_version_bumped_by_another_worker_reloads(self):
+        recipe_cache.get(self.smoothie.id)
+        # another process's recipe write: new rows plus a bump of the shared counter
+        SmoothieIngredient.objects.filter(pk=self.line.pk).update(amount=90)
+        DataVersion.objects.filter(key=VERSION_KEY).update(version=F('version') + 1)
+        self.assertEqual(recipe_cache.get(self.smoothie.id), ((self.mango.id, 90),))
+
+    def test_recipe_writes_invalidate(self):
+        recipe_cache.get(self.smoothie.id)
+        self.line.amount = 70
+        self.line.save()
+        self.assertEqual(recipe_cache.get(self.smoothie.id), ((self.mango.id, 70),))
+
+        self.line.delete()
+        self.assertEqual(recipe_cache.get(self.smoothie.id), ())
+
+
+class StockSnapshotTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Snapshot Store", type='kiosk')
+        self.milk = Ingredient.objects.create(store=self.store, name="Milk", quantity_in_stock=0)
+        self.ice = Ingredient.objects.create(store=self.store, name="Ice", quantity_in_stock=0)
+        self.day = date(2025, 3, 10)
+
+    def entry(self, ingredient, quantity, day, hour, reason='manual_add'):
+        at = local_day_start(day) + timedelta(hours=hour)
+        entry = StockEntry.objects.create(ingredient=ingredient, quantity=quantity, reason=reason)
+        StockEntry.objects.filter(pk=entry.pk).update(timestamp=at)
+        Ingredient.objects.filter(pk=ingredient.pk).update(quantity_in_stock=ingredient.quantity_in_stock + quantity)
+        ingredient.refresh_from_db()
+        entry.refresh_from_db()
+        return entry
+
+    def at(self, day, hour):
+        return local_day_start(day) + timedelta(hours=hour)
+
+    def test_snapshot_without_checkpoints_uses_signed_ledger(self):
+        self.entry(self.milk, 1000, self.day, 8)
+        self.entry(self.milk, -300, self.day, 12, reason='sale_deduct')
+        self.entry(self.milk, 50, self.day, 15, reason='sale_cancellation')
+        self.entry(self.ice, 200, self.day, 9)
+
+        with self.assertNumQueries(1):
+            snapshot = stock_snapshot(self.store.id, self.at(self.day, 13))
+        self.assertEqual(
+            [(row['name'], row['quantity']) for row in snapshot],
+            [("Ice", 200.0), ("Milk", 700.0)],
+        )
+
+    def test_checkpoint_bounds_the_ledger_replay(self):
+        self.entry(self.milk, 1000, self.day, 8)
+        self.entry(self.milk, -100, self.day + timedelta(days=1), 10, reason='sale_deduct')
+        build_checkpoints(self.day)
+        self.assertEqual(StockCheckpoint.objects.get(ingredient=self.milk, day=self.day).quantity, 1000)
+
+        # Rows before the checkpoint are no longer read: dropping them changes nothing
+        StockEntry.objects.filter(timestamp__lt=self.at(self.day, 9)).delete()
+        snapshot = dict(
+            annotate_stock_at(Ingredient.objects.all(), self.at(self.day + timedelta(days=1), 12))
+            .values_list('name', 'stock_at')
+        )
+        self.assertEqual(snapshot, {"Milk": 900.0, "Ice": 0.0})
+
+    def test_checkpoints_chain_and_match_fallback(self):
+        for offset in range(3):
+            day = self.day + timedelta(days=offset)
+            self.entry(self.milk, 500, day, 8)
+            self.entry(self.milk, -120, day, 13, reason='sale_deduct')
+        expected = {
+            hour: stock_snapshot(self.store.id, self.at(self.day + timedelta(days=2), hour))
+            for hour in (0, 10, 20)
+        }
+        call_command('build_stock_checkpoints', through=str(self.day + timedelta(days=1)), days=2, stdout=StringIO())
+        self.assertEqual(
+            list(StockCheckpoint.objects.filter(ingredient=self.milk).order_by('day').values_list('day', 'quantity')),
+            [(self.day, 380.0), (self.day + timedelta(days=1), 760.0)],
+        )
+        for hour, rows in expected.items():
+            self.assertEqual(stock_snapshot(self.store.id, self.at(self.day + timedelta(days=2), hour)), rows)
+
+    def test_shift_checkpoints_carries_ledger_edits(self):
+        entry = self.entry(self.milk, 1000, self.day, 8)
+        build_checkpoints(self.day)
+        StockEntry.objects.filter(pk=entry.pk).update(quantity=800)
+        shift_checkpoints(self.milk.id, entry.timestamp, -200)
+        self.assertEqual(StockCheckpoint.objects.get(ingredient=self.milk).quantity, 800)
+
+    def test_daily_balances(self):
+        self.entry(self.milk, 1000, self.day, 8)
+        self.entry(self.milk, -250, self.day + timedelta(days=1), 12, reason='sale_deduct')
+        self.entry(self.milk, -250, self.day + timedelta(days=3), 12, reason='sale_deduct')
+        self.assertEqual(
+            daily_balances(self.milk.id, self.day - timedelta(days=1), self.day + timedelta(days=3)),
+            [
+                (self.day - timedelta(days=1), 0.0),
+                (self.day, 1000.0),
+                (self.day + timedelta(days=1), 750.0),
+                (self.day + timedelta(days=2), 750.0),
+                (self.day + timedelta(days=3), 500.0),
+            ],
+        )
+
+
+class LedgerConsistencyTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Ledger Store", type='kiosk')
+        self.milk = self.ingredient("Milk")
+        user = User.objects.create_user("manager", password="x", role="manager", store=self.store)
+        self.client.force_login(user)
+
+    def ingredient(self, name):
+        # created empty with the ledger already kept, as ingredient_create does
+        return Ingredient.objects.create(
+            store=self.store, name=name, quantity_in_stock=0, ledger_opened_at=timezone.now(),
+        )
+
+    def ledger(self, ingredient):
+        return StockEntry.objects.filter(ingredient=ingredient).aggregate(total=Sum('quantity'))['total'] or 0
+
+    def assertInLedger(self, ingredient, quantity):
+        ingredient.refresh_from_db()
+        self.assertEqual(ingredient.quantity_in_stock, quantity)
+        self.assertEqual(self.ledger(ingredient), quantity)
+
+    def test_add_stock_writes_entry_and_delta(self):
+        self.client.post(reverse('add_stock'), {'ingredient': self.milk.id, 'quantity': 500})
+        self.client.post(reverse('add_stock'), {'ingredient': self.milk.id, 'quantity': 250})
+        self.assertInLedger(self.milk, 750)
+
+    def test_ingredient_form_quantity_is_a_stock_count(self):
+        self.client.post(reverse('ingredient_create'), {
+            'name': "Ice", 'unit': 'g', 'quantity_in_stock': 400, 'low_stock_threshold': 10,
+        })
+        ice = Ingredient.objects.get(name="Ice")
+        self.assertInLedger(ice, 400)
+        self.assertIsNotNone(ice.ledger_opened_at)
+
+        self.assertEqual(StockEntry.objects.get(ingredient=ice).reason, 'opening_balance')
+
+        self.client.post(reverse('ingredient_update', args=[ice.id]), {
+            'name': "Crushed Ice", 'unit': 'g', 'quantity_in_stock': 350, 'initial-quantity_in_stock': 400,
+            'low_stock_threshold': 10,
+        })
+        self.assertInLedger(ice, 350)
+        self.assertEqual(ice.name, "Crushed Ice")
+        self.assertEqual(StockEntry.objects.filter(ingredient=ice, reason='stock_count').count(), 1)
+
+    def test_stale_edit_form_does_not_undo_sales(self):
+        self.client.post(reverse('ingredient_create'), {
+            'name': "Ice", 'unit': 'g', 'quantity_in_stock': 100, 'low_stock_threshold': 10,
+        })
+        ice = Ingredient.objects.get(name="Ice")
+        page = self.client.get(reverse('ingredient_update', args=[ice.id]))
+        self.assertContains(page, 'name="initial-quantity_in_stock"')
+        apply_stock_deltas({ice.id: -30}, 'sale_deduct')
+
+        # Renamed from a page loaded before the sale: the quantity field still says 100
+        self.client.post(reverse('ingredient_update', args=[ice.id]), {
+            'name': "Crushed Ice", 'unit': 'g', 'quantity_in_stock': 100, 'initial-quantity_in_stock': 100,
+            'low_stock_threshold': 10,
+        })
+        self.assertInLedger(ice, 70)
+        self.assertEqual(ice.name, "Crushed Ice")
+        self.assertFalse(StockEntry.objects.filter(ingredient=ice, reason='stock_count').exists())
+
+    def test_entry_edit_and_delete_move_balance_and_checkpoints(self):
+        ice = self.ingredient("Ice")
+        apply_stock_deltas({self.milk.id: 1000}, 'manual_add')
+        entry = StockEntry.objects.get(ingredient=self.milk)
+        build_checkpoints(timezone.localdate(entry.timestamp, JAKARTA))
+
+        self.client.post(reverse('stockentry_edit', args=[entry.id]), {'ingredient': self.milk.id, 'quantity': 800})
+        self.assertInLedger(self.milk, 800)
+        self.assertEqual(StockCheckpoint.objects.get(ingredient=self.milk).quantity, 800)
+
+        self.client.post(reverse('stockentry_edit', args=[entry.id]), {'ingredient': ice.id, 'quantity': 800})
+        self.assertInLedger(self.milk, 0)
+        self.assertInLedger(ice, 800)
+
+        self.client.post(reverse('stockentry_delete', args=[entry.id]))
+        self.assertInLedger(ice, 0)
+        self.assertEqual(StockCheckpoint.objects.get(ingredient=ice).quantity, 0)
+        self.assertEqual(find_stock_drift(), [])
+
+    def test_drift_survives_the_first_checkpoint_build(self):
+        apply_stock_deltas({self.milk.id: 100}, 'manual_add')
+        apply_stock_deltas({self.milk.id: -10}, 'sale_deduct')
+        Ingredient.objects.filter(pk=self.milk.pk).update(quantity_in_stock=500)  # a stray write
+        drift = [(self.milk.id, self.store.id, "Milk", 500.0, 90.0)]
+        self.assertEqual(find_stock_drift(), drift)
+
+        build_checkpoints(timezone.localdate(timezone.now(), JAKARTA))
+        self.assertEqual(StockCheckpoint.objects.get(ingredient=self.milk).quantity, 90)
+        self.assertEqual(find_stock_drift(), drift)
+        self.assertEqual(reconcile_stock(), drift)
+        self.assertInLedger(self.milk, 90)
+
+    def test_reconcile_replays_from_the_latest_checkpoint(self):
+        ice = self.ingredient("Ice")
+        apply_stock_deltas({self.milk.id: 1000, ice.id: 300}, 'manual_add')
+        yesterday = timezone.localdate(timezone.now(), JAKARTA) - timedelta(days=1)
+        StockEntry.objects.update(timestamp=local_day_start(yesterday) + timedelta(hours=8))
+        build_checkpoints(yesterday)
+        # Covered by the checkpoint, so reconcile never reads it again
+        StockEntry.objects.filter(ingredient=self.milk).delete()
+        apply_stock_deltas({self.milk.id: -100}, 'sale_deduct')
+        Ingredient.objects.filter(pk=self.milk.pk).update(quantity_in_stock=5)
+
+        with self.assertRaises(CommandError):
+            call_command('reconcile_stock', check=True, stdout=StringIO())
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.quantity_in_stock, 5)
+
+        repaired = reconcile_stock()
+        self.assertEqual(repaired, [(self.milk.id, self.store.id, "Milk", 5.0, 900.0)])
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.quantity_in_stock, 900)
+
+        out = StringIO()
+        call_command('reconcile_stock', check=True, stdout=out)
+        self.assertIn("match the ledger", out.getvalue())
+
+    def test_legacy_balance_needs_an_opening_entry_before_reconcile(self):
+        # Created before the ledger was kept: its stock has no entries, only later sales do
+        mango = Ingredient.objects.create(store=self.store, name="Mango", quantity_in_stock=4800)
+        StockEntry.objects.create(ingredient=mango, quantity=-200, reason='sale_deduct')
+
+        self.assertEqual(find_stock_drift(), [])
+        with self.assertRaises(CommandError):
+            call_command('reconcile_stock', stdout=StringIO())
+        self.assertEqual(reconcile_stock(), [])
+        mango.refresh_from_db()
+        self.assertEqual(mango.quantity_in_stock, 4800)
+
+        call_command('open_stock_ledger', stdout=StringIO())
+        self.assertEqual(StockEntry.objects.get(ingredient=mango, reason='opening_balance').quantity, 5000)
+        self.assertInLedger(mango, 4800)
+        self.assertEqual(open_stock_ledger(), 0)
+
+        call_command('reconcile_stock', stdout=StringIO())
+        self.assertInLedger(mango, 4800)
+
+
+@override_settings(EVENT_BROKER='core.tests.RecordingBroker')
+class StockAlertTests(TestCase):
+    def setUp(self):
+        RecordingBroker.published.clear()
+        self.store = Store.objects.create(name="Alert Store", type='kiosk')
+        self.milk = Ingredient.objects.create(store=self.store, name="Milk", low_stock_threshold=100)
+        self.ice = Ingredient.objects.create(store=self.store, name="Ice", low_stock_threshold=100)
+        apply_stock_deltas({self.milk.id: 500, self.ice.id: 500}, 'manual_add')
+
+    def move(self, quantity):
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_stock_deltas({self.milk.id: quantity}, 'manual_add' if quantity > 0 else 'sale_deduct')
+
+    def test_crossing_opens_one_alert_until_recovered_past_the_margin(self):
+        self.move(-450)
+        self.move(-10)  # still low: no second alert or event
+        self.assertEqual(StockAlert.objects.filter(resolved_at__isnull=True).count(), 1)
+        self.assertEqual([event for _, event, _ in RecordingBroker.published], ['low-stock'])
+
+        self.move(65)  # 105 is above the threshold but inside the hysteresis band
+        alert = StockAlert.objects.get()
+        self.assertIsNone(alert.resolved_at)
+        self.assertEqual((alert.store_id, alert.threshold, alert.quantity), (self.store.id, 100, 50))
+
+        self.move(20)
+        alert.refresh_from_db()
+        self.assertIsNotNone(alert.resolved_at)
+
+        self.move(-30)
+        self.assertEqual(StockAlert.objects.count(), 2)
+        self.assertEqual(len(RecordingBroker.published), 2)
+
+    def test_open_alerts_are_read_per_store(self):
+        other = Store.objects.create(name="Other", type='kiosk')
+        lemon = Ingredient.objects.create(store=other, name="Lemon", low_stock_threshold=10)
+        apply_stock_deltas({lemon.id: -1, self.milk.id: -450}, 'sale_deduct')
+
+        with self.assertNumQueries(1):
+            alerts = list(open_stock_alerts(self.store.id))
+        self.assertEqual([alert.ingredient.name for alert in alerts], ["Milk"])
+
+        user = User.objects.create_user("manager", password="x", role="manager", store=self.store)
+        self.client.force_login(user)
+        response = self.client.get(reverse('inventory_dashboard'))
+        self.assertEqual(response.context['low_stock_ids'], {self.milk.id})
+        self.assertContains(response, 'class="low-stock"', count=1)
+
+    def test_threshold_edit_is_checked(self):
+        user = User.objects.create_user("manager", password="x", role="manager", store=self.store)
+        self.client.force_login(user)
+        self.client.post(reverse('ingredient_update', args=[self.ice.id]), {
+            'name': "Ice", 'unit': 'g', 'quantity_in_stock': 500, 'low_stock_threshold': 600,
+        })
+        self.assertEqual(list(StockAlert.objects.values_list('ingredient_id', 'threshold')), [(self.ice.id, 600)])
+
+
+class StockEntryListTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Main", type='kiosk')
+        self.other = Store.objects.create(name="Other", type='kiosk')
+        self.milk = Ingredient.objects.create(store=self.store, name="Milk")
+        self.ice = Ingredient.objects.create(store=self.store, name="Ice")
+        self.lemon = Ingredient.objects.create(store=self.other, name="Lemon")
+        self.day = date(2025, 3, 10)
+        entries = [
+            StockEntry(ingredient=ingredient, quantity=quantity, reason=reason)
+            for ingredient, quantity, reason in [
+                (self.milk, 100, 'manual_add'), (self.milk, -5, 'sale_deduct'),
+                (self.ice, 50, 'manual_add'), (self.lemon, 20, 'manual_add'),
+            ] * 30
+        ]
+        StockEntry.objects.bulk_create(entries)
+        for i, entry in enumerate(StockEntry.objects.order_by('id')):
+            # two hours apart, starting 08:00 Jakarta on self.day
+            StockEntry.objects.filter(pk=entry.pk).update(timestamp=local_day_start(self.day) + timedelta(hours=8 + 2 * i))
+
+    def login(self, role):
+        user = User.objects.create_user(role, password="x", role=role, store=self.store)
+        self.client.force_login(user)
+
+    def test_keyset_pages_cover_the_store_once(self):
+        self.login('manager')
+        seen, params = [], {}
+        while True:
+            response = self.client.get(reverse('stockentry_list'), params)
+            page = response.context['page']
+            seen += [entry.id for entry in page]
+            if not page.has_next:
+                break
+            params = {'cursor': page.next_cursor}
+        self.assertEqual(len(seen), 90)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertFalse(StockEntry.objects.filter(id__in=seen, ingredient=self.lemon).exists())
+
+    def test_filters(self):
+        self.login('admin')
+        response = self.client.get(reverse('stockentry_list'), {'store': self.other.id})
+        self.assertEqual({entry.ingredient_id for entry in response.context['page']}, {self.lemon.id})
+
+        response = self.client.get(reverse('stockentry_list'), {'ingredient': self.milk.id, 'reason': 'sale_deduct'})
+        self.assertEqual(len(response.context['page']), 30)
+
+        # 12 entries a day; the second Jakarta day holds entries 8..19
+        second = str(self.day + timedelta(days=1))
+        response = self.client.get(reverse('stockentry_list'), {'start_date': second, 'end_date': second})
+        self.assertEqual(len(response.context['page']), 12)
+
+    def test_cashier_sees_manual_additions_only(self):
+        self.login('cashier')
+        response = self.client.get(reverse('stockentry_list'), {'reason': 'sale_deduct'})
+        self.assertEqual(len(response.context['page']), 0)
+
+    def test_streaming_exports(self):
+        self.login('manager')
+        response = self.client.get(reverse('stockentry_list'), {'export': 'csv', 'ingredient': self.ice.id})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,timestamp,store,ingredient,quantity,unit,reason')
+        self.assertEqual(len(lines), 31)
+        self.assertIn('Main,Ice,50.0,ml,Manual Addition', lines[1])
+
+        response = self.client.get(reverse('stockentry_list'), {'export': 'csv', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('stock_entries.csv.gz', response['Content-Disposition'])
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 91)
+        self.assertIn('2025-03-10T08:00:00+07:00', lines[1])
+
+
+class DeliveryIntakeTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Main", type='kiosk')
+        other = Store.objects.create(name="Other", type='kiosk')
+        self.ingredients = Ingredient.objects.bulk_create([
+            Ingredient(store=self.store, name=f"Ing {i}", quantity_in_stock=0) for i in range(40)
+        ])
+        self.foreign = Ingredient.objects.create(store=other, name="Foreign")
+        user = User.objects.create_user("receiver", password="x", role="manager", store=self.store)
+        self.client.force_login(user)
+
+    def post_api(self, payload):
+        return self.client.post(reverse('delivery_intake_api'), json.dumps(payload), content_type='application/json')
+
+    def test_large_delivery_in_a_handful_of_queries(self):
+        lines = [{'ingredient': self.ingredients[i % 40].id, 'quantity': 10} for i in range(480)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post_api({'lines': lines})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['booked']), 40)
+        # session/user lookups, ingredients, ledger insert, balance UPDATE, alert check,
+        # availability refresh, savepoints
+        self.assertLessEqual(len(ctx.captured_queries), 12)
+
+        for ingredient in Ingredient.objects.filter(store=self.store):
+            self.assertEqual(ingredient.quantity_in_stock, 120)
+        self.assertEqual(StockEntry.objects.filter(reason='manual_add').count(), 40)
+        self.assertEqual(find_stock_drift(), [])
+
+    def test_bad_line_rejects_the_whole_delivery(self):
+        response = self.post_api({'lines': [
+            {'ingredient': "ing 1", 'quantity': 5},
+            {'ingredient': self.foreign.id, 'quantity': 5},
+            {'ingredient': "Ing 2", 'quantity': -1},
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['errors']), 2)
+        self.assertFalse(StockEntry.objects.exists())
+
+    def test_back_dated_delivery_shifts_closed_checkpoints(self):
+        milk = self.ingredients[0]
+        yesterday = timezone.localdate(timezone.now(), JAKARTA) - timedelta(days=1)
+        build_checkpoints(yesterday)
+        delivered_at = local_day_start(yesterday) + timedelta(hours=9)
+
+        response = self.post_api({'lines': [{'ingredient': milk.name, 'quantity': 300}],
+                                  'delivered_at': delivered_at.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StockEntry.objects.get().timestamp, delivered_at)
+        self.assertEqual(StockCheckpoint.objects.get(ingredient=milk, day=yesterday).quantity, 300)
+        self.assertEqual(StockCheckpoint.objects.get(ingredient=self.ingredients[1], day=yesterday).quantity, 0)
+
+    def test_csv_and_json_uploads(self):
+        csv_file = SimpleUploadedFile(
+            "delivery.csv", "\ufeffingredient,quantity,unit\nIng 0,100,ml\nIng 1,50.5,ml\nIng 0,25,ml\n".encode(),
+        )
+        response = self.client.post(reverse('delivery_intake'), {'file': csv_file})
+        self.assertRedirects(response, reverse('inventory_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(
+            dict(Ingredient.objects.filter(quantity_in_stock__gt=0).values_list('name', 'quantity_in_stock')),
+            {"Ing 0": 125, "Ing 1": 50.5},
+        )
+
+        json_file = SimpleUploadedFile("delivery.json", json.dumps([{'ingredient': "Nope", 'quantity': 1}]).encode())
+        response = self.client.post(reverse('delivery_intake'), {'file': json_file})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['errors'], ["Line 1: unknown ingredient 'Nope' for this store."])
+
+
+class MenuAvailabilityTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Main", type='kiosk')
+        self.milk = Ingredient.objects.create(store=self.store, name="Milk")
+        self.ice = Ingredient.objects.create(store=self.store, name="Ice")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shake = SmoothieMenu.objects.create(name="Shake", price=15000)
+            self.shake.stores.add(self.store)
+            SmoothieIngredient.objects.create(smoothie=self.shake, ingredient=self.milk, amount=200)
+            self.ice_line = SmoothieIngredient.objects.create(smoothie=self.shake, ingredient=self.ice, amount=100)
+            self.water = SmoothieMenu.objects.create(name="Water", price=5000)  # no recipe: never limited
+            self.water.stores.add(self.store)
+        apply_stock_deltas({self.milk.id: 1000, self.ice.id: 350}, 'manual_add')
+
+    def test_stock_writes_refresh_the_smoothies_using_them(self):
+        self.assertEqual(store_availability(self.store.id), {self.shake.id: 3, self.water.id: None})
+
+        apply_stock_deltas({self.ice.id: -150}, 'sale_deduct')
+        self.assertEqual(store_availability(self.store.id)[self.shake.id], 2)
+        apply_stock_deltas({self.milk.id: -700}, 'sale_deduct')
+        self.assertEqual(store_availability(self.store.id)[self.shake.id], 1)
+        apply_stock_deltas({self.milk.id: -400}, 'sale_deduct')  # negative stock serves nothing
+        self.assertEqual(store_availability(self.store.id)[self.shake.id], 0)
+
+        with self.assertNumQueries(1):
+            store_availability(self.store.id)
+
+    def test_recipe_and_menu_changes_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ice_line.amount = 50
+            self.ice_line.save()
+        self.assertEqual(store_availability(self.store.id)[self.shake.id], 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shake.stores.remove(self.store)
+        self.assertEqual(store_availability(self.store.id), {self.water.id: None})
+
+    def test_create_order_refuses_more_than_servable(self):
+        user = User.objects.create_user("cashier", password="x", role="cashier", store=self.store)
+        self.client.force_login(user)
+        cash = PaymentMethod.objects.create(name="Cash")
+        order = {'name': "Guest", 'payment_method': cash.id}
+        response = self.client.post(
+            reverse('create_order'), {**order, 'new_phone': "0812345678", f'smoothie_{self.shake.id}': 4},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context['cart_errors'], ["Only 3 cups of Shake can be made with the current stock."],
+        )
+        self.assertFalse(StockEntry.objects.filter(reason='sale_deduct').exists())
+        # a refused order leaves no customer behind
+        self.assertFalse(Customer.objects.exists())
+
+        response = self.client.post(reverse('create_order'), {**order, f'smoothie_{self.shake.id}': 3})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(store_availability(self.store.id)[self.shake.id], 0)
+
+    def test_create_order_checks_shared_ingredients_across_the_cart(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            latte = SmoothieMenu.objects.create(name="Latte", price=18000)
+            latte.stores.add(self.store)
+            SmoothieIngredient.objects.create(smoothie=latte, ingredient=self.milk, amount=300)
+        user = User.objects.create_user("cashier", password="x", role="cashier", store=self.store)
+        self.client.force_login(user)
+        cash = PaymentMethod.objects.create(name="Cash")
+
+        # 2 shakes (400 ml) and 3 lattes (900 ml) each fit on their own, but not together
+        response = self.client.post(reverse('create_order'), {
+            'name': "Guest", 'payment_method': cash.id, 'new_phone': "0812345678",
+            f'smoothie_{self.shake.id}': 2, f'smoothie_{latte.id}': 3,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context['cart_errors'], ["Not enough Milk: the order needs 1300 ml, only 1000 in stock."],
+        )
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.quantity_in_stock, 1000)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Customer.objects.exists())
+
+    def test_rebuild_command(self):
+        MenuAvailability.objects.update(cups=99)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_menu_availability', check=True, stdout=StringIO())
+        call_command('rebuild_menu_availability', stdout=StringIO())
+        call_command('rebuild_menu_availability', check=True, stdout=StringIO())
+        self.assertEqual(store_availability(self.store.id)[self.shake.id], 3)
@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path('', views.inventory_dashboard, name='inventory_dashboard'),
     path('add-stock/', views.add_stock, name='add_stock'),
+    path('deliveries/', views.delivery_intake, name='delivery_intake'),
+    path('deliveries/api/', views.delivery_intake_api, name='delivery_intake_api'),
     path('stock-entries/', views.stockentry_list, name='stockentry_list'),
     path('stock-entries/<int:pk>/edit/', views.stockentry_edit, name='stockentry_edit'),
     path('stock-entries/<int:pk>/delete/', views.stockentry_delete, name='stockentry_delete'),
@@ -2,13 +2,23 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 # from django.db.models import F  # ✅ Import F from django.db.models
 from .models import Ingredient, StockEntry, SmoothieMenu, SmoothieIngredient
+from .alerts import check_stock_alerts, open_stock_alerts
+from .deliveries import DeliveryError, intake_delivery, parse_delivered_at, parse_delivery_csv
+from .stock import apply_stock_deltas, count_stock, remove_entry, revise_entry
+from core.data_versions import bump_data_version
+from django.db import transaction
 
 from .forms import StockEntryForm, IngredientForm, SmoothieIngredientForm, SmoothieMenuForm, StockEntryEditForm
 from django.contrib import messages
 from django.utils import timezone
-from django.http import HttpResponse
-import csv
-import pytz
+from django.utils.dateparse import parse_date
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+import json
+from core.models import Store
+from core.pagination import keyset_page
+from core.streaming import export_response
+from core.utils import JAKARTA, filter_local_dates
 
 
 
@@ -16,9 +26,11 @@ import pytz
 @login_required
 def inventory_dashboard(request):
     ingredients = Ingredient.objects.filter(store=request.user.store)
-    # low_stock = ingredients.filter(quantity_in_stock__lt=5)  # ✅ fixed threshold
+    alerts = list(open_stock_alerts(request.user.store_id))
     return render(request, 'inventory/dashboard.html', {
         'ingredients': ingredients,
+        'alerts': alerts,
+        'low_stock_ids': {alert.ingredient_id for alert in alerts},
         'role': request.user.role,
     })
 
@@ -27,19 +39,13 @@ def add_stock(request):
     if request.method == 'POST':
         form = StockEntryForm(request.POST)
         if form.is_valid():
-            entry = form.save(commit=False)
-            entry.reason = 'manual_add'
-            jakarta_tz = pytz.timezone("Asia/Jakarta")
-            now_jakarta = timezone.now().astimezone(jakarta_tz)
-            entry.timestamp = now_jakarta
-            entry.save()
-
-            # Update actual stock
-            ingredient = entry.ingredient
-            ingredient.quantity_in_stock += entry.quantity
-            ingredient.save()
-
-            messages.success(request, f"Successfully added {entry.quantity} {ingredient.unit} to {ingredient.name}.")
+            ingredient = form.cleaned_data['ingredient']
+            quantity = form.cleaned_data['quantity']
+            # Ledger row and balance move together; the F() delta is safe under concurrent sales
+            apply_stock_deltas({ingredient.id: quantity}, 'manual_add')
+            bump_data_version(ingredient.store_id)
+
+            messages.success(request, f"Successfully added {quantity} {ingredient.unit} to {ingredient.name}.")
             return redirect('inventory_dashboard')
     else:
         form = StockEntryForm()
@@ -59,7 +65,13 @@ def ingredient_create(request):
         if form.is_valid():
             ingredient = form.save(commit=False)   # don't save yet
             ingredient.store = request.user.store  # assign store
-            ingredient.save()                      # now save
+            opening = ingredient.quantity_in_stock
+            ingredient.quantity_in_stock = 0       # the opening stock goes through the ledger
+            ingredient.ledger_opened_at = timezone.now()
+            with transaction.atomic():
+                ingredient.save()                  # now save
+                apply_stock_deltas({ingredient.id: opening}, 'opening_balance')
+            bump_data_version(ingredient.store_id)
             return redirect('inventory_dashboard')
     else:
         form = IngredientForm()
@@ -71,7 +83,13 @@ def ingredient_update(request, pk):
     if request.method == 'POST':
         form = IngredientForm(request.POST, instance=ingredient)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save(commit=False).save(update_fields=['name', 'unit', 'low_stock_threshold'])
+                if 'quantity_in_stock' in form.changed_data:
+                    # A new quantity is a stock count, booked as a ledger adjustment
+                    count_stock(ingredient.id, form.cleaned_data['quantity_in_stock'])
+                check_stock_alerts([ingredient.id])  # the threshold may have moved
+            bump_data_version(ingredient.store_id)
             return redirect('inventory_dashboard')
     else:
         form = IngredientForm(instance=ingredient)
@@ -82,48 +100,171 @@ def ingredient_delete(request, pk):
     ingredient = get_object_or_404(Ingredient, pk=pk)
     if request.method == 'POST':
         ingredient.delete()
+        bump_data_version(ingredient.store_id)
         return redirect('inventory_dashboard')
     return render(request, 'inventory/ingredient_confirm_delete.html', {'ingredient': ingredient, 'role': request.user.role,})
 
+STOCK_ENTRY_PAGE_SIZE = 50
+EXPORT_CHUNK_SIZE = 2000
+REASON_LABELS = dict(StockEntry._meta.get_field('reason').choices)
+
+
+def _int_param(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
 @login_required
 def stockentry_list(request):
     user = request.user
-
+    # Admins browse every store (or pick one); everyone else only their own
+    store_id = _int_param(request.GET.get('store')) if user.role == 'admin' else user.store_id
+    ingredient_id = _int_param(request.GET.get('ingredient'))
+    reason = request.GET.get('reason') if request.GET.get('reason') in REASON_LABELS else None
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date')
+
+    entries = StockEntry.objects.all()
     if user.role == 'cashier':
-        entries = StockEntry.objects.select_related('ingredient').filter(reason='manual_add').order_by('-timestamp')
-    else:
-        entries = StockEntry.objects.select_related('ingredient').order_by('-timestamp')
+        entries = entries.filter(reason='manual_add')
+    if store_id:
+        entries = entries.filter(ingredient__store_id=store_id)
+    if ingredient_id:
+        entries = entries.filter(ingredient_id=ingredient_id)
+    if reason:
+        entries = entries.filter(reason=reason)
+    # Jakarta-local days as half-open timestamp ranges (index friendly)
+    entries = filter_local_dates(
+        entries, 'timestamp',
+        parse_date(start_date_str) if start_date_str else None,
+        parse_date(end_date_str) if end_date_str else None,
+    )
 
+    export = request.GET.get('export')
+    if export:
+        rows = (
+            entries.order_by('timestamp', 'id')
+            .values_list('id', 'timestamp', 'ingredient__store__name', 'ingredient__name',
+                         'quantity', 'ingredient__unit', 'reason')
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        rows = (
+            (pk, timestamp.astimezone(JAKARTA).isoformat(), *rest, REASON_LABELS.get(reason, reason))
+            for pk, timestamp, *rest, reason in rows
+        )
+        header = ['id', 'timestamp', 'store', 'ingredient', 'quantity', 'unit', 'reason']
+        fmt = 'ndjson' if export == 'ndjson' else 'csv'  # ?export=true is the old CSV link
+        return export_response(fmt, 'stock_entries', header, rows, compress='gzip' in request.GET)
+
+    page = keyset_page(
+        entries.select_related('ingredient'), 'timestamp',
+        cursor=request.GET.get('cursor'), per_page=STOCK_ENTRY_PAGE_SIZE,
+    )
 
-    if 'export' in request.GET:
-        # CSV export
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="stock_entries.csv"'
+    ingredients = Ingredient.objects.order_by('name')
+    if store_id:
+        ingredients = ingredients.filter(store_id=store_id)
+    filters = request.GET.copy()
+    for key in ('cursor', 'export', 'gzip'):
+        filters.pop(key, None)
+
+    return render(request, 'inventory/stockentry_list.html', {
+        'entries': page,
+        'page': page,
+        'stores': Store.objects.order_by('name') if user.role == 'admin' else [],
+        'ingredients': ingredients.values_list('id', 'name'),
+        'reasons': REASON_LABELS.items(),
+        'selected': {
+            'store': store_id, 'ingredient': ingredient_id, 'reason': reason,
+            'start_date': start_date_str or '', 'end_date': end_date_str or '',
+        },
+        'filter_query': filters.urlencode(),
+        'role': request.user.role,
+    })
 
-        writer = csv.writer(response)
-        writer.writerow(['Ingredient', 'Quantity', 'Unit', 'Timestamp', 'Reason'])
+def _delivery_from_upload(upload, delivered_at):
+    """(lines, delivered_at) from an uploaded .csv or .json delivery file."""
+    try:
+        text = upload.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise DeliveryError(["The file must be UTF-8 text."])
+    if upload.name.lower().endswith('.json'):
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            raise DeliveryError(["The file is not valid JSON."])
+        if isinstance(payload, dict):
+            return payload.get('lines'), payload.get('delivered_at') or delivered_at
+        return payload, delivered_at
+    return parse_delivery_csv(text), delivered_at
 
-        for entry in entries:
-            writer.writerow([
-                entry.ingredient.name,
-                entry.quantity,
-                entry.ingredient.unit,
-                entry.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                entry.get_reason_display()
-            ])
-        return response
 
-    return render(request, 'inventory/stockentry_list.html', {'entries': entries, 'role': request.user.role,})
+@login_required
+def delivery_intake(request):
+    """Upload a supplier delivery (CSV or JSON file) and book all its lines at once."""
+    errors = []
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        try:
+            if upload is None:
+                raise DeliveryError(["Choose a .csv or .json delivery file."])
+            lines, delivered_at = _delivery_from_upload(upload, request.POST.get('delivered_at'))
+            booked = intake_delivery(
+                request.user.store, lines, parse_delivered_at(delivered_at) if delivered_at else None,
+            )
+        except DeliveryError as e:
+            errors = e.errors
+        else:
+            messages.success(request, f"Delivery booked: {len(booked)} ingredients restocked.")
+            return redirect('inventory_dashboard')
+
+    return render(request, 'inventory/delivery_intake.html', {'errors': errors, 'role': request.user.role})
+
+
+@require_POST
+@login_required
+def delivery_intake_api(request):
+    """
+    Book a delivery from a JSON body {"lines": [{"ingredient", "quantity"}], "delivered_at"?};
+    ingredient is an id or a name of the user's store.
+    """
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'errors': ['Expected a JSON body like {"lines": [...]}.']}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'errors': ['Expected a JSON body like {"lines": [...]}.']}, status=400)
+
+    try:
+        delivered_at = parse_delivered_at(payload['delivered_at']) if payload.get('delivered_at') else None
+        booked = intake_delivery(request.user.store, payload.get('lines'), delivered_at)
+    except DeliveryError as e:
+        return JsonResponse({'errors': e.errors}, status=400)
+    return JsonResponse({
+        'booked': [{'ingredient': ingredient.id, 'name': ingredient.name, 'quantity': quantity}
+                   for ingredient, quantity in booked],
+    })
+
 
 @login_required
 def stockentry_edit(request, pk):
     entry = get_object_or_404(StockEntry, pk=pk)
 
     if request.method == 'POST':
-        form = StockEntryEditForm(request.POST, instance=entry)
-        if form.is_valid():
-            form.save()
-            return redirect('stockentry_list')
+        with transaction.atomic():
+            # Lock the entry so concurrent edits each see the quantity the other left
+            entry = StockEntry.objects.select_for_update().select_related('ingredient').get(pk=entry.pk)
+            old_ingredient = entry.ingredient
+            old_quantity = entry.quantity
+            form = StockEntryEditForm(request.POST, instance=entry)
+            if form.is_valid():
+                form.save()
+                revise_entry(entry, old_ingredient.id, old_quantity)
+                if old_ingredient.store_id != entry.ingredient.store_id:
+                    bump_data_version(old_ingredient.store_id)
+                return redirect('stockentry_list')
     else:
         form = StockEntryEditForm(instance=entry)
 
@@ -134,7 +275,8 @@ def stockentry_delete(request, pk):
     entry = get_object_or_404(StockEntry, pk=pk)
 
     if request.method == 'POST':
-        entry.delete()
+        remove_entry(entry)
+        bump_data_version(entry.ingredient.store_id)
         return redirect('stockentry_list')
 
     return render(request, 'inventory/stockentry_delete_confirm.html', {'entry': entry, 'role': request.user.role,})
@@ -0,0 +1,142 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Max, Sum
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from core.utils import JAKARTA, local_date_bounds
+from .models import Order, OrderChange, OrderItem
+
+# Changes younger than this are re-sent on the next poll, so a transaction
+# that took an earlier id but committed late is never skipped by the cursor.
+SETTLE_SECONDS = 2
+
+
+def today_range():
+    """Half-open [start, end) bounds of today in Jakarta time."""
+    today = timezone.now().astimezone(JAKARTA).date()
+    return local_date_bounds(today, today)
+
+
+def store_scope(user):
+    """Admins watch every store; everyone else only their own."""
+    if user.role == "admin":
+        return {}
+    return {"store": user.store}
+
+
+def order_lane(order):
+    if order.is_served:
+        return "served"
+    if order.is_ready:
+        return "ready"
+    return "pending"
+
+
+def build_board(scope):
+    """
+    Today's board from a single order query (plus its prefetches), split
+    into the pending/ready/served lanes and the pending cups per menu.
+    """
+    start_of_day, end_of_day = today_range()
+    orders = (
+        Order.objects
+        .filter(created_at__gte=start_of_day, created_at__lt=end_of_day, **scope)
+        .select_related('payment_method', 'customer')
+        .prefetch_related('orderitem_set__smoothie')
+        .order_by('created_at')
+    )
+
+    lanes = {'pending': [], 'ready': [], 'served': []}
+    pending_qty = defaultdict(int)
+    for order in orders:
+        lane = order_lane(order)
+        lanes[lane].append(order)
+        if lane == 'pending':
+            for item in order.orderitem_set.all():
+                pending_qty[item.smoothie.name] += item.quantity
+
+    lanes['ready'].sort(key=lambda o: o.ready_at or o.created_at)
+    lanes['served'].sort(key=lambda o: o.served_at or o.created_at)
+
+    summary = [
+        {'smoothie__name': name, 'pending_qty': qty}
+        for name, qty in sorted(pending_qty.items(), key=lambda kv: -kv[1])
+    ]
+    return lanes, summary
+
+
+def current_cursor(scope):
+    return OrderChange.objects.filter(**scope).aggregate(cursor=Max('id'))['cursor'] or 0
+
+
+def pending_summary(scope):
+    start_of_day, end_of_day = today_range()
+    return list(
+        OrderItem.objects
+        .filter(
+            order__is_ready=False,
+            order__is_served=False,
+            order__created_at__gte=start_of_day,
+            order__created_at__lt=end_of_day,
+            **{f"order__{key}": value for key, value in scope.items()}
+        )
+        .values('smoothie__name')
+        .annotate(pending_qty=Sum('quantity'))
+        .order_by('-pending_qty')
+    )
+
+
+def board_changes(scope, cursor):
+    """
+    Return the board delta since `cursor`:
+    {'cursor', 'orders': [{id, lane, sort, html}], 'removed': [ids], 'pending_summary'}.
+
+    An unchanged board costs one indexed query on OrderChange(store, id).
+    """
+    changes = list(
+        OrderChange.objects
+        .filter(id__gt=cursor, **scope)
+        .order_by('id')
+        .values_list('id', 'order_id', 'created_at')
+    )
+    if not changes:
+        return {'cursor': cursor, 'orders': [], 'removed': [], 'pending_summary': None}
+
+    settled_before = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    new_cursor = cursor
+    for change_id, _, created_at in changes:
+        if created_at > settled_before:
+            break
+        new_cursor = change_id
+
+    order_ids = {order_id for _, order_id, _ in changes}
+    start_of_day, end_of_day = today_range()
+    orders = (
+        Order.objects
+        .filter(id__in=order_ids, created_at__gte=start_of_day, created_at__lt=end_of_day)
+        .prefetch_related('orderitem_set__smoothie')
+    )
+
+    payload = []
+    for order in orders:
+        lane = order_lane(order)
+        sort_key = {'pending': order.created_at, 'ready': order.ready_at, 'served': order.served_at}[lane]
+        payload.append({
+            'id': order.id,
+            'lane': lane,
+            'sort': int(sort_key.timestamp()) if sort_key else 0,
+            'html': render_to_string('sales/partials/order_row.html', {
+                'order': order,
+                'table_type': lane,
+            }),
+        })
+
+    seen = {row['id'] for row in payload}
+    return {
+        'cursor': new_cursor,
+        'orders': payload,
+        'removed': sorted(order_ids - seen),
+        'pending_summary': pending_summary(scope),
+    }
@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from inventory.models import SmoothieMenu
 from django.utils import timezone
 from customers.models import Customer
 from core.models import Store
+from core.data_versions import bump_data_version
+from core.events import publish_event
 
 
 class PaymentMethod(models.Model):
@@ -12,6 +15,35 @@ class PaymentMethod(models.Model):
     def __str__(self):
         return self.name
 
+def transition_rule(action):
+    """
+    (guard, new values) for an order state change. The guard is the state the
+    order must be in for the change to apply, so concurrent clicks can't
+    overwrite each other.
+    """
+    now = timezone.now()
+    rules = {
+        'ready': (Q(is_ready=False, is_served=False), {'is_ready': True, 'ready_at': now}),
+        'served': (Q(is_served=False), {'is_served': True, 'served_at': now}),
+        'pending': (Q(is_ready=True) | Q(is_served=True),
+                    {'is_ready': False, 'is_served': False, 'ready_at': None, 'served_at': None}),
+        'back_to_ready': (Q(is_served=True),
+                          {'is_ready': True, 'is_served': False, 'ready_at': now, 'served_at': None}),
+    }
+    return rules[action]
+
+
+TRANSITION_EVENTS = {'ready': 'order-ready', 'served': 'order-served'}
+
+# The state flags each action leads to; an order already there needs no change
+TRANSITION_STATES = {
+    'ready': {'is_ready': True, 'is_served': False},
+    'served': {'is_served': True},
+    'pending': {'is_ready': False, 'is_served': False},
+    'back_to_ready': {'is_ready': True, 'is_served': False},
+}
+
+
 class Order(models.Model):
 
     # PAYMENT_METHOD_CHOICES = [
@@ -35,24 +67,123 @@ class Order(models.Model):
     is_ready = models.BooleanField(default=False)
     is_served = models.BooleanField(default=False)
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    # default rather than auto_now_add so offline orders keep their own time
+    created_at = models.DateTimeField(default=timezone.now)
     ready_at = models.DateTimeField(null=True, blank=True)
     served_at = models.DateTimeField(null=True, blank=True)
 
     list_menu = models.ManyToManyField(SmoothieMenu, through='OrderItem')
 
+    # idempotency key sent by offline cashier tablets
+    client_key = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # per-store lists and dashboards filter on Jakarta days as datetime ranges
+            models.Index(fields=['store', 'created_at'], name='order_store_created_idx'),
+            models.Index(fields=['store', 'served_at'], name='order_store_served_idx'),
+        ]
+
     def mark_ready(self):
-        self.is_ready = True
-        self.ready_at = timezone.now()
-        self.save()
+        return self.transition('ready')
 
     def mark_served(self):
-        self.is_served = True
-        self.served_at = timezone.now()
-        self.save()
+        return self.transition('served')
+
+    def transition(self, action):
+        """Apply `action` with one guarded UPDATE; returns whether it applied."""
+        guard, values = transition_rule(action)
+        applied = Order.objects.filter(guard, pk=self.pk).update(**values) == 1
+        if applied:
+            for field, value in values.items():
+                setattr(self, field, value)
+            Order._after_transition(action, [(self.pk, self.store_id)])
+        return applied
+
+    @classmethod
+    def transition_by_id(cls, order_id, action, scope=None):
+        """
+        Like transition() without loading the order first. A store scope also
+        names the store for the event; only unscoped (admin) calls look it up.
+        """
+        guard, values = transition_rule(action)
+        scope = scope or {}
+        applied = cls.objects.filter(guard, pk=order_id, **scope).update(**values) == 1
+        if applied:
+            if 'store' in scope:
+                store_id = scope['store'].pk if scope['store'] else None
+            else:
+                store_id = cls.objects.filter(pk=order_id).values_list('store_id', flat=True).first()
+            cls._after_transition(action, [(order_id, store_id)])
+        return applied
+
+    @classmethod
+    def transition_many(cls, action, order_ids, scope=None):
+        """
+        Apply `action` to every eligible order in `order_ids` with one UPDATE.
+        Returns the ids it applied to.
+        """
+        guard, values = transition_rule(action)
+        with transaction.atomic():
+            eligible = list(
+                cls.objects.select_for_update()
+                .filter(guard, id__in=order_ids, **(scope or {}))
+                .values_list('id', 'store_id')
+            )
+            if eligible:
+                cls.objects.filter(id__in=[order_id for order_id, _ in eligible]).update(**values)
+                cls._after_transition(action, eligible)
+        return [order_id for order_id, _ in eligible]
+
+    @staticmethod
+    def _after_transition(action, orders):
+        # update() skips post_save, so log the board change here
+        OrderChange.objects.bulk_create([
+            OrderChange(store_id=store_id, order_id=order_id) for order_id, store_id in orders
+        ])
+        bump_data_version(*{store_id for _, store_id in orders})
+        for order_id, store_id in orders:
+            publish_event(store_id, TRANSITION_EVENTS.get(action, 'order-updated'), order=order_id)
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     smoothie = models.ForeignKey(SmoothieMenu, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    # price per cup when the order was placed; empty on older rows
+    unit_price = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'smoothie'], name='orderitem_order_smoothie_idx'),
+        ]
+
+
+
+class OrderChange(models.Model):
+    """
+    Append-only log of order board changes. Its id is the change cursor the
+    live board polls with; order_id is not a foreign key so deletions can be
+    recorded too.
+    """
+    KIND_CHOICES = [
+        ('saved', 'Saved'),
+        ('deleted', 'Deleted'),
+    ]
+
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='order_changes', null=True, blank=True)
+    order_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='saved')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['store', 'id']),
+        ]
 
+    @classmethod
+    def record(cls, orders, kind='saved'):
+        """Log a change for each order in one insert."""
+        return cls.objects.bulk_create([
+            cls(store_id=order.store_id, order_id=order.pk, kind=kind)
+            for order in orders
+        ])
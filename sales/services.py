@@ -0,0 +1,272 @@
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+import pytz
+from django.db import IntegrityError, transaction
+from django.db.models import IntegerField
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.data_versions import bump_data_version
+from core.events import publish_event
+from customers.models import Customer
+from inventory.models import SmoothieMenu
+from inventory.recipes import recipe_cache
+from inventory.stock import apply_stock_deltas, recipe_deltas, reserve_stock
+from .models import Order, OrderChange, OrderItem, PaymentMethod
+from .signals import order_lines_changed
+
+# One order line as seen by aggregate maintainers (see order_lines_changed)
+OrderLine = namedtuple('OrderLine', [
+    'order_id', 'store_id', 'created_at', 'payment_method_id', 'smoothie_id', 'quantity', 'revenue',
+])
+
+
+def _lines_for(order, cart):
+    return [
+        OrderLine(order.id, order.store_id, order.created_at, order.payment_method_id,
+                  smoothie.id, qty, int(qty * smoothie.price))
+        for smoothie, qty in cart
+    ]
+
+
+def _add_cart(cart, quantities):
+    """Add the cart's cups into `quantities` and return its total price."""
+    total_price = Decimal(0)
+    for smoothie, qty in cart:
+        quantities[smoothie.id] += qty
+        total_price += qty * smoothie.price
+    return int(total_price)
+
+
+def place_order(order, cart, check_stock=False):
+    """
+    Save `order` (unsaved, with name/customer/payment/store already set)
+    together with its items and stock deductions.
+
+    `cart` is a list of (SmoothieMenu, quantity) pairs. The number of queries
+    is fixed regardless of how many lines the cart has: one order insert,
+    one item bulk insert, one ledger bulk insert and one stock UPDATE.
+    Recipes come from the in-process recipe cache. With `check_stock` the
+    cart's combined need per ingredient is checked against the locked
+    balances first (one more query), raising InsufficientStock.
+    """
+    cart = [(smoothie, qty) for smoothie, qty in cart if qty > 0]
+    quantities = defaultdict(int)
+    order.total_price = _add_cart(cart, quantities)
+
+    recipes = recipe_cache.get_many(quantities)
+    deltas = recipe_deltas(recipes, quantities)
+
+    with transaction.atomic():
+        if check_stock:
+            reserve_stock(deltas)
+        order.save()
+
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, smoothie=smoothie, quantity=qty, unit_price=int(smoothie.price))
+            for smoothie, qty in cart
+        ])
+
+        apply_stock_deltas(deltas, 'sale_deduct')
+        order_lines_changed.send(sender=Order, lines=_lines_for(order, cart), sign=1)
+        publish_event(order.store_id, 'order-created', order=order.id)
+
+    return order
+
+
+def place_orders(batch):
+    """
+    Bulk version of place_order for a list of (order, cart) pairs: one insert
+    for all orders, one for all items and one ledger write/stock UPDATE for
+    the combined deductions. Orders keep whatever created_at they carry.
+    """
+    batch = [(order, [(s, qty) for s, qty in cart if qty > 0]) for order, cart in batch]
+    quantities = defaultdict(int)
+    for order, cart in batch:
+        order.total_price = _add_cart(cart, quantities)
+
+    recipes = recipe_cache.get_many(quantities)
+
+    with transaction.atomic():
+        orders = Order.objects.bulk_create([order for order, _ in batch])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, smoothie=smoothie, quantity=qty, unit_price=int(smoothie.price))
+            for order, cart in batch
+            for smoothie, qty in cart
+        ])
+        apply_stock_deltas(recipe_deltas(recipes, quantities), 'sale_deduct')
+        order_lines_changed.send(
+            sender=Order, lines=[line for order, cart in batch for line in _lines_for(order, cart)], sign=1,
+        )
+
+        # bulk_create skips post_save, so log the board changes here
+        OrderChange.record(orders)
+        bump_data_version(*{order.store_id for order in orders})
+        for order in orders:
+            publish_event(order.store_id, 'order-created', order=order.id)
+
+    return orders
+
+
+def ingest_orders(store, payload):
+    """
+    Validate and commit a batch of offline orders from a cashier tablet.
+
+    Each entry looks like {"key", "created_at", "name", "payment_method",
+    "customer", "items": [{"smoothie", "quantity"}]}. The key is the
+    tablet's idempotency key: keys already stored (or repeated in the
+    batch) are reported as duplicates and skipped, so a replayed queue is
+    harmless. Returns one result dict per entry, in order.
+    """
+    smoothies = {s.id: s for s in SmoothieMenu.objects.filter(stores=store)}
+    payment_methods = set(PaymentMethod.objects.filter(is_active=True).values_list('id', flat=True))
+    customer_ids = {entry['customer'] for entry in payload if isinstance(entry, dict) and _is_id(entry.get('customer'))}
+    customers = {c.id: c for c in Customer.objects.filter(id__in=customer_ids)}
+
+    results, batch, seen = [], [], set()
+    for entry in payload:
+        result, order, cart = _validate_ingest_entry(entry, store, smoothies, payment_methods, customers)
+        if order is not None:
+            if order.client_key in seen:
+                result.update(status='duplicate')
+                order = None
+            seen.add(result['key'])
+        results.append(result)
+        if order is not None:
+            batch.append((order, cart, result))
+
+    for attempt in range(2):
+        existing = dict(
+            Order.objects.filter(client_key__in=[order.client_key for order, _, _ in batch])
+            .values_list('client_key', 'id')
+        )
+        for order, _, result in batch:
+            if order.client_key in existing:
+                result.update(status='duplicate', order=existing[order.client_key])
+        fresh = [(order, cart, result) for order, cart, result in batch if order.client_key not in existing]
+
+        try:
+            placed = place_orders([(order, cart) for order, cart, _ in fresh])
+        except IntegrityError:
+            # another replay of the same queue won the race; recheck the keys
+            if attempt:
+                raise
+            continue
+        for order, (_, _, result) in zip(placed, fresh):
+            result.update(status='created', order=order.id)
+        break
+
+    return results
+
+
+def _is_id(value):
+    """True for a JSON integer usable as a primary key (lists, dicts and bools are not)."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _validate_ingest_entry(entry, store, smoothies, payment_methods, customers):
+    """Return (result, unsaved order or None, cart)."""
+    if not isinstance(entry, dict):
+        return {'key': None, 'status': 'invalid', 'errors': ['Entry must be an object.']}, None, []
+
+    key = entry.get('key')
+    result = {'key': key, 'status': 'invalid', 'order': None, 'errors': []}
+    errors = result['errors']
+
+    if not isinstance(key, str) or not key or len(key) > 64:
+        errors.append('key must be a non-empty string of at most 64 characters.')
+
+    created_at = parse_datetime(entry.get('created_at') or '') if isinstance(entry.get('created_at'), str) else None
+    if created_at is None:
+        errors.append('created_at must be an ISO 8601 datetime.')
+    elif timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at, pytz.timezone("Asia/Jakarta"))
+
+    payment_method = entry.get('payment_method')
+    if not _is_id(payment_method) or payment_method not in payment_methods:
+        errors.append('Unknown or inactive payment_method.')
+
+    customer = None
+    if entry.get('customer'):
+        customer = customers.get(entry['customer']) if _is_id(entry['customer']) else None
+        if customer is None:
+            errors.append('Unknown customer.')
+
+    cart = []
+    items = entry.get('items')
+    if not isinstance(items, list) or not items:
+        errors.append('items must be a non-empty list.')
+    else:
+        for item in items:
+            smoothie = smoothies.get(item['smoothie']) if isinstance(item, dict) and _is_id(item.get('smoothie')) else None
+            qty = item.get('quantity') if isinstance(item, dict) else None
+            if smoothie is None:
+                errors.append(f'Unknown smoothie in items: {item!r}.')
+            elif not isinstance(qty, int) or isinstance(qty, bool) or qty <= 0:
+                errors.append(f'quantity must be a positive integer for smoothie {smoothie.id}.')
+            else:
+                cart.append((smoothie, qty))
+
+    if errors:
+        return result, None, []
+
+    name = customer.name if customer else (str(entry.get('name') or '').strip() or 'Guest')
+    order = Order(
+        store=store,
+        client_key=key,
+        created_at=created_at,
+        name=name[:20],
+        customer=customer,
+        payment_method_id=payment_method,
+    )
+    return result, order, cart
+
+
+def cancel_orders(order_ids, scope=None):
+    """
+    Cancel many orders at once: restore their ingredients and delete them.
+
+    The order lines come from one query, recipes from the cache, and the
+    restoration is one ledger bulk insert plus one stock UPDATE.
+    `scope` (e.g. {"store": store}) limits which orders may be touched.
+    Returns the ids that were cancelled.
+    """
+    with transaction.atomic():
+        orders = Order.objects.filter(id__in=order_ids, **(scope or {}))
+        cancelled = list(orders.values_list('id', 'store_id'))
+        if not cancelled:
+            return []
+        ids = [order_id for order_id, _ in cancelled]
+
+        lines = [
+            OrderLine(*row[:6], row[5] * row[6])
+            for row in OrderItem.objects.filter(order_id__in=ids).values_list(
+                'order_id', 'order__store_id', 'order__created_at', 'order__payment_method_id',
+                'smoothie_id', 'quantity', Coalesce('unit_price', Cast('smoothie__price', IntegerField())),
+            )
+        ]
+        quantities = defaultdict(int)
+        for line in lines:
+            quantities[line.smoothie_id] += line.quantity
+
+        recipes = recipe_cache.get_many(quantities)
+        apply_stock_deltas(recipe_deltas(recipes, quantities, sign=1), 'sale_cancellation')
+        order_lines_changed.send(sender=Order, lines=lines, sign=-1)
+
+        OrderChange.objects.bulk_create([
+            OrderChange(store_id=store_id, order_id=order_id, kind='deleted')
+            for order_id, store_id in cancelled
+        ])
+        Order.objects.filter(id__in=ids).delete()
+        bump_data_version(*{store_id for _, store_id in cancelled})
+        for order_id, store_id in cancelled:
+            publish_event(store_id, 'order-updated', order=order_id)
+
+    return ids
+
+
+def cancel_order(order):
+    """Put the order's ingredients back on the shelf and delete it."""
+    cancel_orders([order.id])
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save
+from django.dispatch import Signal, receiver
+
+from core.data_versions import bump_data_version
+
+from .models import Order, OrderChange, OrderItem
+
+# Sent inside the write transaction when orders are placed (sign=1) or
+# cancelled (sign=-1). `lines` is a list of sales.services.OrderLine, so
+# receivers can maintain aggregates without re-reading the orders.
+order_lines_changed = Signal()
+
+
+@receiver(post_save, sender=Order)
+def log_order_saved(sender, instance, **kwargs):
+    OrderChange.record([instance], 'saved')
+    bump_data_version(instance.store_id)
+
+
+@receiver(post_save, sender=OrderItem)
+def bump_item_store_version(sender, instance, **kwargs):
+    bump_data_version(instance.order.store_id)
+
+
+# Deletions are logged (and data versions bumped) by
+# sales.services.cancel_orders in bulk; a post_delete receiver would stop
+# Order querysets from deleting in one statement.
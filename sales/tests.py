@@ -1,3 +1,388 @@
-from django.test import TestCase
+import json
+import time
+from datetime import datetime, timezone as dt_timezone
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import NoReverseMatch, reverse
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Store, User
+from inventory.models import Ingredient, SmoothieIngredient, SmoothieMenu, StockEntry
+from inventory.recipes import recipe_cache
+from .models import Order, PaymentMethod
+from .board import board_changes, current_cursor
+from .services import cancel_order, cancel_orders, place_order
+
+
+def make_menu(store, count, ingredients_per_smoothie=3):
+    """Create `count` smoothies, each with its own recipe lines."""
+    smoothies = []
+    for i in range(count):
+        smoothie = SmoothieMenu.objects.create(name=f"Smoothie {i}", price=15000)
+        smoothie.stores.add(store)
+        for j in range(ingredients_per_smoothie):
+            ingredient = Ingredient.objects.create(
+                store=store, name=f"Ing {i}-{j}", quantity_in_stock=1000,
+            )
+            SmoothieIngredient.objects.create(smoothie=smoothie, ingredient=ingredient, amount=10 + j)
+        smoothies.append(smoothie)
+    return smoothies
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Main")
+        self.cash = PaymentMethod.objects.create(name="Cash")
+        self.smoothies = make_menu(self.store, 8)
+
+    def new_order(self):
+        return Order(name="Guest", store=self.store, payment_method=self.cash)
+
+    def test_items_total_and_stock(self):
+        first, second = self.smoothies[:2]
+        order = place_order(self.new_order(), [(first, 2), (second, 1)])
+
+        self.assertEqual(order.total_price, 45000)
+        self.assertEqual(
+            sorted(order.orderitem_set.values_list('smoothie_id', 'quantity')),
+            sorted([(first.id, 2), (second.id, 1)]),
+        )
+        for si in SmoothieIngredient.objects.filter(smoothie=first):
+            si.ingredient.refresh_from_db()
+            self.assertEqual(si.ingredient.quantity_in_stock, 1000 - 2 * si.amount)
+        self.assertEqual(StockEntry.objects.filter(reason='sale_deduct').count(), 6)
+
+    def test_query_count_is_independent_of_cart_size(self):
+        """Benchmark: a 1-line and an 8-line cart cost the same number of queries."""
+        at = datetime(2025, 3, 1, 2, 30, tzinfo=dt_timezone.utc)
+        # warm the recipe cache and create the sales rollup rows for this hour
+        place_order(Order(name="Guest", store=self.store, payment_method=self.cash, created_at=at),
+                    [(smoothie, 1) for smoothie in self.smoothies])
+        counts = []
+        for size in (1, 8):
+            cart = [(smoothie, 2) for smoothie in self.smoothies[:size]]
+            order = Order(name="Guest", store=self.store, payment_method=self.cash, created_at=at)
+            with CaptureQueriesContext(connection) as ctx:
+                place_order(order, cart)
+            counts.append(len(ctx.captured_queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_cancel_restores_stock(self):
+        smoothie = self.smoothies[0]
+        order = place_order(self.new_order(), [(smoothie, 3)])
+        cancel_order(order)
+
+        self.assertFalse(Order.objects.filter(pk=order.pk).exists())
+        for si in SmoothieIngredient.objects.filter(smoothie=smoothie):
+            si.ingredient.refresh_from_db()
+            self.assertEqual(si.ingredient.quantity_in_stock, 1000)
+        self.assertEqual(StockEntry.objects.filter(reason='sale_cancellation').count(), 3)
+
+
+class OrderBoardChangesTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Main")
+        self.scope = {"store": self.store}
+        self.smoothie = make_menu(self.store, 1)[0]
+        self.order = place_order(Order(name="Guest", store=self.store), [(self.smoothie, 2)])
+
+    def test_unchanged_board_is_one_query(self):
+        cursor = current_cursor(self.scope)
+        with self.assertNumQueries(1):
+            delta = board_changes(self.scope, cursor)
+        self.assertEqual(delta['orders'], [])
+
+    def test_state_change_and_delete_are_reported(self):
+        cursor = current_cursor(self.scope)
+        self.order.mark_ready()
+        delta = board_changes(self.scope, cursor)
+        self.assertEqual([(row['id'], row['lane']) for row in delta['orders']], [(self.order.id, 'ready')])
+        self.assertIn(self.smoothie.name, delta['orders'][0]['html'])
+
+        order_id = self.order.id
+        cancel_order(self.order)
+        delta = board_changes(self.scope, cursor)
+        self.assertEqual(delta['orders'], [])
+        self.assertEqual(delta['removed'], [order_id])
+
+    def test_other_stores_are_not_visible(self):
+        other = Store.objects.create(name="Other")
+        cursor = current_cursor(self.scope)
+        place_order(Order(name="Guest", store=other), [(self.smoothie, 1)])
+        self.assertEqual(board_changes(self.scope, cursor)['orders'], [])
+
+
+class ViewOrderQueryTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Main")
+        self.smoothies = make_menu(self.store, 3, ingredients_per_smoothie=1)
+        user = User.objects.create_user("cashier", password="x", role="cashier", store=self.store)
+        self.client.force_login(user)
+
+    def board_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('view_order'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        place_order(Order(name="First", store=self.store), [(self.smoothies[0], 1)])
+        baseline = self.board_queries()
+
+        for i in range(10):
+            order = place_order(Order(name=f"Guest {i}", store=self.store), [(s, 1) for s in self.smoothies])
+            if i % 3 == 1:
+                order.mark_ready()
+            elif i % 3 == 2:
+                order.mark_served()
+
+        self.assertEqual(self.board_queries(), baseline)
+
+    def test_pending_summary_counts_only_pending(self):
+        place_order(Order(name="A", store=self.store), [(self.smoothies[0], 2)])
+        place_order(Order(name="B", store=self.store), [(self.smoothies[0], 1)]).mark_ready()
+
+        response = self.client.get(reverse('view_order'))
+        self.assertEqual(
+            response.context['pending_items_summary'],
+            [{'smoothie__name': self.smoothies[0].name, 'pending_qty': 2}],
+        )
+
+    @override_settings(ASGI_STREAMING=False)
+    def test_wsgi_board_polls_without_event_stream(self):
+        response = self.client.get(reverse('view_order'))
+        self.assertNotContains(response, "EventSource")
+        self.assertContains(response, reverse('order_board_changes'))
+        with self.assertRaises(NoReverseMatch):
+            reverse('order_events')
+
+
+class IngestOrdersTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Main")
+        self.cash = PaymentMethod.objects.create(name="Cash")
+        self.smoothies = make_menu(self.store, 3)
+        user = User.objects.create_user("tablet", password="x", role="cashier", store=self.store)
+        self.client.force_login(user)
+
+    def entry(self, key, **overrides):
+        entry = {
+            'key': key,
+            'created_at': '2025-07-24T12:30:00+07:00',
+            'name': 'Guest',
+            'payment_method': self.cash.id,
+            'items': [{'smoothie': self.smoothies[0].id, 'quantity': 2}],
+        }
+        entry.update(overrides)
+        return entry
+
+    def post(self, entries):
+        response = self.client.post(
+            reverse('ingest_orders'), json.dumps({'orders': entries}), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_batch_is_created_with_original_timestamps(self):
+        results = self.post([self.entry('a'), self.entry('b', created_at='2025-07-24T09:15:00')])
+
+        self.assertEqual([r['status'] for r in results], ['created', 'created'])
+        first = Order.objects.get(client_key='a')
+        self.assertEqual(first.created_at.isoformat(), '2025-07-24T05:30:00+00:00')
+        self.assertEqual(first.total_price, 30000)
+        self.assertEqual(Order.objects.get(client_key='b').created_at.hour, 2)  # naive = Jakarta time
+        self.assertEqual(StockEntry.objects.filter(reason='sale_deduct').count(), 3)
+
+    def test_replays_and_repeats_are_skipped(self):
+        created = self.post([self.entry('a')])[0]
+        results = self.post([self.entry('a'), self.entry('c'), self.entry('c')])
+
+        self.assertEqual(
+            [(r['status'], r['order']) for r in results[:1]], [('duplicate', created['order'])],
+        )
+        self.assertEqual([r['status'] for r in results[1:]], ['created', 'duplicate'])
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_invalid_entries_are_reported_and_others_kept(self):
+        results = self.post([
+            self.entry('ok'),
+            self.entry('bad', payment_method=999, items=[{'smoothie': 999, 'quantity': 1}]),
+        ])
+
+        self.assertEqual([r['status'] for r in results], ['created', 'invalid'])
+        self.assertEqual(len(results[1]['errors']), 2)
+        self.assertFalse(Order.objects.filter(client_key='bad').exists())
+
+    def test_non_scalar_ids_are_invalid_not_errors(self):
+        results = self.post([
+            self.entry('ok'),
+            self.entry('list-customer', customer=[1]),
+            self.entry('dict-payment', payment_method={'id': self.cash.id}),
+            self.entry('list-smoothie', items=[{'smoothie': [self.smoothies[0].id], 'quantity': 1}]),
+            self.entry('bool-payment', payment_method=True),
+        ])
+
+        self.assertEqual([r['status'] for r in results], ['created', 'invalid', 'invalid', 'invalid', 'invalid'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_large_queue_is_fast(self):
+        entries = [
+            self.entry(f'k{i}', items=[{'smoothie': s.id, 'quantity': 1} for s in self.smoothies])
+            for i in range(300)
+        ]
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as ctx:
+            results = self.post(entries)
+        elapsed = time.perf_counter() - started
+
+        self.assertTrue(all(r['status'] == 'created' for r in results))
+        self.assertLess(len(ctx.captured_queries), 40)  # bulk inserts, never one per order
+        self.assertLess(elapsed, 1.0)
+
+
+class CancelOrdersTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Main")
+        self.smoothies = make_menu(self.store, 4)
+
+    def place(self, store=None):
+        return place_order(Order(name="Guest", store=store or self.store), [(s, 1) for s in self.smoothies])
+
+    def test_stock_restored_and_orders_deleted(self):
+        orders = [self.place() for _ in range(5)]
+        cancelled = cancel_orders([o.id for o in orders])
+
+        self.assertEqual(sorted(cancelled), sorted(o.id for o in orders))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Ingredient.objects.exclude(quantity_in_stock=1000).exists())
+        # one restoration row per ingredient, not per order line
+        self.assertEqual(StockEntry.objects.filter(reason='sale_cancellation').count(), 12)
+
+    def test_query_count_is_independent_of_batch_size(self):
+        recipe_cache.get_many(s.id for s in self.smoothies)
+        counts = []
+        for size in (1, 10):
+            ids = [self.place().id for _ in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                cancel_orders(ids)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_scope_protects_other_stores(self):
+        other = self.place(store=Store.objects.create(name="Other"))
+        self.assertEqual(cancel_orders([other.id], {'store': self.store}), [])
+        self.assertTrue(Order.objects.filter(pk=other.pk).exists())
+
+
+class OrderListTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Main")
+        self.cash = PaymentMethod.objects.create(name="Cash")
+        user = User.objects.create_user("manager", password="x", role="manager", store=self.store)
+        self.client.force_login(user)
+
+    def make_orders(self, count, created_at):
+        return Order.objects.bulk_create([
+            Order(store=self.store, name=f"Guest {i}", total_price=1000, payment_method=self.cash, created_at=created_at)
+            for i in range(count)
+        ])
+
+    def test_keyset_pages_cover_everything_once(self):
+        # identical timestamps force the id tie-breaker to do its job
+        self.make_orders(120, datetime(2025, 7, 24, 5, 0, tzinfo=dt_timezone.utc))
+        seen, cursor = [], None
+        while True:
+            params = {'cursor': cursor} if cursor else {}
+            page = self.client.get(reverse('order_list'), params).context['page']
+            seen.extend(order.id for order in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(len(seen), 120)
+        self.assertEqual(len(set(seen)), 120)
+
+    def test_date_filter_uses_jakarta_days(self):
+        # 16:59 UTC is 23:59 in Jakarta; 17:00 UTC is already the next day
+        self.make_orders(1, datetime(2025, 7, 24, 16, 59, tzinfo=dt_timezone.utc))
+        self.make_orders(2, datetime(2025, 7, 24, 17, 0, tzinfo=dt_timezone.utc))
+
+        response = self.client.get(reverse('order_list'), {'start_date': '2025-07-24', 'end_date': '2025-07-24'})
+        self.assertEqual(len(response.context['page']), 1)
+        self.assertEqual(response.context['payment_totals'], [{'payment_method__name': 'Cash', 'total_amount': 1000}])
+
+    def test_streaming_exports(self):
+        self.make_orders(3, datetime(2025, 7, 24, 5, 0, tzinfo=dt_timezone.utc))
+
+        response = self.client.get(reverse('order_list'), {'export': 'csv'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn('2025-07-24T12:00:00+07:00', lines[1])
+
+        response = self.client.get(reverse('order_list'), {'export': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['payment_method'] for row in rows], ['Cash'] * 3)
+
+
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        self.store = Store.objects.create(name="Main")
+        self.smoothie = make_menu(self.store, 1, ingredients_per_smoothie=1)[0]
+        user = User.objects.create_user("kitchen", password="x", role="cashier", store=self.store)
+        self.client.force_login(user)
+
+    def place(self, store=None):
+        return place_order(Order(name="Guest", store=store or self.store), [(self.smoothie, 1)])
+
+    def test_transition_is_one_guarded_update(self):
+        order = self.place()
+        with self.assertNumQueries(1):
+            self.assertFalse(Order.transition_by_id(order.id, 'back_to_ready'))  # not served yet
+        self.assertTrue(order.mark_ready())
+        self.assertFalse(order.mark_ready())
+        # A scoped transition takes the event's store from the scope: the UPDATE plus the change log row
+        with self.assertNumQueries(2):
+            self.assertTrue(Order.transition_by_id(order.id, 'served', {'store': self.store}))
+
+        order.refresh_from_db()
+        self.assertTrue(order.is_ready and order.is_served)
+        self.assertIsNotNone(order.ready_at)
+
+    def test_stale_click_gets_conflict(self):
+        order = self.place()
+        self.assertEqual(self.client.post(reverse('mark_served', args=[order.id])).status_code, 204)
+        self.assertEqual(self.client.post(reverse('mark_ready', args=[order.id])).status_code, 409)
+        self.assertEqual(self.client.post(reverse('move_to_pending', args=[order.id])).status_code, 204)
+        self.assertEqual(self.client.post(reverse('mark_ready', args=[999])).status_code, 404)
+
+    def test_repeated_click_stays_idempotent(self):
+        order = self.place()
+        for name in ('move_to_pending', 'mark_ready', 'mark_ready', 'mark_served', 'mark_served'):
+            self.assertEqual(self.client.post(reverse(name, args=[order.id])).status_code, 204, name)
+        order.refresh_from_db()
+        self.assertTrue(order.is_served)
+
+    def test_bulk_ready_applies_only_to_eligible_orders(self):
+        pending = [self.place() for _ in range(3)]
+        served = self.place()
+        served.mark_served()
+        foreign = self.place(store=Store.objects.create(name="Other"))
+
+        response = self.client.post(
+            reverse('bulk_transition'),
+            json.dumps({'action': 'ready', 'order_ids': [o.id for o in pending] + [served.id, foreign.id]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(sorted(response.json()['applied']), sorted(o.id for o in pending))
+        self.assertEqual(Order.objects.filter(is_ready=True).count(), 3)
+
+    def test_bulk_rejects_unknown_action(self):
+        response = self.client.post(
+            reverse('bulk_transition'), json.dumps({'action': 'teleport', 'order_ids': [1]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
@@ -1,13 +1,21 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 urlpatterns = [
     path('', views.view_order, name='view_order'),
+    path('board/changes/', views.order_board_changes, name='order_board_changes'),
     path('order_list/', views.order_list, name='order_list'),
     path('create-order', views.create_order, name='create_order'),
+    path('orders/ingest/', views.ingest_orders_view, name='ingest_orders'),
     path('mark-ready/<int:order_id>/', views.mark_ready, name='mark_ready'),
     path('mark-served/<int:order_id>/', views.mark_served, name='mark_served'),
     path('move-to-pending/<int:order_id>/', views.move_to_pending, name='move_to_pending'),
     path('move-to-ready/<int:order_id>/', views.move_to_ready, name='move_to_ready'),
+    path('orders/transition/', views.bulk_transition, name='bulk_transition'),
     path('delete-order/<int:order_id>/', views.delete_order, name='delete_order'),
+    path('cancel-orders/', views.cancel_orders_view, name='cancel_orders'),
 ]
+
+if settings.ASGI_STREAMING:
+    urlpatterns.append(path('board/events/', views.order_events, name='order_events'))
@@ -1,117 +1,161 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from customers.models import Customer  # import at the top
+from django.conf import settings
 from django.db import transaction
 import pytz
-from datetime import datetime, time
 from django.db.models import Sum
+import json
+from asgiref.sync import sync_to_async
+from core.events import get_broker
+from core.pagination import keyset_page
+from core.streaming import export_response
+from core.utils import JAKARTA, filter_local_dates
 
 from django.utils.dateparse import parse_date
 
 
 
-from inventory.models import SmoothieMenu, SmoothieIngredient, StockEntry
+from inventory.availability import store_availability
+from inventory.models import SmoothieMenu
+from inventory.stock import InsufficientStock
 from .forms import OrderForm
-from .models import Order, OrderItem
+from .models import TRANSITION_STATES, Order, transition_rule
+from .services import cancel_order, cancel_orders, ingest_orders, place_order
+from .board import board_changes, build_board, current_cursor, store_scope
 
 from customers.utils import find_customer_by_phone, normalize_phone  # import helper
 
 @login_required
 def view_order(request):
-    # Get Jakarta timezone
-    jakarta_tz = pytz.timezone("Asia/Jakarta")
-    now_jakarta = timezone.now().astimezone(jakarta_tz)
-
-    # Start & end of today in Jakarta time
-    start_of_day = datetime.combine(now_jakarta.date(), time.min).replace(tzinfo=jakarta_tz)
-    end_of_day = datetime.combine(now_jakarta.date(), time.max).replace(tzinfo=jakarta_tz)
-    print(request.user.role)
-    # If user is Admin → do NOT filter by store
-    if request.user.role == "admin":
-        base_filter = {
-            "created_at__range": (start_of_day, end_of_day)
-        }
-    else:
-        base_filter = {
-            "store": request.user.store,
-            "created_at__range": (start_of_day, end_of_day)
-        }
-
-    pending_orders = Order.objects.filter(
-        is_ready=False,
-        is_served=False,
-        **base_filter
-    ).order_by('created_at')
-
-    ready_orders = Order.objects.filter(
-        is_ready=True,
-        is_served=False,
-        **base_filter
-    ).order_by('ready_at')
-
-    served_orders = Order.objects.filter(
-        is_served=True,
-        **base_filter
-    ).order_by('served_at')
-    # --- New: Aggregate pending quantities per menu ---
-    pending_items_summary = (
-        OrderItem.objects
-        .filter(order__in=pending_orders)
-        .values('smoothie__name')
-        .annotate(pending_qty=Sum('quantity'))
-        .order_by('-pending_qty')
-    )
+    scope = store_scope(request.user)
+    lanes, pending_items_summary = build_board(scope)
 
     return render(request, 'sales/orders.html', {
-        'pending_orders': pending_orders,
-        'ready_orders': ready_orders,
-        'served_orders': served_orders,
+        'pending_orders': lanes['pending'],
+        'ready_orders': lanes['ready'],
+        'served_orders': lanes['served'],
         'role': request.user.role,
         'pending_items_summary' : pending_items_summary,
+        'board_cursor': current_cursor(scope),
+        'live_events': settings.ASGI_STREAMING,
     })
 
 
+@login_required
+def order_board_changes(request):
+    """JSON delta of the live board since the client's ?cursor=."""
+    try:
+        cursor = int(request.GET.get('cursor', 0))
+    except (TypeError, ValueError):
+        cursor = 0
+    return JsonResponse(board_changes(store_scope(request.user), cursor))
+
+
+async def order_events(request):
+    """
+    Server-sent events for the live board: order-created, order-ready,
+    order-served and low-stock. Only routed when ASGI_STREAMING is on: under
+    WSGI the stream would be buffered and pin a worker per open board.
+    """
+    # login_required can't wrap async views on Django 4.2
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return redirect(f"{reverse('login')}?next={request.path}")
+
+    store_id = None if user.role == "admin" else user.store_id
+
+    async def stream():
+        yield "retry: 3000\n\n"
+        async for message in get_broker().subscribe(store_id, heartbeat=15):
+            if message is None:
+                yield ": keepalive\n\n"
+            else:
+                payload = dict(message['data'], store=message['store'])
+                yield f"event: {message['event']}\ndata: {json.dumps(payload)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+MAX_INGEST_BATCH = 1000
+
+
+@require_POST
+@login_required
+def ingest_orders_view(request):
+    """
+    Accept a queued batch of offline orders as JSON: {"orders": [...]}.
+    See sales.services.ingest_orders for the entry format.
+    """
+    try:
+        payload = json.loads(request.body or b'{}')
+        entries = payload['orders']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON body like {"orders": [...]}.'}, status=400)
+
+    if not isinstance(entries, list) or len(entries) > MAX_INGEST_BATCH:
+        return JsonResponse({'error': f'orders must be a list of at most {MAX_INGEST_BATCH} entries.'}, status=400)
+
+    results = ingest_orders(request.user.store, entries)
+    return JsonResponse({'results': results})
+
+
+def _transition_response(request, order_id, action):
+    if Order.transition_by_id(order_id, action, store_scope(request.user)):
+        return HttpResponse(status=204)
+    # Nothing changed: no such order, it is already there, or someone moved it elsewhere first
+    order = get_object_or_404(Order, id=order_id, **store_scope(request.user))
+    if all(getattr(order, field) == value for field, value in TRANSITION_STATES[action].items()):
+        return HttpResponse(status=204)  # repeated click: as idempotent as before
+    return HttpResponse(status=409)
+
+
 @require_POST
 @login_required
 def mark_ready(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    order.mark_ready()
-    return HttpResponse(status=204)
+    return _transition_response(request, order_id, 'ready')
 
 @require_POST
 @login_required
 def mark_served(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    order.mark_served()
-    return HttpResponse(status=204)
+    return _transition_response(request, order_id, 'served')
 
 @require_POST
 @login_required
 def move_to_pending(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    order.is_ready = False
-    order.is_served = False
-    order.ready_at = None
-    order.served_at = None
-    order.save()
-    return HttpResponse(status=204)
+    return _transition_response(request, order_id, 'pending')
 
 @require_POST
 @login_required
 def move_to_ready(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
-    jakarta_tz = pytz.timezone("Asia/Jakarta")
-    # now_jakarta = timezone.now().astimezone(jakarta_tz)
-    order.is_ready = True
-    order.is_served = False
-    order.ready_at = timezone.now().astimezone(jakarta_tz)
-    order.served_at = None
-    order.save()
-    return HttpResponse(status=204)
+    return _transition_response(request, order_id, 'back_to_ready')
+
+@require_POST
+@login_required
+def bulk_transition(request):
+    """Move many orders at once: JSON {"action": "ready", "order_ids": [...]}."""
+    try:
+        payload = json.loads(request.body or b'{}')
+        action = payload['action']
+        order_ids = [int(i) for i in payload['order_ids']]
+        transition_rule(action)
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected {"action": "ready|served|pending|back_to_ready", "order_ids": [...]}.'}, status=400)
+
+    applied = Order.transition_many(action, order_ids, store_scope(request.user))
+    return JsonResponse({'applied': applied})
+
+ORDER_LIST_PAGE_SIZE = 50
+EXPORT_CHUNK_SIZE = 2000
+
 
 @login_required
 def order_list(request):
@@ -120,26 +164,40 @@ def order_list(request):
     end_date_str = request.GET.get('end_date')
 
     orders = Order.objects.filter(store=request.user.store)
+    # Jakarta-local days as half-open created_at ranges (index friendly)
+    orders = filter_local_dates(
+        orders, 'created_at',
+        parse_date(start_date_str) if start_date_str else None,
+        parse_date(end_date_str) if end_date_str else None,
+    )
 
-    if start_date_str:
-        start_date = parse_date(start_date_str)
-        if start_date:
-            orders = orders.filter(created_at__date__gte=start_date)
-
-    if end_date_str:
-        end_date = parse_date(end_date_str)
-        if end_date:
-            orders = orders.filter(created_at__date__lte=end_date)
+    export = request.GET.get('export')
+    if export in ('csv', 'ndjson'):
+        rows = (
+            orders.order_by('created_at', 'id')
+            .values_list('id', 'created_at', 'name', 'customer__name', 'payment_method__name',
+                         'total_price', 'is_ready', 'is_served')
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        rows = ((pk, created.astimezone(JAKARTA).isoformat(), *rest) for pk, created, *rest in rows)
+        header = ['id', 'created_at', 'name', 'customer', 'payment_method', 'total_price', 'is_ready', 'is_served']
+        return export_response(export, 'orders', header, rows)
+
+    page = keyset_page(
+        orders.select_related('payment_method'), 'created_at',
+        cursor=request.GET.get('cursor'), per_page=ORDER_LIST_PAGE_SIZE,
+    )
 
-    # Calculate total price by payment method in filtered orders
-    payment_totals = (
-        orders.values('payment_method')
+    # Calculate total price by payment method in filtered orders (once)
+    payment_totals = list(
+        orders.values('payment_method__name')
         .annotate(total_amount=Sum('total_price'))
-        .order_by('payment_method')
+        .order_by('payment_method__name')
     )
 
     context = {
-        'orders': orders.order_by('-created_at'),
+        'orders': page,
+        'page': page,
         'payment_totals': payment_totals,
         'start_date': start_date_str or '',
         'end_date': end_date_str or '',
@@ -152,76 +210,39 @@ def order_list(request):
 def delete_order(request, order_id):
     order = get_object_or_404(Order, id=order_id)
 
-    with transaction.atomic():
-        for item in order.orderitem_set.all():
-            smoothie = item.smoothie
-            qty = item.quantity
-            smoothie_ingredients = SmoothieIngredient.objects.filter(smoothie=smoothie)
+    cancel_order(order)
 
-            for si in smoothie_ingredients:
-                total_restore = qty * si.amount
-                si.ingredient.quantity_in_stock += total_restore
-                si.ingredient.save()
+    return HttpResponse(status=204)
 
-                StockEntry.objects.create(
-                    ingredient=si.ingredient,
-                    quantity=total_restore,
-                    reason='sale_cancellation'
-                )
 
-        order.delete()
+@require_POST
+@login_required
+def cancel_orders_view(request):
+    """Bulk cancel: JSON body {"order_ids": [...]}; restores stock and deletes."""
+    try:
+        order_ids = [int(i) for i in json.loads(request.body or b'{}')['order_ids']]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON body like {"order_ids": [1, 2]}.'}, status=400)
 
-    return HttpResponse(status=204)
+    cancelled = cancel_orders(order_ids, store_scope(request.user))
+    return JsonResponse({'cancelled': cancelled})
 
 
 @login_required
 def create_order(request):
-    smoothies = SmoothieMenu.objects.filter(stores=request.user.store)
+    smoothies = list(SmoothieMenu.objects.filter(stores=request.user.store))
+    # Servable cups straight from the availability index: one query, no recipe math
+    availability = store_availability(request.user.store_id)
+    for smoothie in smoothies:
+        smoothie.servable = availability.get(smoothie.id)  # None: not limited (or not indexed yet)
+    cart_errors = []
     if request.method == 'POST':
         form = OrderForm(request.POST)
-        print("POST received:", request.POST)
-        print("Form errors:", form.errors)
         if form.is_valid():
-            print('order valid')
             order = form.save(commit=False)
 
-            customer_id = request.POST.get('selected_customer_id', '').strip()
-            new_phone = request.POST.get('new_phone', '').strip()
-            new_name = form.cleaned_data.get('name', '').strip()
-
-            # 1) If customer_id provided -> use it
-            selected_customer = None
-            if customer_id:
-                try:
-                    selected_customer = Customer.objects.get(pk=customer_id)
-                except Customer.DoesNotExist:
-                    selected_customer = None
-
-            # 2) else if new_phone provided -> find existing by normalized phone; if not found create new
-            elif new_phone:
-                existing = find_customer_by_phone(new_phone)
-                if existing:
-                    selected_customer = existing
-                else:
-                    # create new safely
-                    selected_customer = Customer.objects.create(name=new_name or new_phone, phone=new_phone)
-
-            # 3) else -> guest (no customer)
-            if selected_customer:
-                order.customer = selected_customer
-                order.name = selected_customer.name
-            else:
-                order.customer = None
-                order.name = new_name or 'Guest'
-
-            jakarta_tz = pytz.timezone("Asia/Jakarta")
-            order.created_at = timezone.now().astimezone(jakarta_tz)
-            order.store = request.user.store
-            order.total_price = 0
-            order.save()
-
-            # Build items + stock deductions
-            total_price = 0
+            # Check the cart against what the stock can make before touching customers
+            cart = []
             for smoothie in smoothies:
                 qty_raw = request.POST.get(f'smoothie_{smoothie.id}', 0)
                 try:
@@ -229,35 +250,64 @@ def create_order(request):
                 except (TypeError, ValueError):
                     qty = 0
                 if qty > 0:
-                    OrderItem.objects.create(order=order, smoothie=smoothie, quantity=qty)
-                    total_price += qty * float(smoothie.price)
-
-                    # Deduct ingredients
-                    smoothie_ingredients = SmoothieIngredient.objects.filter(smoothie=smoothie)
-                    for si in smoothie_ingredients:
-                        total_deduction = qty * si.amount
-                        ing = si.ingredient
-                        ing.quantity_in_stock = ing.quantity_in_stock - total_deduction
-                        ing.save()
-
-                        StockEntry.objects.create(
-                            ingredient=ing,
-                            quantity=-total_deduction,
-                            reason='sale_deduct'
-                        )
-
-            order.total_price = total_price
-            order.save()
-            print('ok order masuk')
-            return redirect('view_order')
+                    cart.append((smoothie, qty))
+
+            cart_errors = [
+                f"Only {smoothie.servable} cups of {smoothie.name} can be made with the current stock."
+                for smoothie, qty in cart
+                if smoothie.servable is not None and qty > smoothie.servable
+            ]
+            if not cart_errors:
+                try:
+                    # The customer is only kept if the stock check inside place_order passes
+                    with transaction.atomic():
+                        customer_id = request.POST.get('selected_customer_id', '').strip()
+                        new_phone = request.POST.get('new_phone', '').strip()
+                        new_name = form.cleaned_data.get('name', '').strip()
+
+                        # 1) If customer_id provided -> use it
+                        selected_customer = None
+                        if customer_id:
+                            try:
+                                selected_customer = Customer.objects.get(pk=customer_id)
+                            except Customer.DoesNotExist:
+                                selected_customer = None
+
+                        # 2) else if new_phone provided -> find existing by normalized phone; if not found create new
+                        elif new_phone:
+                            existing = find_customer_by_phone(new_phone)
+                            if existing:
+                                selected_customer = existing
+                            else:
+                                # create new safely
+                                selected_customer = Customer.objects.create(name=new_name or new_phone, phone=new_phone)
+
+                        # 3) else -> guest (no customer)
+                        if selected_customer:
+                            order.customer = selected_customer
+                            order.name = selected_customer.name
+                        else:
+                            order.customer = None
+                            order.name = new_name or 'Guest'
+
+                        jakarta_tz = pytz.timezone("Asia/Jakarta")
+                        order.created_at = timezone.now().astimezone(jakarta_tz)
+                        order.store = request.user.store
+
+                        place_order(order, cart, check_stock=True)
+                except InsufficientStock as e:
+                    # e.g. two smoothies sharing an ingredient, or a sale that landed meanwhile
+                    cart_errors = e.errors
+                else:
+                    return redirect('view_order')
     else:
-        print('order invalidd')
         form = OrderForm()
 
     customers = Customer.objects.all()
     return render(request, 'sales/create_order.html', {
         'form': form,
         'smoothies': smoothies,
+        'cart_errors': cart_errors,
         'customers': customers,
         'role': request.user.role,
     })
\ No newline at end of file
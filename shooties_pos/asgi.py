@@ -2,6 +2,9 @@
 ASGI config for shooties_pos project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn shooties_pos.asgi:application``)
+so the live board's event stream (``sales/board/events/``) can hold many idle
+connections without a thread each.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -149,6 +149,58 @@ MEDIA_ROOT = BASE_DIR / "media"
 # ---------------------------
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# ---------------------------
+# LIVE EVENTS
+# ---------------------------
+# LocalBroker is enough for one ASGI worker; use PostgresBroker when
+# running several worker processes against PostgreSQL.
+EVENT_BROKER = os.environ.get("EVENT_BROKER", "core.events.LocalBroker")
+# Only turn this on when the site is served by shooties_pos.asgi (uvicorn,
+# daphne...). Under WSGI (gunicorn, Vercel) a stream is buffered until it
+# ends and holds a worker per open board, so the board polls instead.
+ASGI_STREAMING = os.environ.get("ASGI_STREAMING", "False").lower() in ("true", "1", "yes")
+
+# ---------------------------
+# QUERY METRICS
+# ---------------------------
+# Opt-in per-view query/timing histograms (see core/metrics.py), served to
+# admins at /metrics/queries/. Only the sampled fraction of requests is measured.
+QUERY_METRICS = os.environ.get("QUERY_METRICS", "False").lower() in ("true", "1", "yes")
+QUERY_METRICS_SAMPLE_RATE = float(os.environ.get("QUERY_METRICS_SAMPLE_RATE", "0.05"))
+if QUERY_METRICS:
+    MIDDLEWARE.insert(0, "core.metrics.QueryMetricsMiddleware")
+
+# ---------------------------
+# ANALYTICS
+# ---------------------------
+# "rollup" reads the SQL sales rollup; "cube" keeps every order line in
+# NumPy arrays per process (needs numpy, falls back to the rollup without it).
+ANALYTICS_ENGINE = os.environ.get("ANALYTICS_ENGINE", "rollup")
+
+# Computed dashboard contexts, keyed by filters and per-store data version
+# (database counters, so writes in any worker invalidate them). Entries are
+# per process by default; set DASHBOARD_CACHE_DIR to share them between the
+# workers of one host through files.
+DASHBOARD_CACHE_MAX_ENTRIES = int(os.environ.get("DASHBOARD_CACHE_MAX_ENTRIES", "256"))
+DASHBOARD_CACHE_DIR = os.environ.get("DASHBOARD_CACHE_DIR")
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "dashboards": {
+        "BACKEND": (
+            "django.core.cache.backends.filebased.FileBasedCache" if DASHBOARD_CACHE_DIR
+            else "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": DASHBOARD_CACHE_DIR or "dashboards",
+        "OPTIONS": {"MAX_ENTRIES": DASHBOARD_CACHE_MAX_ENTRIES * 2},
+    },
+    # Query metrics of every worker meet here, so it has to be shared: a database
+    # table (created by `manage.py createcachetable`), not per-process memory.
+    "metrics": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "query_metrics_cache",
+    },
+}
+
 # ---------------------------
 # AUTH
 # ---------------------------
@@ -17,7 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
-from core.views import home, no_permission
+from core.views import home, no_permission, query_metrics
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -25,6 +25,7 @@ from django.conf.urls.static import static
 urlpatterns = [
     path('', home, name='home'),
     path('no-permission/', no_permission, name='no_permission'),
+    path('metrics/queries/', query_metrics, name='query_metrics'),
     path("admin/", admin.site.urls),
     path('login/', auth_views.LoginView.as_view(template_name='login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='login'), name='logout'),